@@ -8,6 +8,7 @@ import subprocess
 from typing import List
 
 from database import get_db, SystemSettings
+from config_output import write_config, file_hash, needs_reload, mark_applied
 
 logger = logging.getLogger(__name__)
 
@@ -31,13 +32,8 @@ deny=0.0.0.0/0.0.0.0
 def write_acl_config(ips: List[str]) -> bool:
     """Write acl.conf to the shared config directory."""
     try:
-        import os
-        os.makedirs(os.path.dirname(ACL_CONFIG_PATH), exist_ok=True)
-
-        with open(ACL_CONFIG_PATH, 'w') as f:
-            f.write(generate_acl_config(ips))
-
-        logger.info(f"ACL config written with {len(ips)} permitted IPs")
+        if write_config(ACL_CONFIG_PATH, generate_acl_config(ips), "acl_config.write_acl_config"):
+            logger.info(f"ACL config written with {len(ips)} permitted IPs")
         return True
     except Exception as e:
         logger.error(f"Failed to write ACL config: {e}")
@@ -50,8 +46,7 @@ def remove_acl_config() -> bool:
         import os
         if os.path.exists(ACL_CONFIG_PATH):
             # Write empty config (no deny/permit = allow all)
-            with open(ACL_CONFIG_PATH, 'w') as f:
-                f.write("; ACL disabled\n")
+            write_config(ACL_CONFIG_PATH, "; ACL disabled\n", "acl_config.remove_acl_config")
         logger.info("ACL config cleared (whitelist disabled)")
         return True
     except Exception as e:
@@ -61,15 +56,20 @@ def remove_acl_config() -> bool:
 
 def reload_acl() -> bool:
     """Reload ACL module in Asterisk container."""
+    digest = file_hash(ACL_CONFIG_PATH)
+    if not needs_reload(ACL_CONFIG_PATH):
+        logger.info("acl.conf already loaded, reload skipped")
+        return True
     try:
         result = subprocess.run(
             ['docker', 'exec', 'pbx_asterisk', 'sh', '-c',
-             'cp /etc/asterisk/custom/acl.conf /etc/asterisk/acl.conf 2>/dev/null; asterisk -rx "module reload res_acl"'],
+             '[ -L /etc/asterisk/acl.conf ] || cp /etc/asterisk/custom/acl.conf /etc/asterisk/acl.conf 2>/dev/null; asterisk -rx "module reload res_acl"'],
             capture_output=True,
             text=True,
             timeout=10
         )
         if result.returncode == 0:
+            mark_applied(ACL_CONFIG_PATH, digest)
             logger.info("Asterisk ACL reloaded successfully")
             return True
         else:
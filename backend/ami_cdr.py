@@ -0,0 +1,83 @@
+"""
+CDRs from Asterisk's own Cdr manager events
+With CDR_SOURCE=ami_cdr the cdr table is filled from the records Asterisk
+posts through cdr_manager (asterisk/config/cdr_manager.conf) instead of being
+rebuilt from DialBegin/DialEnd/Hangup: timings, disposition, dialplan
+context/application, accountcode and the linkedid come straight from Asterisk.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from database import CDR
+
+logger = logging.getLogger(__name__)
+
+# dial: build CDRs from Dial events (default) | ami_cdr: store Asterisk's Cdr events
+CDR_SOURCE = os.getenv("CDR_SOURCE", "dial")
+# Cdr event times are in Asterisk's local time (TZ of the asterisk container)
+ASTERISK_TZ = os.getenv("ASTERISK_TZ", "Europe/Berlin")
+
+AMA_FLAGS = {'OMIT': 1, 'BILLING': 2, 'DOCUMENTATION': 3}
+# VARCHAR lengths - one overlong value would fail the writer's whole batch
+COLUMN_LENGTHS = {c.name: c.type.length for c in CDR.__table__.columns if getattr(c.type, 'length', None)}
+
+try:
+    _asterisk_zone = ZoneInfo(ASTERISK_TZ)
+except ZoneInfoNotFoundError:
+    logger.warning(f"Unknown ASTERISK_TZ {ASTERISK_TZ}, treating Cdr times as UTC")
+    _asterisk_zone = timezone.utc
+
+
+def parse_cdr_time(value: str) -> Optional[datetime]:
+    """'2026-01-15 14:03:27' in Asterisk local time -> naive UTC like the rest of the cdr table"""
+    if not value:
+        return None
+    try:
+        local = datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=_asterisk_zone)
+    except ValueError:
+        return None
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _int(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def cdr_row_from_event(event) -> Dict[str, Any]:
+    """cdr table row of a Cdr manager event"""
+    amaflags = event.get('AMAFlags', '')
+    row = {
+        'call_date': parse_cdr_time(event.get('StartTime', '')) or datetime.utcnow(),
+        'clid': event.get('CallerID', ''),
+        'src': event.get('Source', ''),
+        'dst': event.get('Destination', ''),
+        'dcontext': event.get('DestinationContext', ''),
+        'channel': event.get('Channel', ''),
+        'dstchannel': event.get('DestinationChannel', ''),
+        'lastapp': event.get('LastApplication', ''),
+        'lastdata': event.get('LastData', ''),
+        'duration': _int(event.get('Duration')),
+        'billsec': _int(event.get('BillableSeconds')),
+        'disposition': event.get('Disposition', ''),
+        'amaflags': AMA_FLAGS.get(amaflags.upper(), _int(amaflags)),
+        'uniqueid': event.get('UniqueID', ''),
+        'userfield': event.get('UserField', ''),
+        'accountcode': event.get('AccountCode', ''),
+        # Added by the [mappings] section of cdr_manager.conf
+        'linkedid': event.get('LinkedID', '') or event.get('UniqueID', ''),
+    }
+    return fit_columns(row)
+
+
+def fit_columns(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Truncate string values to the VARCHAR length of their cdr column"""
+    for name, length in COLUMN_LENGTHS.items():
+        if isinstance(row.get(name), str):
+            row[name] = row[name][:length]
+    return row
@@ -5,15 +5,73 @@ Handles connection and communication with Asterisk
 import asyncio
 import logging
 import os
-from typing import Optional, Dict, Any
-from datetime import datetime
+import random
+from typing import Optional, Dict, Any, List, Set, Callable, Awaitable
+from datetime import datetime, timedelta
 from panoramisk import Manager
 
 logger = logging.getLogger(__name__)
 
-# Database import for CDR
-from database import SessionLocal, CDR
 from mqtt_client import mqtt_publisher
+from cdr_writer import cdr_writer
+from ami_cdr import CDR_SOURCE, cdr_row_from_event, fit_columns
+from event_queue import BoundedEventQueue
+from call_state import CallRecord, CallRegistry, CallDeltaLog, call_topics, channel_topics
+from endpoint_state import EndpointStateStore, endpoint_from_aor
+
+# Event pipeline sizing: reader -> event queue -> call tracking -> CDR writer / fan-out queue
+EVENT_QUEUE_SIZE = int(os.getenv("AMI_EVENT_QUEUE_SIZE", "10000"))
+EVENT_QUEUE_OVERFLOW = os.getenv("AMI_EVENT_OVERFLOW", "drop_oldest")
+FANOUT_QUEUE_SIZE = int(os.getenv("AMI_FANOUT_QUEUE_SIZE", "5000"))
+
+# Reconnect supervisor: exponential backoff with jitter, reset after a successful login
+RECONNECT_MIN_DELAY = float(os.getenv("AMI_RECONNECT_MIN_DELAY", "1"))
+RECONNECT_MAX_DELAY = float(os.getenv("AMI_RECONNECT_MAX_DELAY", "60"))
+LOGIN_TIMEOUT = float(os.getenv("AMI_LOGIN_TIMEOUT", "10"))
+
+# active_calls housekeeping: reconcile against CoreShowChannels and cap the map size
+RECONCILE_INTERVAL = float(os.getenv("AMI_RECONCILE_INTERVAL", "60"))
+MAX_ACTIVE_CALLS = int(os.getenv("AMI_MAX_ACTIVE_CALLS", "5000"))
+
+# Call deltas kept for WebSocket clients resuming after a reconnect
+CALL_DELTA_HISTORY = int(os.getenv("WS_DELTA_HISTORY", "1000"))
+
+# Events that are logged and broadcast to WebSocket clients
+BROADCAST_EVENTS = ['PeerStatus', 'Registry', 'Newchannel', 'Hangup', 'NewCallerid', 'DialBegin', 'DialEnd']
+
+# WebSocket event class per broadcast event, used for client subscriptions
+EVENT_CLASSES = {
+    'PeerStatus': 'peers',
+    'Registry': 'trunks',
+    'Newchannel': 'channels',
+    'NewCallerid': 'channels',
+}
+
+# Used by panoramisk itself to flush actions queued before Asterisk was fully booted
+INTERNAL_EVENTS = ['FullyBooted']
+
+EventHandler = Callable[[Any], Awaitable[None]]
+
+
+class SupervisedManager(Manager):
+    """panoramisk Manager without its built-in reconnect.
+    panoramisk schedules its own connect() on every failure, which would run
+    in parallel to our supervisor; reconnecting is left to AsteriskAMIClient."""
+
+    def connection_made(self, f):
+        if f.cancelled() or f.exception() is not None:
+            self._connected = False
+            return
+        super().connection_made(f)
+
+    def connection_lost(self, exc):
+        self._connected = False
+        self.authenticated = False
+        self.log.error('Connection lost')
+        self.loop.call_soon(self.on_disconnect, self, exc)
+        if self.pinger:
+            self.pinger.cancel()
+            self.pinger = None
 
 
 class AsteriskAMIClient:
@@ -26,9 +84,61 @@ class AsteriskAMIClient:
         self.manager: Optional[Manager] = None
         self.connected = False
         self.broadcast_callback = None
+        # Resyncs WebSocket clients and follower workers after call deltas were lost
+        self.resync_callback: Optional[Callable[[], None]] = None
         
         # Track active calls - key is Linkedid (unique per call)
-        self.active_calls: Dict[str, Dict[str, Any]] = {}
+        # Every change becomes a sequence-numbered delta for WebSocket clients
+        self.call_deltas = CallDeltaLog(CALL_DELTA_HISTORY)
+        self._pending_deltas: List[Dict[str, Any]] = []
+        self.active_calls = CallRegistry(listener=self._record_delta)
+
+        # PJSIP endpoint/contact state for the dashboard, kept current from events
+        self.endpoint_states = EndpointStateStore()
+
+        # Staged event pipeline: the AMI read callback only enqueues,
+        # dedicated workers do call tracking and fan-out, CDRs go to the batched cdr_writer
+        self.event_queue = BoundedEventQueue("ami_events", EVENT_QUEUE_SIZE, EVENT_QUEUE_OVERFLOW)
+        # Call deltas are incremental: when one is dropped on overflow the
+        # receivers are resynced from a snapshot instead (_on_fanout_drop)
+        self.fanout_queue = BoundedEventQueue("fanout", FANOUT_QUEUE_SIZE, "drop_oldest", on_drop=self._on_fanout_drop)
+        self._deltas_lost = False
+        self.deltas_dropped = 0
+        self._workers: Dict[str, asyncio.Task] = {}
+        self.events_received = 0
+        self.events_processed = 0
+        self.worker_errors = 0
+
+        # Handlers per AMI event name. The registered names also drive the
+        # server-side event filter, so Asterisk only sends what we use.
+        self._handlers: Dict[str, List[EventHandler]] = {}
+        self.filters_installed = False
+
+        # Reconnect supervisor state
+        self._stopping = False
+        self._logged_in = asyncio.Event()
+        self._session_ended = asyncio.Event()
+        self.reconnects = 0
+        self.last_resync: Optional[datetime] = None
+        self.resync_removed = 0
+
+        # Reconciler state: a call must be missing from Asterisk in two
+        # consecutive runs before it is expired, so a Hangup still waiting in
+        # the event queue is not mistaken for a leak
+        self._orphan_candidates: set = set()
+        self.reconcile_runs = 0
+        self.last_reconcile: Optional[datetime] = None
+        self.calls_expired = 0
+        self.calls_evicted = 0
+        self.register_handler('DialBegin', self.handle_dial_begin)
+        self.register_handler('DialEnd', self.handle_dial_end)
+        self.register_handler('Hangup', self.handle_hangup)
+        if CDR_SOURCE == 'ami_cdr':
+            self.register_handler('Cdr', self.handle_cdr)
+        self.register_handler('PeerStatus', self.handle_peer_status)
+        self.register_handler('Registry', self.handle_registry)
+        self.register_handler('DeviceStateChange', self.handle_device_state_change)
+        self.register_handler('ContactStatus', self.handle_contact_status)
         
         logger.info(f"AMI Client initialized for {self.host}:{self.port}")
 
@@ -36,83 +146,385 @@ class AsteriskAMIClient:
         """Set callback function for broadcasting events"""
         self.broadcast_callback = callback
 
+    def register_handler(self, event_name: str, handler: EventHandler):
+        """Register an async handler for one AMI event name.
+        Takes effect for the event filter on the next login."""
+        self._handlers.setdefault(event_name, []).append(handler)
+        if self.manager and len(self._handlers[event_name]) == 1:
+            self.manager.register_event(event_name, self.enqueue_event)
+
+    def subscribed_events(self) -> List[str]:
+        """All AMI event names the backend consumes"""
+        return sorted(set(self._handlers) | set(BROADCAST_EVENTS) | set(INTERNAL_EVENTS))
+
+    async def install_event_filters(self):
+        """Install AMI Filter actions so Asterisk only sends subscribed events.
+        Filters are per session and must be re-installed after every login."""
+        self.filters_installed = False
+        try:
+            for event_name in self.subscribed_events():
+                # Filters are regexes matched against the event text; a name that is
+                # a prefix of another event (Hangup/HangupRequest) lets both through,
+                # the extra one is simply not dispatched.
+                response = await self.manager.send_action({
+                    'Action': 'Filter',
+                    'Operation': 'Add',
+                    'Filter': f'Event: {event_name}',
+                })
+                if response and response.get('Response') == 'Error':
+                    raise Exception(response.get('Message', 'Filter action rejected'))
+            self.filters_installed = True
+            logger.info(f"AMI event filter installed for {len(self.subscribed_events())} events")
+        except Exception as e:
+            # Without filters Asterisk sends everything; unhandled events are
+            # still dropped by the per-event registration, just later
+            logger.warning(f"Could not install AMI event filter: {e}")
+
+    def _on_login(self, manager):
+        if manager is self.manager:
+            self._logged_in.set()
+
+    def _on_disconnect(self, manager, exc):
+        if manager is self.manager:
+            self._session_ended.set()
+
+    def start_workers(self):
+        """Start the pipeline worker tasks (idempotent)"""
+        workers = {
+            'call_tracking': self._call_tracking_worker,
+            'fanout': self._fanout_worker,
+            'reconciler': self._reconcile_worker,
+        }
+        for name, worker in workers.items():
+            task = self._workers.get(name)
+            if task is None or task.done():
+                self._workers[name] = asyncio.create_task(worker(), name=f"ami-{name}")
+
+    async def stop_workers(self):
+        """Cancel the pipeline worker tasks"""
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+
     async def connect(self):
-        """Connect to Asterisk AMI"""
+        """Connect to Asterisk AMI and stay connected.
+        Runs until disconnect(): every lost or failed session is retried with
+        jittered exponential backoff."""
+        self.start_workers()
+        self._stopping = False
+        attempt = 0
+
+        while not self._stopping:
+            try:
+                await self._run_session()
+                attempt = 0
+            except Exception as e:
+                logger.error(f"✗ Failed to connect to Asterisk AMI: {e}")
+            finally:
+                self.connected = False
+                if self.manager:
+                    self.manager.close()
+
+            if self._stopping:
+                break
+
+            # Full jitter keeps several backends from reconnecting in lockstep
+            delay = random.uniform(RECONNECT_MIN_DELAY, min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** attempt))
+            attempt += 1
+            self.reconnects += 1
+            logger.info(f"Reconnecting to Asterisk AMI in {delay:.1f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    async def _run_session(self):
+        """One AMI session: connect, log in, resync, then wait until it ends"""
+        logger.info(f"Connecting to Asterisk AMI at {self.host}:{self.port}...")
+        self._logged_in.clear()
+        self._session_ended.clear()
+
+        self.manager = SupervisedManager(
+            host=self.host,
+            port=self.port,
+            username=self.username,
+            secret=self.password,
+            ping_delay=10,
+            ping_attempts=3,
+            on_login=self._on_login,
+            on_disconnect=self._on_disconnect,
+        )
+
+        # Register the event reader per event name - it only enqueues,
+        # processing happens in the workers
+        for event_name in self.subscribed_events():
+            if event_name not in INTERNAL_EVENTS:
+                self.manager.register_event(event_name, self.enqueue_event)
+
+        await self.manager.connect()
+
+        login = asyncio.ensure_future(self._logged_in.wait())
+        ended = asyncio.ensure_future(self._session_ended.wait())
         try:
-            logger.info(f"Connecting to Asterisk AMI at {self.host}:{self.port}...")
-            
-            self.manager = Manager(
-                host=self.host,
-                port=self.port,
-                username=self.username,
-                secret=self.password,
-                ping_delay=10,
-                ping_attempts=3
-            )
-            
-            await self.manager.connect()
-            self.connected = True
-            
-            logger.info("✓ Successfully connected to Asterisk AMI")
-            
-            # Register event handlers
-            self.manager.register_event('*', self.handle_event)
+            await asyncio.wait({login, ended}, timeout=LOGIN_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            login.cancel()
+            ended.cancel()
+        if not self._logged_in.is_set():
+            raise Exception("AMI login failed or timed out")
 
-            # Keep connection alive
-            while self.connected:
-                await asyncio.sleep(1)
-                
+        self.connected = True
+        logger.info("✓ Successfully connected to Asterisk AMI")
+
+        await self.install_event_filters()
+        try:
+            await self.resync_active_calls()
         except Exception as e:
-            logger.error(f"✗ Failed to connect to Asterisk AMI: {e}")
-            self.connected = False
-            
-            # Retry connection after 5 seconds
-            await asyncio.sleep(5)
-            await self.connect()
+            logger.error(f"Active call resync failed: {e}")
+        try:
+            await self.seed_endpoint_states()
+        except Exception as e:
+            logger.error(f"Endpoint state seeding failed: {e}")
+
+        await self._session_ended.wait()
+        logger.warning("AMI session ended")
 
     async def disconnect(self):
         """Disconnect from Asterisk AMI"""
+        self._stopping = True
+        self._session_ended.set()
         if self.manager:
-            self.manager.close() if self.manager else None
+            self.manager.close()
             self.connected = False
             logger.info("Disconnected from Asterisk AMI")
+        await self.stop_workers()
+
+    def enqueue_event(self, manager, event):
+        """AMI read callback - must never block, only hands the event to the pipeline"""
+        self.events_received += 1
+        self.event_queue.put_nowait(event)
+
+    async def _call_tracking_worker(self):
+        """Stage 1: apply events to call state in arrival order"""
+        while True:
+            event = await self.event_queue.get()
+            try:
+                await self.handle_event(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.worker_errors += 1
+                logger.error(f"Error handling AMI event {event.get('Event', 'Unknown')}: {e}", exc_info=True)
+            self.events_processed += 1
+
+    async def _fanout_worker(self):
+        """Stage 2: MQTT publishes and WebSocket broadcasts"""
+        while True:
+            kind, payload = await self.fanout_queue.get()
+            try:
+                if self._deltas_lost:
+                    self._deltas_lost = False
+                    if self.resync_callback:
+                        self.resync_callback()
+                if kind == 'mqtt':
+                    payload()
+                elif kind == 'broadcast' and self.broadcast_callback:
+                    message, topics = payload
+                    await self.broadcast_callback(message, topics)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.worker_errors += 1
+                logger.error(f"Fan-out error ({kind}): {e}")
+
+    async def _reconcile_worker(self):
+        """Stage 3: periodically expire calls whose Hangup was missed"""
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL)
+            if not self.connected:
+                continue
+            try:
+                await self.reconcile_active_calls()
+                # Also picks up endpoints added or removed by a PJSIP reload
+                await self.seed_endpoint_states()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.worker_errors += 1
+                logger.error(f"Active call reconciliation failed: {e}")
+
+    async def reconcile_active_calls(self):
+        """Diff active_calls against CoreShowChannels and expire orphaned entries"""
+        snapshot_time = datetime.utcnow()
+        channels = await self._list_action('CoreShowChannels', 'CoreShowChannel')
+        live = {c.get('Linkedid') or c.get('Uniqueid', '') for c in channels}
+        live_channels = {c.get('Channel') for c in channels if c.get('Channel')}
+
+        # Calls created after the snapshot was requested cannot be judged yet
+        missing = {
+            call.id for call in self.active_calls.values()
+            if not self.is_live(call, live, live_channels) and call.start_time < snapshot_time
+        }
+        expired = missing & self._orphan_candidates
+        self._orphan_candidates = missing - expired
+
+        for linkedid in expired:
+            self.finish_call(linkedid, disposition='LOST')
+        self.calls_expired += len(expired)
+        self._flush_deltas('Reconcile')
+        self.reconcile_runs += 1
+        self.last_reconcile = snapshot_time
+        if expired:
+            logger.warning(f"🧹 Expired {len(expired)} orphaned call(s) without Hangup ({self.calls_expired} total)")
+
+    def _enforce_call_cap(self):
+        """Evict the oldest tracked calls when the map exceeds MAX_ACTIVE_CALLS"""
+        while len(self.active_calls) > MAX_ACTIVE_CALLS:
+            # dicts keep insertion order, the first entry is the oldest call
+            self.finish_call(self.active_calls.oldest().id, disposition='LOST')
+            self.calls_evicted += 1
+            if self.calls_evicted == 1 or self.calls_evicted % 100 == 0:
+                logger.error(f"active_calls over limit ({MAX_ACTIVE_CALLS}), {self.calls_evicted} calls evicted so far")
+
+    def _publish(self, publish_fn, *args):
+        """Queue an MQTT publish for the fan-out worker"""
+        self.fanout_queue.put_nowait(('mqtt', lambda: publish_fn(*args)))
 
-    async def handle_event(self, manager, event):
-        """Handle all Asterisk events"""
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """Queue depths, drop counters and worker state for sizing the pipeline"""
+        return {
+            'connected': self.connected,
+            'events_received': self.events_received,
+            'events_processed': self.events_processed,
+            'worker_errors': self.worker_errors,
+            'filters_installed': self.filters_installed,
+            'reconnects': self.reconnects,
+            'last_resync': self.last_resync.isoformat() if self.last_resync else None,
+            'resync_removed': self.resync_removed,
+            'reconcile_runs': self.reconcile_runs,
+            'last_reconcile': self.last_reconcile.isoformat() if self.last_reconcile else None,
+            'calls_expired': self.calls_expired,
+            'calls_evicted': self.calls_evicted,
+            'max_active_calls': MAX_ACTIVE_CALLS,
+            'cdr_source': CDR_SOURCE,
+            'subscribed_events': self.subscribed_events(),
+            'active_calls': len(self.active_calls),
+            'call_deltas': self.call_deltas.stats(),
+            'deltas_dropped': self.deltas_dropped,
+            'endpoint_states': self.endpoint_states.stats(),
+            'queues': [q.stats() for q in (self.event_queue, self.fanout_queue)],
+            'workers': {name: not task.done() for name, task in self._workers.items()},
+        }
+
+    async def handle_event(self, event):
+        """Dispatch an event to the handlers registered for its name"""
         event_name = event.get('Event', 'Unknown')
-        
-        # Track call events
-        if event_name == 'DialBegin':
-            await self.handle_dial_begin(event)
-        elif event_name == 'DialEnd':
-            await self.handle_dial_end(event)
-        elif event_name == 'Hangup':
-            await self.handle_hangup(event)
-        
-        # Publish peer/trunk status changes via MQTT
-        if event_name == 'PeerStatus':
-            peer = event.get('Peer', '')  # e.g. "PJSIP/1001"
-            status = event.get('PeerStatus', '')
-            ext = peer.split('/')[-1] if '/' in peer else peer
-            mqtt_status = 'online' if status == 'Reachable' else 'offline'
-            mqtt_publisher.publish_extension_status(ext, mqtt_status)
-        elif event_name == 'Registry':
-            trunk_name = event.get('Username', '') or event.get('Domain', '')
-            reg_status = event.get('Status', '')
-            mqtt_status = 'registered' if reg_status == 'Registered' else 'unregistered'
-            mqtt_publisher.publish_trunk_status(trunk_name, mqtt_status)
+
+        for handler in self._handlers.get(event_name, ()):
+            await handler(event)
 
         # Log important events
-        if event_name in ['PeerStatus', 'Registry', 'Newchannel', 'Hangup', 'NewCallerid', 'DialBegin', 'DialEnd']:
+        if event_name in BROADCAST_EVENTS:
             logger.info(f"AMI Event: {event_name}")
 
-            # Broadcast to WebSocket clients
-            if self.broadcast_callback:
-                await self.broadcast_callback({
-                    'type': 'ami_event',
+        # Broadcast only what changed; events without call changes are a bare notification
+        if not self._flush_deltas(event_name) and event_name in BROADCAST_EVENTS and self.broadcast_callback:
+            self.fanout_queue.put_nowait(('broadcast', ({
+                'type': 'ami_event',
+                'event_name': event_name,
+            }, self.event_topics(event))))
+
+    @staticmethod
+    def event_topics(event) -> Dict[str, Any]:
+        """Subscription topics of a bare AMI event notification"""
+        event_name = event.get('Event', '')
+        topics = channel_topics(
+            (event.get('Channel', ''), event.get('Peer', ''), event.get('DestChannel', '')),
+            (event.get('CallerIDNum', ''),),
+        )
+        topics['event'] = EVENT_CLASSES.get(event_name, 'calls')
+        return topics
+
+    def _on_fanout_drop(self, item):
+        kind, payload = item
+        if kind == 'broadcast' and payload[0].get('type') == 'call_delta':
+            self.deltas_dropped += 1
+            self._deltas_lost = True
+
+    def _record_delta(self, op: str, call: CallRecord):
+        """CallRegistry listener - collects the deltas of the current event"""
+        self._pending_deltas.append(self.call_deltas.append(op, call))
+
+    def _flush_deltas(self, event_name: str) -> bool:
+        """Broadcast the collected deltas. Returns False if there were none.
+        One message per delta, so each can be routed to its subscribers;
+        the WebSocket manager batches them into one frame again."""
+        if not self._pending_deltas:
+            return False
+        deltas, self._pending_deltas = self._pending_deltas, []
+        if self.broadcast_callback:
+            for delta in deltas:
+                self.fanout_queue.put_nowait(('broadcast', ({
+                    'type': 'call_delta',
+                    'epoch': self.call_deltas.epoch,
                     'event_name': event_name,
-                    'active_calls': list(self.active_calls.values())
-                })
+                    'deltas': [delta],
+                }, call_topics(delta['call']))))
+        return True
+
+    def call_snapshot(self) -> Dict[str, Any]:
+        """All active calls plus the sequence number they correspond to"""
+        return {
+            'type': 'snapshot',
+            'epoch': self.call_deltas.epoch,
+            'seq': self.call_deltas.seq,
+            'active_calls': [call.to_dict() for call in self.active_calls.values()],
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+
+    def resume(self, epoch: Optional[str], last_seq: int) -> Dict[str, Any]:
+        """Deltas a client missed since last_seq, or a snapshot if they are gone"""
+        deltas = self.call_deltas.since(epoch, last_seq)
+        if deltas is None:
+            return self.call_snapshot()
+        return {
+            'type': 'call_delta',
+            'epoch': self.call_deltas.epoch,
+            'event_name': 'Resume',
+            'deltas': deltas,
+        }
+
+    async def handle_peer_status(self, event):
+        """Publish peer status changes via MQTT"""
+        peer = event.get('Peer', '')  # e.g. "PJSIP/1001"
+        status = event.get('PeerStatus', '')
+        ext = peer.split('/')[-1] if '/' in peer else peer
+        mqtt_status = 'online' if status == 'Reachable' else 'offline'
+        self.endpoint_states.apply_peer_status(peer, status)
+        self._publish(mqtt_publisher.publish_extension_status, ext, mqtt_status)
+
+    async def handle_registry(self, event):
+        """Publish trunk registration changes via MQTT"""
+        trunk_name = event.get('Username', '') or event.get('Domain', '')
+        reg_status = event.get('Status', '')
+        mqtt_status = 'registered' if reg_status == 'Registered' else 'unregistered'
+        self._publish(mqtt_publisher.publish_trunk_status, trunk_name, mqtt_status)
+
+    async def handle_device_state_change(self, event):
+        """Track endpoint device state (idle, in use, unavailable, ...)"""
+        self.endpoint_states.apply_device_state(event.get('Device', ''), event.get('State', ''))
+
+    async def handle_contact_status(self, event):
+        """Track contact reachability and RTT from qualify results"""
+        endpoint = event.get('EndpointName', '') or endpoint_from_aor(event.get('AOR', ''))
+        self.endpoint_states.apply_contact_status(
+            endpoint, event.get('ContactStatus', ''), event.get('RoundtripUsec')
+        )
+
+    async def seed_endpoint_states(self):
+        """Load all endpoints and contacts with two list actions"""
+        endpoints = await self._list_action('PJSIPShowEndpoints', 'EndpointList')
+        contacts = await self._list_action('PJSIPShowContacts', 'ContactList')
+        self.endpoint_states.seed(endpoints, contacts)
+        logger.info(f"Endpoint states seeded: {len(endpoints)} endpoints, {len(contacts)} contacts")
 
     async def handle_dial_begin(self, event):
         """Handle dial begin - this is when a call starts"""
@@ -125,103 +537,216 @@ class AsteriskAMIClient:
         dest_channel = event.get('DestChannel', '')
         
         if linkedid:
-            self.active_calls[linkedid] = {
-                'id': linkedid,
-                'channel': channel,
-                'dest_channel': dest_channel,
-                'caller': caller,
-                'caller_name': caller_name,
-                'destination': destination,
-                'dest_name': dest_name,
-                'state': 'ringing',
-                'start_time': datetime.utcnow(),
-                'answer_time': None
-            }
+            self.active_calls.add(CallRecord(
+                id=linkedid,
+                channel=channel,
+                dest_channel=dest_channel,
+                caller=caller,
+                caller_name=caller_name,
+                destination=destination,
+                dest_name=dest_name,
+            ))
+            self._enforce_call_cap()
             logger.info(f"📞 Call started: {caller} -> {destination} (ID: {linkedid})")
-            mqtt_publisher.publish_call_started(caller, destination)
+            self._publish(mqtt_publisher.publish_call_started, caller, destination)
 
     async def handle_dial_end(self, event):
         """Handle dial end - call answered or failed"""
-        linkedid = event.get('Linkedid', '')
         dial_status = event.get('DialStatus', '')
         
-        if linkedid in self.active_calls:
+        call = self.find_call(event)
+        if call:
+            linkedid = call.id
             if dial_status == 'ANSWER':
-                self.active_calls[linkedid]['state'] = 'connected'
-                self.active_calls[linkedid]['answer_time'] = datetime.utcnow()
+                call.state = 'connected'
+                call.answer_time = datetime.utcnow()
+                self.active_calls.touch(call)
                 logger.info(f"✅ Call answered: {linkedid}")
-                call = self.active_calls[linkedid]
-                mqtt_publisher.publish_call_answered(call['caller'], call['destination'])
+                self._publish(mqtt_publisher.publish_call_answered, call.caller, call.destination)
             else:
-                self.active_calls[linkedid]['state'] = dial_status.lower()
+                call.state = dial_status.lower()
+                self.active_calls.touch(call)
                 logger.info(f"❌ Call failed: {linkedid} - {dial_status}")
 
     async def handle_hangup(self, event):
         """Handle call hangup and save CDR"""
-        linkedid = event.get('Linkedid', '')
-        
-        if linkedid in self.active_calls:
-            call = self.active_calls[linkedid]
-            end_time = datetime.utcnow()
+        call = self.find_call(event)
+        if call:
+            self.finish_call(call.id)
+
+    def find_call(self, event) -> Optional[CallRecord]:
+        """Tracked call of an event: by Linkedid, else by one of its channels.
+        A leg whose Linkedid changed (transfer, masquerade) still has the
+        channel name DialBegin indexed."""
+        call = self.active_calls.get(event.get('Linkedid', ''))
+        if call is None:
+            for channel in (event.get('Channel', ''), event.get('DestChannel', '')):
+                call = self.active_calls.by_channel(channel) if channel else None
+                if call:
+                    break
+        return call
+
+    @staticmethod
+    def is_live(call: CallRecord, linkedids: Set[str], channels: Set[str]) -> bool:
+        """Whether a tracked call is among Asterisk's channels, by the same rule
+        as find_call: its Linkedid, else one of its channel names"""
+        return call.id in linkedids or call.channel in channels or call.dest_channel in channels
+
+    def finish_call(self, linkedid: str, end_time: Optional[datetime] = None, disposition: Optional[str] = None):
+        """Remove a tracked call, queue its CDR and publish the call end.
+        disposition overrides the one derived from the call state (e.g. LOST)."""
+        call = self.active_calls.get(linkedid)
+        if call:
+            end_time = end_time or datetime.utcnow()
             
             # Calculate durations
-            start_time = call.get('start_time')
-            answer_time = call.get('answer_time')
+            start_time = call.start_time
+            answer_time = call.answer_time
             
             duration = int((end_time - start_time).total_seconds()) if start_time else 0
             billsec = int((end_time - answer_time).total_seconds()) if answer_time else 0
             
             # Determine disposition
-            if call['state'] == 'connected':
-                disposition = 'ANSWERED'
-            elif call['state'] == 'ringing':
-                disposition = 'NO ANSWER'
-            elif call['state'] == 'busy':
-                disposition = 'BUSY'
-            else:
-                disposition = call['state'].upper()
+            if disposition is None:
+                if call.state == 'connected':
+                    disposition = 'ANSWERED'
+                elif call.state == 'ringing':
+                    disposition = 'NO ANSWER'
+                elif call.state == 'busy':
+                    disposition = 'BUSY'
+                else:
+                    disposition = call.state.upper()
             
-            # Save CDR to database
-            try:
-                await self.save_cdr(call, duration, billsec, disposition, linkedid)
-                logger.info(f"💾 CDR saved: {call['caller']} -> {call['destination']} ({duration}s, {disposition})")
-            except Exception as e:
-                logger.error(f"Failed to save CDR: {e}")
+            # Hand the CDR to the batched writer (with ami_cdr Asterisk posts it)
+            if CDR_SOURCE == 'dial':
+                cdr_writer.submit(self.build_cdr_row(call, duration, billsec, disposition, linkedid))
+                logger.info(f"💾 CDR queued: {call.caller} -> {call.destination} ({duration}s, {disposition})")
             
-            mqtt_publisher.publish_call_ended(
-                call['caller'], call['destination'], duration, disposition
+            self._publish(
+                mqtt_publisher.publish_call_ended,
+                call.caller, call.destination, duration, disposition
             )
             logger.info(f"📵 Call ended: {linkedid}")
-            del self.active_calls[linkedid]
+            self.active_calls.remove(linkedid)
+
+    async def handle_cdr(self, event):
+        """Store a CDR posted by Asterisk (CDR_SOURCE=ami_cdr)"""
+        row = cdr_row_from_event(event)
+        cdr_writer.submit(row)
+        logger.info(f"💾 CDR queued: {row['src']} -> {row['dst']} ({row['duration']}s, {row['disposition']})")
 
-    async def save_cdr(self, call: dict, duration: int, billsec: int, disposition: str, uniqueid: str):
-        """Save call detail record to database"""
-        db = SessionLocal()
+    async def resync_active_calls(self):
+        """Rebuild active_calls from Asterisk after (re)login.
+        Calls that ended while we were disconnected get their CDR now, calls
+        that started meanwhile are picked up from CoreShowChannels."""
+        channels = await self._list_action('CoreShowChannels', 'CoreShowChannel')
+        bridges = await self._list_action('BridgeList', 'BridgeListItem')
+        # A bridge with two or more channels means the call was answered
+        connected_bridges = {
+            b.get('BridgeUniqueid') for b in bridges
+            if int(b.get('BridgeNumChannels', 0) or 0) >= 2
+        }
+
+        by_linkedid: Dict[str, List[Any]] = {}
+        for channel in channels:
+            linkedid = channel.get('Linkedid') or channel.get('Uniqueid', '')
+            if linkedid:
+                by_linkedid.setdefault(linkedid, []).append(channel)
+
+        live_channels = {c.get('Channel') for c in channels if c.get('Channel')}
+
+        now = datetime.utcnow()
+        removed = [
+            call.id for call in self.active_calls.values()
+            if not self.is_live(call, set(by_linkedid), live_channels)
+        ]
+        for linkedid in removed:
+            # Hangup was missed during the outage; the end time is the resync time
+            self.finish_call(linkedid, now)
+        self.resync_removed += len(removed)
+
+        added = 0
+        for linkedid, legs in by_linkedid.items():
+            # The originating leg is the one whose Uniqueid is the Linkedid
+            origin = next((c for c in legs if c.get('Uniqueid') == linkedid), legs[0])
+            other = next((c for c in legs if c is not origin), None)
+            answered = any(c.get('BridgeId') in connected_bridges for c in legs if c.get('BridgeId'))
+            elapsed = max(self._parse_duration(c.get('Duration', '')) for c in legs)
+            start_time = now - timedelta(seconds=elapsed)
+
+            call = self.active_calls.get(linkedid)
+            if call is None:
+                # A tracked call whose Linkedid changed is found by its channels
+                call = next(filter(None, (self.active_calls.by_channel(c.get('Channel', '')) for c in legs)), None)
+            if call is None:
+                if other is None:
+                    # Single channel (e.g. voicemail, IVR) - no DialBegin was seen for it either
+                    continue
+                call = CallRecord(
+                    id=linkedid,
+                    channel=origin.get('Channel', ''),
+                    dest_channel=other.get('Channel', ''),
+                    caller=origin.get('CallerIDNum', ''),
+                    caller_name=origin.get('CallerIDName', ''),
+                    destination=origin.get('ConnectedLineNum', '') or other.get('CallerIDNum', ''),
+                    dest_name=origin.get('ConnectedLineName', '') or other.get('CallerIDName', ''),
+                    start_time=start_time,
+                )
+                self.active_calls.add(call)
+                added += 1
+
+            if answered and call.state != 'connected':
+                call.state = 'connected'
+                # Answer time is unknown, assume the call was answered on resync
+                call.answer_time = call.answer_time or now
+                self.active_calls.touch(call)
+
+        self._enforce_call_cap()
+        self._flush_deltas('Resync')
+        self._orphan_candidates.clear()
+        self.last_resync = now
+        logger.info(
+            f"🔄 Active calls resynced: {len(self.active_calls)} active, "
+            f"{added} added, {len(removed)} ended during outage"
+        )
+
+    async def _list_action(self, action: str, item_event: str) -> List[Any]:
+        """Send a list action and return only its item events"""
+        response = await self.manager.send_action({'Action': action})
+        if not isinstance(response, list):
+            response = [response]
+        return [item for item in response if item.get('Event', '') == item_event]
+
+    @staticmethod
+    def _parse_duration(value: str) -> int:
+        """CoreShowChannel Duration (HH:MM:SS) in seconds"""
         try:
-            cdr = CDR(
-                call_date=call.get('start_time', datetime.utcnow()),
-                clid=f'"{call.get("caller_name", "")}" <{call.get("caller", "")}>',
-                src=call.get('caller', ''),
-                dst=call.get('destination', ''),
-                dcontext='internal',
-                channel=call.get('channel', ''),
-                dstchannel=call.get('dest_channel', ''),
-                lastapp='Dial',
-                lastdata=call.get('destination', ''),
-                duration=duration,
-                billsec=billsec,
-                disposition=disposition,
-                amaflags=3,
-                uniqueid=uniqueid,
-                userfield=''
-            )
-            db.add(cdr)
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            raise e
-        finally:
-            db.close()
+            h, m, sec = (int(part) for part in value.split(':'))
+            return h * 3600 + m * 60 + sec
+        except ValueError:
+            return 0
+
+    def build_cdr_row(self, call: CallRecord, duration: int, billsec: int, disposition: str, uniqueid: str) -> Dict[str, Any]:
+        """Build a cdr table row for the batched writer"""
+        return fit_columns({
+            'call_date': call.start_time,
+            'clid': f'"{call.caller_name}" <{call.caller}>',
+            'src': call.caller,
+            'dst': call.destination,
+            'dcontext': 'internal',
+            'channel': call.channel,
+            'dstchannel': call.dest_channel,
+            'lastapp': 'Dial',
+            'lastdata': call.destination,
+            'duration': duration,
+            'billsec': billsec,
+            'disposition': disposition,
+            'amaflags': 3,
+            'uniqueid': uniqueid,
+            'userfield': '',
+            'accountcode': '',
+            'linkedid': uniqueid,
+        })
 
     async def send_action(self, action: str, **kwargs) -> Dict[str, Any]:
         """Send an action to Asterisk and wait for response"""
@@ -238,6 +763,10 @@ class AsteriskAMIClient:
             logger.error(f"Error sending action {action}: {e}")
             raise
 
-    async def get_active_channels(self):
-        """Get currently active channels"""
-        return list(self.active_calls.values())
+    async def get_active_channels(self, extension: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get currently active calls, optionally only those of one extension"""
+        if extension:
+            calls = self.active_calls.by_extension(extension)
+        else:
+            calls = self.active_calls.values()
+        return [call.to_dict() for call in calls]
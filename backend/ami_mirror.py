@@ -0,0 +1,206 @@
+"""
+AMI mirror for follower workers
+Stands in for AsteriskAMIClient in workers that do not own the AMI
+connection: calls, endpoint states and connection status are copied from
+the leader over the worker bus, actions are forwarded to it.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from panoramisk.message import Message
+
+from ami_client import CALL_DELTA_HISTORY
+from call_state import CallRecord, CallRegistry, CallDeltaLog
+from endpoint_state import EndpointStateStore
+from worker_bus import WorkerBus
+
+logger = logging.getLogger(__name__)
+
+# How often the leader pushes connection state, stats and changed endpoints
+SYNC_INTERVAL = float(os.getenv("WORKER_BUS_SYNC_INTERVAL", "1"))
+
+
+def leader_state(client, endpoints: bool = True) -> Dict[str, Any]:
+    """Connection state and stats of the leader's AMI client, optionally with all endpoints"""
+    state = {
+        'type': 'state',
+        'connected': client.connected,
+        'stats': client.get_pipeline_stats(),
+    }
+    if endpoints:
+        updated = client.endpoint_states.last_updated
+        state['endpoints'] = client.endpoint_states.dump()
+        state['endpoints_updated'] = updated.isoformat() if updated else None
+    return state
+
+
+def leader_hello(client) -> Dict[str, Any]:
+    """Everything a new follower needs: all calls with their sequence number and the state"""
+    return {'type': 'hello', 'snapshot': client.call_snapshot(), 'state': leader_state(client)}
+
+
+async def publish_leader_state(client, bus: WorkerBus):
+    """Leader side: push state to the followers. Endpoints are only sent when they changed."""
+    last_updated = client.endpoint_states.last_updated
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL)
+        updated = client.endpoint_states.last_updated
+        bus.publish(leader_state(client, endpoints=updated != last_updated))
+        last_updated = updated
+
+
+class AMIMirror:
+    def __init__(self, bus: WorkerBus):
+        self.bus = bus
+        self.manager = None
+        self.connected = False
+        self.broadcast_callback = None
+        # Local WebSocket clients must be resynced when the mirrored state was replaced
+        self.resync_callback: Optional[Callable[[], None]] = None
+
+        self.call_deltas = CallDeltaLog(CALL_DELTA_HISTORY)
+        self.active_calls = CallRegistry()
+        self.endpoint_states = EndpointStateStore()
+        self.leader_stats: Optional[Dict[str, Any]] = None
+        self.last_sync: Optional[datetime] = None
+        self.hellos = 0
+        # A sequence gap means a delta was lost - the leader resends its hello
+        self.gaps = 0
+        self._resync_pending = False
+
+        bus.on_message('hello', self.handle_hello)
+        bus.on_message('state', self.handle_state)
+        bus.on_message('broadcast', self.handle_broadcast)
+        bus.on_message('leader_lost', self.handle_leader_lost)
+
+    def set_broadcast_callback(self, callback):
+        """Set callback function for broadcasting events"""
+        self.broadcast_callback = callback
+
+    async def handle_hello(self, message: Dict[str, Any]):
+        snapshot = message['snapshot']
+        # Same epoch and sequence numbers as the leader, so WebSocket clients
+        # can resume on any worker
+        self.call_deltas.reset(snapshot['epoch'], snapshot['seq'])
+        self.active_calls = CallRegistry()
+        for call in snapshot['active_calls']:
+            self.active_calls.add(CallRecord.from_dict(call))
+        await self.handle_state(message['state'])
+        self.hellos += 1
+        self._resync_pending = False
+        logger.info(f"Mirroring leader state: {len(self.active_calls)} active calls, epoch {snapshot['epoch']}")
+        if self.hellos > 1 and self.resync_callback:
+            self.resync_callback()
+
+    async def handle_state(self, message: Dict[str, Any]):
+        self.connected = message['connected']
+        self.leader_stats = message.get('stats')
+        if 'endpoints' in message:
+            self.endpoint_states.restore(message['endpoints'], message.get('endpoints_updated'))
+        self.last_sync = datetime.utcnow()
+
+    async def handle_broadcast(self, message: Dict[str, Any]):
+        payload = message['message']
+        if payload.get('type') == 'call_delta':
+            if payload.get('epoch') != self.call_deltas.epoch:
+                self.request_resync()
+            self.apply_deltas(payload['deltas'])
+        if self.broadcast_callback:
+            await self.broadcast_callback(payload, message.get('topics'))
+
+    async def handle_leader_lost(self, message: Dict[str, Any]):
+        self.connected = False
+
+    def apply_deltas(self, deltas: List[Dict[str, Any]]):
+        for delta in deltas:
+            if delta['seq'] <= self.call_deltas.seq:
+                continue
+            if delta['seq'] != self.call_deltas.seq + 1:
+                self.gaps += 1
+                self.request_resync()
+            self.call_deltas.record(delta)
+            if delta['op'] == 'removed':
+                self.active_calls.remove(delta['call']['id'])
+            else:
+                self.active_calls.add(CallRecord.from_dict(delta['call']))
+
+    def request_resync(self):
+        """Ask the leader for a fresh hello; its handler resyncs the local WebSocket clients"""
+        if self._resync_pending:
+            return
+        self._resync_pending = True
+        logger.warning(f"Mirrored call state out of sync at seq {self.call_deltas.seq}, requesting a resync")
+        asyncio.create_task(self._resync())
+
+    async def _resync(self):
+        try:
+            await self.bus.call('ami.resync')
+        except Exception as e:
+            # The next gap asks again
+            self._resync_pending = False
+            logger.error(f"Resync request to the leader failed: {e}")
+
+    def call_snapshot(self) -> Dict[str, Any]:
+        """All active calls plus the sequence number they correspond to"""
+        return {
+            'type': 'snapshot',
+            'epoch': self.call_deltas.epoch,
+            'seq': self.call_deltas.seq,
+            'active_calls': [call.to_dict() for call in self.active_calls.values()],
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+
+    def resume(self, epoch: Optional[str], last_seq: int) -> Dict[str, Any]:
+        """Deltas a client missed since last_seq, or a snapshot if they are gone"""
+        deltas = self.call_deltas.since(epoch, last_seq)
+        if deltas is None:
+            return self.call_snapshot()
+        return {
+            'type': 'call_delta',
+            'epoch': self.call_deltas.epoch,
+            'event_name': 'Resume',
+            'deltas': deltas,
+        }
+
+    async def send_action(self, action: str, **kwargs) -> Any:
+        """Run the action on the leader's AMI connection"""
+        response = await self.bus.call('ami.send_action', action=action, **kwargs)
+        # Back to panoramisk Messages, callers rely on case-insensitive access
+        if isinstance(response, list):
+            return [self._message(item) for item in response]
+        return self._message(response)
+
+    @staticmethod
+    def _message(item: Any) -> Any:
+        if not isinstance(item, dict):
+            return item
+        headers = dict(item)
+        content = headers.pop('content', '')
+        return Message(headers, content)
+
+    async def get_active_channels(self, extension: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get currently active calls, optionally only those of one extension"""
+        if extension:
+            calls = self.active_calls.by_extension(extension)
+        else:
+            calls = self.active_calls.values()
+        return [call.to_dict() for call in calls]
+
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """The leader's pipeline stats as of the last sync"""
+        return {
+            'mirror': True,
+            'connected': self.connected,
+            'last_sync': self.last_sync.isoformat() if self.last_sync else None,
+            'active_calls': len(self.active_calls),
+            'call_deltas': self.call_deltas.stats(),
+            'gaps': self.gaps,
+            'endpoint_states': self.endpoint_states.stats(),
+            'leader': self.leader_stats,
+        }
+
+    async def disconnect(self):
+        pass
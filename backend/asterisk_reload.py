@@ -0,0 +1,99 @@
+"""
+Asterisk reload backends
+A config domain is reloaded with an AMI Reload action on the leader's open
+manager connection - no docker exec, no shell, no asterisk -rx. That needs
+Asterisk to read the generated files directly: docker-compose.yml links
+/etc/asterisk/<file>.conf to /etc/asterisk/custom/<file>.conf instead of
+copying them at container start (a file the backend has not generated yet is
+first seeded from the image's own, so no link dangles).
+
+RELOAD_BACKEND=docker (older setups that still copy the files), or an AMI
+connection that is down or refuses the action, falls back to the docker exec
+reload of the config module.
+"""
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, NamedTuple
+
+from config_output import file_hash, needs_reload, mark_applied
+from pjsip_config import PJSIP_CONFIG_PATH, reload_asterisk
+from dialplan import EXTENSIONS_CONFIG_PATH, reload_dialplan
+from queue_config import QUEUE_CONFIG_PATH, reload_queues
+from voicemail_config import VOICEMAIL_CONFIG_PATH, reload_voicemail
+from acl_config import ACL_CONFIG_PATH, reload_acl
+
+logger = logging.getLogger(__name__)
+
+# ami: Reload action over the manager connection | docker: docker exec + asterisk -rx
+RELOAD_BACKEND = os.getenv("RELOAD_BACKEND", "ami")
+
+
+class ReloadTarget(NamedTuple):
+    path: str
+    # Module argument of the AMI Reload action
+    module: str
+    # docker exec fallback (copies the file, checks and records the hash itself)
+    docker_reload: Callable[[], bool]
+
+
+RELOAD_TARGETS: Dict[str, ReloadTarget] = {
+    "acl": ReloadTarget(ACL_CONFIG_PATH, "acl", reload_acl),
+    "pjsip": ReloadTarget(PJSIP_CONFIG_PATH, "res_pjsip.so", reload_asterisk),
+    "voicemail": ReloadTarget(VOICEMAIL_CONFIG_PATH, "app_voicemail.so", reload_voicemail),
+    "queues": ReloadTarget(QUEUE_CONFIG_PATH, "app_queue.so", reload_queues),
+    "dialplan": ReloadTarget(EXTENSIONS_CONFIG_PATH, "pbx_config.so", reload_dialplan),
+}
+
+
+class AsteriskReloader:
+    def __init__(self):
+        self._ami_client = None
+        self.stats = {"ami": 0, "docker": 0, "skipped": 0, "failed": 0}
+
+    def set_ami_client(self, client):
+        self._ami_client = client
+
+    @property
+    def ami_available(self) -> bool:
+        return RELOAD_BACKEND == "ami" and self._ami_client is not None and self._ami_client.connected
+
+    async def _reload_ami(self, target: ReloadTarget) -> bool:
+        response = await self._ami_client.send_action("Reload", Module=target.module)
+        if not response.success:
+            logger.warning(f"AMI reload of {target.module} refused: {response.get('Message', '')}")
+            return False
+        return True
+
+    async def reload(self, domain: str) -> bool:
+        """Reload one config domain if its file changed since Asterisk last loaded it"""
+        target = RELOAD_TARGETS[domain]
+        # Read before the reload: that is the content Asterisk gets to load
+        digest = file_hash(target.path)
+        if not needs_reload(target.path):
+            self.stats["skipped"] += 1
+            logger.info(f"{os.path.basename(target.path)} already loaded, reload skipped")
+            return True
+
+        if self.ami_available:
+            try:
+                if await self._reload_ami(target):
+                    mark_applied(target.path, digest)
+                    self.stats["ami"] += 1
+                    logger.info(f"Asterisk {domain} reloaded via AMI")
+                    return True
+            except Exception as e:
+                logger.warning(f"AMI reload of {domain} failed, falling back to docker exec: {e}")
+
+        if await asyncio.to_thread(target.docker_reload):
+            self.stats["docker"] += 1
+            return True
+        self.stats["failed"] += 1
+        return False
+
+    def get_stats(self) -> Dict[str, object]:
+        return {"backend": RELOAD_BACKEND, "ami_available": self.ami_available, **self.stats}
+
+
+# Singleton instance
+asterisk_reloader = AsteriskReloader()
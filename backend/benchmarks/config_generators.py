@@ -0,0 +1,135 @@
+"""
+Benchmark of the Asterisk config generators at large-customer scale.
+Synthesizes peers, DIDs, ring groups and IVR menus (transient ORM objects,
+no database needed) and reports render time and tracemalloc peak per generator.
+Usage (from backend/): python -m benchmarks.config_generators [--peers N] [--dids N] [--groups N] [--ivrs N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# pjsip_config would otherwise look up the public IP over the network on import
+os.environ.setdefault("EXTERNAL_IP", "203.0.113.10")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (  # noqa: E402
+    SIPPeer, SIPTrunk, InboundRoute, CallForward, VoicemailMailbox,
+    RingGroup, RingGroupMember, IVRMenu, IVROption,
+)
+from pjsip_config import render_pjsip_config, DEFAULT_CODECS  # noqa: E402
+from dialplan import generate_extensions_config  # noqa: E402
+from queue_config import generate_queues_config  # noqa: E402
+from voicemail_config import generate_voicemail_config  # noqa: E402
+
+FORWARD_TYPES = ["unconditional", "busy", "no_answer"]
+
+
+def synthesize(peers: int, dids: int, groups: int, ivrs: int, trunks: int = 5) -> dict:
+    """Config generator input of a PBX of the given size"""
+    extensions = [str(10000 + i) for i in range(peers)]
+    data = {
+        "trunks": [
+            SIPTrunk(id=t + 1, name=f"trunk{t}", provider="telekom_allip" if t == 0 else "plusnet_basic",
+                     auth_mode="registration", sip_server=f"sip{t}.example.net", username=f"user{t}",
+                     password="secret", from_user=f"+4930{t:04d}", codecs="ulaw,alaw,g722", enabled=True)
+            for t in range(trunks)
+        ],
+        "peers": [
+            SIPPeer(id=i + 1, extension=ext, secret=f"pw{ext}", caller_id=f"User {ext}",
+                    codecs="g722,alaw" if i % 10 == 0 else None, pickup_group=str(i % 20) if i % 4 == 0 else None,
+                    outbound_cid=f"+49301{i:06d}" if i < dids and i % 3 == 0 else None,
+                    pai=f"+49301{i:06d}" if i % 7 == 0 else None, blf_enabled=True, enabled=True)
+            for i, ext in enumerate(extensions)
+        ],
+        "routes": [
+            InboundRoute(id=i + 1, did=f"+49301{i:06d}", trunk_id=i % trunks + 1,
+                         destination_extension=extensions[i % peers], description=f"DID {i}", enabled=True)
+            for i in range(dids)
+        ],
+        "forwards": [
+            CallForward(id=i + 1, extension=extensions[(i * 13) % peers], forward_type=FORWARD_TYPES[i % 3],
+                        destination=f"0170{i:07d}", ring_time=20, enabled=True)
+            for i in range(peers // 20)
+        ],
+        "mailboxes": [
+            VoicemailMailbox(id=i + 1, extension=ext, enabled=True, pin="1234", name=f"User {ext}",
+                             email=f"u{ext}@example.com" if i % 2 == 0 else None, ring_timeout=20 if i % 5 else 30)
+            for i, ext in enumerate(extensions)
+        ],
+        "ring_groups": [],
+        "ivr_menus": [],
+    }
+    for g in range(groups):
+        group = RingGroup(id=g + 1, name=f"group{g}", extension=f"6{g:04d}", strategy="ringall",
+                          ring_time=20, enabled=True)
+        group.members = [
+            RingGroupMember(id=g * 10 + m + 1, extension=extensions[(g * 10 + m) % peers], position=m)
+            for m in range(10)
+        ]
+        data["ring_groups"].append(group)
+    for m in range(ivrs):
+        menu = IVRMenu(id=m + 1, name=f"ivr{m}", extension=f"7{m:04d}", prompt=f"custom/ivr{m}",
+                       timeout_seconds=5, timeout_destination=extensions[m % peers] if m % 2 else None,
+                       retries=2, enabled=True)
+        menu.options = [
+            IVROption(id=m * 10 + d + 1, digit=str(d), destination=extensions[(m + d) % peers], position=d)
+            for d in range(10)
+        ]
+        data["ivr_menus"].append(menu)
+    # Part of the DIDs go to ring groups and IVR menus
+    for i, route in enumerate(data["routes"]):
+        if groups and i % 10 == 1:
+            route.destination_extension = data["ring_groups"][i % groups].extension
+        elif ivrs and i % 10 == 2:
+            route.destination_extension = data["ivr_menus"][i % ivrs].extension
+    return data
+
+
+def generators(data: dict) -> dict:
+    return {
+        "pjsip.conf": lambda: render_pjsip_config(data["peers"], data["trunks"], DEFAULT_CODECS, acl_enabled=True),
+        "extensions.conf": lambda: generate_extensions_config(
+            data["routes"], data["forwards"], data["mailboxes"], data["peers"],
+            data["trunks"], data["ring_groups"], data["ivr_menus"],
+        ),
+        "queues.conf": lambda: generate_queues_config(data["ring_groups"]),
+        "voicemail.conf": lambda: generate_voicemail_config(data["mailboxes"], {"smtp_host": "smtp.example.com"}),
+    }
+
+
+def measure(render, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = render()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best": min(timings), "median": sorted(timings)[len(timings) // 2], "peak": peak, "size": len(output)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=10000)
+    parser.add_argument("--dids", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--ivrs", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = synthesize(args.peers, args.dids, args.groups, args.ivrs)
+    print(f"{args.peers} peers, {args.dids} DIDs, {args.groups} ring groups, {args.ivrs} IVR menus "
+          f"(best/median of {args.repeat})")
+    print(f"{'generator':<18}{'best ms':>10}{'median ms':>11}{'peak MiB':>10}{'output KiB':>12}")
+    for name, render in generators(data).items():
+        r = measure(render, args.repeat)
+        print(f"{name:<18}{r['best'] * 1000:>10.1f}{r['median'] * 1000:>11.1f}"
+              f"{r['peak'] / 2**20:>10.1f}{r['size'] / 2**10:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Response cache
+Short-lived TTL cache for expensive read endpoints (dashboard status, trunk
+status, server info). Concurrent requests for the same key share a single
+in-flight computation; writes invalidate entries explicitly by key prefix.
+With several workers an invalidation goes to all of them over the worker
+bus: a follower passes it to the leader, the leader publishes it.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from worker_bus import worker_bus, FOLLOWER
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = float(os.getenv("API_CACHE_TTL", "2"))
+SERVER_INFO_TTL = float(os.getenv("SERVER_INFO_CACHE_TTL", "10"))
+
+# Key prefixes
+DASHBOARD = "dashboard:"
+TRUNK_STATUS = "trunk_status:"
+SERVER_INFO = "server_info"
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        # key -> (expires_at, value)
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        # key -> running computation, only touched from the event loop
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Bumped on invalidation so a computation that started before a write
+        # does not store its (possibly stale) result
+        self._generation = 0
+        # Invalidation is called from sync endpoints running in the threadpool
+        self._lock = threading.Lock()
+        # Event loop of the worker bus, for invalidations from the threadpool
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.invalidations = 0
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Return the cached value for key or compute it once for all concurrent callers.
+        Exceptions are passed to every waiting caller and never cached."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.joined += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute(key, compute, self.ttl if ttl is None else ttl))
+            self._inflight[key] = task
+        # Shielded: a cancelled request must not cancel the computation others wait for
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        generation = self._generation
+        try:
+            value = await compute()
+            with self._lock:
+                if generation == self._generation and ttl > 0:
+                    self._entries[key] = (time.monotonic() + ttl, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def bind_loop(self):
+        """Remember the event loop, so sync endpoints can pass invalidations to the other workers"""
+        self._loop = asyncio.get_running_loop()
+
+    def invalidate(self, *prefixes: str):
+        """Drop all entries whose key starts with one of the prefixes (all if none
+        given), in this worker and - once bind_loop() ran - in all others"""
+        self.invalidate_local(*prefixes)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._share, prefixes)
+
+    def _share(self, prefixes):
+        if worker_bus.role == FOLLOWER:
+            asyncio.create_task(self._forward(prefixes))
+        else:
+            worker_bus.publish({'type': 'cache_invalidate', 'cache': self.name, 'prefixes': list(prefixes)})
+
+    async def _forward(self, prefixes):
+        try:
+            await worker_bus.call("cache.invalidate", cache=self.name, prefixes=list(prefixes))
+        except Exception as e:
+            # Other workers serve their entries until the TTL expires
+            logger.warning(f"Could not pass cache invalidation to the leader: {e}")
+
+    def invalidate_local(self, *prefixes: str):
+        """Drop matching entries in this worker only"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if not prefixes:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k.startswith(prefixes)]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "ttl": self.ttl,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "joined": self.joined,
+            "invalidations": self.invalidations,
+        }
+
+
+# Singleton instance
+response_cache = TTLCache("api", CACHE_TTL)
+
+
+async def _rpc_invalidate(cache, prefixes):
+    """Leader: invalidation from a follower - drop here, publish to all followers"""
+    if cache == response_cache.name:
+        response_cache.invalidate_local(*prefixes)
+        worker_bus.publish({'type': 'cache_invalidate', 'cache': cache, 'prefixes': prefixes})
+
+
+async def _on_invalidate(message):
+    if message.get('cache') == response_cache.name:
+        response_cache.invalidate_local(*message.get('prefixes', []))
+
+
+worker_bus.register_rpc("cache.invalidate", _rpc_invalidate)
+worker_bus.on_message("cache_invalidate", _on_invalidate)
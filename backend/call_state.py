@@ -0,0 +1,257 @@
+"""
+Active call state
+Compact slotted call records plus a registry with secondary indexes, so
+per-extension and per-channel lookups do not scan every active call.
+Every change is recorded as a sequence-numbered delta for WebSocket clients.
+"""
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+
+def channel_endpoint(channel: str) -> str:
+    """'PJSIP/1001-0000002a' -> '1001', 'PJSIP/trunk-ep-3-0000002b' -> 'trunk-ep-3'"""
+    if '/' not in channel:
+        return ''
+    name = channel.split('/', 1)[1]
+    return name.rsplit('-', 1)[0] if '-' in name else name
+
+
+def channel_topics(channels, numbers=()) -> Dict[str, Set[str]]:
+    """Extensions and trunk ids a set of channels/numbers belongs to"""
+    extensions: Set[str] = {n for n in numbers if n}
+    trunks: Set[str] = set()
+    for channel in channels:
+        endpoint = channel_endpoint(channel or '')
+        if endpoint.startswith('trunk-ep-'):
+            trunks.add(endpoint[len('trunk-ep-'):])
+        elif endpoint:
+            extensions.add(endpoint)
+    return {'extensions': extensions, 'trunks': trunks}
+
+
+def call_topics(call: Dict[str, Any]) -> Dict[str, Any]:
+    """Routing topics of a serialized call, used to filter WebSocket messages"""
+    topics = channel_topics(
+        (call.get('channel', ''), call.get('dest_channel', '')),
+        (call.get('caller', ''), call.get('destination', '')),
+    )
+    topics['event'] = 'calls'
+    return topics
+
+
+class CallRecord:
+    """One active call, keyed by its Linkedid"""
+    __slots__ = (
+        'id', 'channel', 'dest_channel', 'caller', 'caller_name',
+        'destination', 'dest_name', 'state', 'start_time', 'answer_time',
+    )
+
+    def __init__(
+        self,
+        id: str,
+        channel: str = '',
+        dest_channel: str = '',
+        caller: str = '',
+        caller_name: str = '',
+        destination: str = '',
+        dest_name: str = '',
+        state: str = 'ringing',
+        start_time: Optional[datetime] = None,
+        answer_time: Optional[datetime] = None,
+    ):
+        self.id = id
+        self.channel = channel
+        self.dest_channel = dest_channel
+        self.caller = caller
+        self.caller_name = caller_name
+        self.destination = destination
+        self.dest_name = dest_name
+        self.state = state
+        self.start_time = start_time or datetime.utcnow()
+        self.answer_time = answer_time
+
+    def to_dict(self) -> dict:
+        """JSON-ready representation for the API, WebSocket and MQTT"""
+        return {
+            'id': self.id,
+            'channel': self.channel,
+            'dest_channel': self.dest_channel,
+            'caller': self.caller,
+            'caller_name': self.caller_name,
+            'destination': self.destination,
+            'dest_name': self.dest_name,
+            'state': self.state,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'answer_time': self.answer_time.isoformat() if self.answer_time else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CallRecord':
+        """Inverse of to_dict, used by follower workers mirroring the leader's calls"""
+        def parse(value):
+            return datetime.fromisoformat(value) if value else None
+        return cls(
+            id=data['id'],
+            channel=data.get('channel', ''),
+            dest_channel=data.get('dest_channel', ''),
+            caller=data.get('caller', ''),
+            caller_name=data.get('caller_name', ''),
+            destination=data.get('destination', ''),
+            dest_name=data.get('dest_name', ''),
+            state=data.get('state', 'ringing'),
+            start_time=parse(data.get('start_time')),
+            answer_time=parse(data.get('answer_time')),
+        )
+
+    def __repr__(self):
+        return f"<CallRecord {self.id} {self.caller}->{self.destination} {self.state}>"
+
+
+class CallRegistry:
+    """Active calls by Linkedid with indexes by caller, destination and channel.
+    Insertion ordered, the first call is the oldest one."""
+
+    def __init__(self, listener: Optional[Callable[[str, CallRecord], None]] = None):
+        self._calls: Dict[str, CallRecord] = {}
+        self._by_caller: Dict[str, Set[str]] = {}
+        self._by_destination: Dict[str, Set[str]] = {}
+        self._by_channel: Dict[str, str] = {}
+        # Called with ('added' | 'updated' | 'removed', call) on every change
+        self._listener = listener
+
+    def _notify(self, op: str, call: CallRecord):
+        if self._listener:
+            self._listener(op, call)
+
+    def add(self, call: CallRecord):
+        """Add or replace a call and index it"""
+        op = 'added'
+        if call.id in self._calls:
+            self._remove(call.id)
+            op = 'updated'
+        self._calls[call.id] = call
+        if call.caller:
+            self._by_caller.setdefault(call.caller, set()).add(call.id)
+        if call.destination:
+            self._by_destination.setdefault(call.destination, set()).add(call.id)
+        for channel in (call.channel, call.dest_channel):
+            if channel:
+                self._by_channel[channel] = call.id
+        self._notify(op, call)
+
+    def touch(self, call: CallRecord):
+        """Report a change of a non-indexed field (state, answer_time)"""
+        if self._calls.get(call.id) is call:
+            self._notify('updated', call)
+
+    def remove(self, linkedid: str) -> Optional[CallRecord]:
+        """Remove a call and its index entries"""
+        call = self._remove(linkedid)
+        if call is not None:
+            self._notify('removed', call)
+        return call
+
+    def _remove(self, linkedid: str) -> Optional[CallRecord]:
+        call = self._calls.pop(linkedid, None)
+        if call is None:
+            return None
+        self._unindex(self._by_caller, call.caller, linkedid)
+        self._unindex(self._by_destination, call.destination, linkedid)
+        for channel in (call.channel, call.dest_channel):
+            if self._by_channel.get(channel) == linkedid:
+                del self._by_channel[channel]
+        return call
+
+    @staticmethod
+    def _unindex(index: Dict[str, Set[str]], key: str, linkedid: str):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(linkedid)
+            if not ids:
+                del index[key]
+
+    def by_caller(self, extension: str) -> List[CallRecord]:
+        return [self._calls[i] for i in self._by_caller.get(extension, ())]
+
+    def by_destination(self, extension: str) -> List[CallRecord]:
+        return [self._calls[i] for i in self._by_destination.get(extension, ())]
+
+    def by_extension(self, extension: str) -> List[CallRecord]:
+        """Calls where the extension is caller or destination"""
+        ids = self._by_caller.get(extension, set()) | self._by_destination.get(extension, set())
+        return sorted((self._calls[i] for i in ids), key=lambda call: call.start_time)
+
+    def by_channel(self, channel: str) -> Optional[CallRecord]:
+        linkedid = self._by_channel.get(channel)
+        return self._calls.get(linkedid) if linkedid else None
+
+    def oldest(self) -> Optional[CallRecord]:
+        return next(iter(self._calls.values()), None)
+
+    def get(self, linkedid: str) -> Optional[CallRecord]:
+        return self._calls.get(linkedid)
+
+    def values(self):
+        return self._calls.values()
+
+    def __getitem__(self, linkedid: str) -> CallRecord:
+        return self._calls[linkedid]
+
+    def __contains__(self, linkedid: str) -> bool:
+        return linkedid in self._calls
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._calls)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class CallDeltaLog:
+    """Sequence-numbered call changes with a bounded history, so a
+    reconnecting client can catch up from its last seen sequence number.
+    The epoch changes on every backend start; sequence numbers are only
+    comparable within one epoch."""
+
+    def __init__(self, size: int):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._history: deque = deque(maxlen=max(1, size))
+
+    def append(self, op: str, call: CallRecord) -> Dict[str, Any]:
+        self.seq += 1
+        delta = {'seq': self.seq, 'op': op, 'call': call.to_dict()}
+        self._history.append(delta)
+        return delta
+
+    def reset(self, epoch: str, seq: int):
+        """Continue another log (the leader worker's) from epoch/seq"""
+        self.epoch = epoch
+        self.seq = seq
+        self._history.clear()
+
+    def record(self, delta: Dict[str, Any]):
+        """Store a delta numbered by another log"""
+        self.seq = delta['seq']
+        self._history.append(delta)
+
+    def since(self, epoch: Optional[str], seq: int) -> Optional[List[Dict[str, Any]]]:
+        """Deltas after seq, or None if they are no longer (or never were) available"""
+        if epoch != self.epoch or seq > self.seq or seq < 0:
+            return None
+        if seq == self.seq:
+            return []
+        oldest = self._history[0]['seq'] if self._history else self.seq + 1
+        if seq + 1 < oldest:
+            return None
+        return [delta for delta in self._history if delta['seq'] > seq]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'epoch': self.epoch,
+            'seq': self.seq,
+            'history': len(self._history),
+            'history_size': self._history.maxlen,
+        }
@@ -0,0 +1,183 @@
+"""
+CDR archive files
+CDRs past the retention period are written to one compressed file per month
+in CDR_ARCHIVE_DIR before their partition is dropped: Parquet (columnar,
+zstd) when pyarrow is installed, gzipped NDJSON otherwise. The files stay
+readable through /api/cdr/archive.
+
+File names are deterministic: cdr-2025-01 holds the month's partition,
+cdr-2025-01-<id> the rows archived without a partition, starting at that
+CDR id. If the drop/delete after writing fails, the next run archives the
+same rows to the same name, so no CDR ends up in two files.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import DateTime, Integer
+
+from cdr_export import EXPORT_COLUMNS, FIELDNAMES
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+CDR_ARCHIVE_DIR = os.getenv("CDR_ARCHIVE_DIR", "/app/uploads/cdr-archive")
+# Rows per Parquet row group / read batch
+ARCHIVE_BATCH_SIZE = 10000
+
+ARCHIVE_NAME = re.compile(r"^cdr-(\d{4}-\d{2})(?:-(\d+))?\.(parquet|ndjson\.gz)$")
+ARCHIVE_EXTENSIONS = ("parquet", "ndjson.gz")
+
+
+def _arrow_schema():
+    fields = []
+    for column in EXPORT_COLUMNS:
+        if isinstance(column.type, Integer):
+            fields.append(pa.field(column.name, pa.int64()))
+        elif isinstance(column.type, DateTime):
+            fields.append(pa.field(column.name, pa.timestamp("us")))
+        else:
+            fields.append(pa.field(column.name, pa.string()))
+    return pa.schema(fields)
+
+
+def _batches(rows: Iterable[Any]) -> Iterator[List[Any]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ARCHIVE_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _archive_path(month: str, part: Optional[int], extension: str) -> str:
+    suffix = f"-{part}" if part is not None else ""
+    return os.path.join(CDR_ARCHIVE_DIR, f"cdr-{month}{suffix}.{extension}")
+
+
+def write_archive(month: str, rows: Iterable[Any], part: Optional[int] = None) -> Dict[str, Any]:
+    """Write rows (tuples in FIELDNAMES order) to the archive file of the month
+    ('2025-01') and part (None: the partition, else the first CDR id), replacing
+    an earlier attempt. Written to a temp file first, so a file is always complete."""
+    os.makedirs(CDR_ARCHIVE_DIR, exist_ok=True)
+    extension = "parquet" if PYARROW_AVAILABLE else "ndjson.gz"
+    path = _archive_path(month, part, extension)
+    tmp_path = path + ".tmp"
+    count = 0
+    try:
+        if PYARROW_AVAILABLE:
+            schema = _arrow_schema()
+            with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+                for batch in _batches(rows):
+                    columns = list(zip(*batch))
+                    writer.write_table(pa.Table.from_arrays(
+                        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                        schema=schema,
+                    ))
+                    count += len(batch)
+        else:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                for row in rows:
+                    record = dict(zip(FIELDNAMES, row))
+                    if record.get("call_date"):
+                        record["call_date"] = record["call_date"].isoformat()
+                    f.write(json.dumps(record) + "\n")
+                    count += 1
+        os.replace(tmp_path, path)
+        # An earlier attempt in the other format
+        for other in ARCHIVE_EXTENSIONS:
+            if other != extension and os.path.exists(_archive_path(month, part, other)):
+                os.remove(_archive_path(month, part, other))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.info(f"CDR archive {os.path.basename(path)} written: {count} CDR(s)")
+    return {"file": os.path.basename(path), "rows": count}
+
+
+def list_archives() -> List[Dict[str, Any]]:
+    """All archive files, oldest month first, within a month the partition file
+    and then the row files by first CDR id"""
+    files = []
+    for path in glob.glob(os.path.join(CDR_ARCHIVE_DIR, "cdr-*")):
+        match = ARCHIVE_NAME.match(os.path.basename(path))
+        if match:
+            files.append((match.group(1), int(match.group(2) or -1), path, match))
+    archives = []
+    for _, _, path, match in sorted(files):
+        name = os.path.basename(path)
+        rows = None
+        if match.group(3) == "parquet" and PYARROW_AVAILABLE:
+            rows = pq.ParquetFile(path).metadata.num_rows
+        archives.append({
+            "month": match.group(1),
+            "file": name,
+            "format": match.group(3),
+            "size": os.path.getsize(path),
+            "rows": rows,
+        })
+    return archives
+
+
+def _read_file(path: str) -> Iterator[Dict[str, Any]]:
+    if path.endswith(".parquet"):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is required to read Parquet CDR archives")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=ARCHIVE_BATCH_SIZE):
+            yield from batch.to_pylist()
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("call_date"):
+                    record["call_date"] = datetime.fromisoformat(record["call_date"])
+                yield record
+
+
+def read_archive(
+    month: str,
+    src: Optional[str] = None,
+    dst: Optional[str] = None,
+    disposition: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+) -> Optional[List[Dict[str, Any]]]:
+    """Archived CDRs of a month, oldest first, filtered like the CDR list.
+    Reads the files in batches; None if the month has no archive."""
+    paths = [
+        os.path.join(CDR_ARCHIVE_DIR, a["file"]) for a in list_archives() if a["month"] == month
+    ]
+    if not paths:
+        return None
+    disposition = disposition.upper() if disposition else None
+    records = []
+    skipped = 0
+    for path in paths:
+        for record in _read_file(path):
+            if src and src not in (record.get("src") or ""):
+                continue
+            if dst and dst not in (record.get("dst") or ""):
+                continue
+            if disposition and record.get("disposition") != disposition:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            records.append(record)
+            if len(records) >= limit:
+                return records
+    return records
@@ -0,0 +1,78 @@
+"""
+CDR export
+Streams CDRs as CSV or NDJSON, optionally gzipped, in constant memory: rows
+come from a server-side cursor (yield_per) in their own session and are
+encoded in chunks as the client reads them.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Callable, Iterator
+
+from sqlalchemy.orm import Query
+
+from database import SessionLocal, CDR
+
+# Rows fetched per round trip of the server-side cursor
+EXPORT_FETCH_SIZE = 2000
+# Encoded bytes collected before a chunk is sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_COLUMNS = [column for column in CDR.__table__.columns]
+FIELDNAMES = [column.name for column in EXPORT_COLUMNS]
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_lines(rows) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDNAMES)
+    for row in rows:
+        writer.writerow([_value(value) for value in row])
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_lines(rows) -> Iterator[str]:
+    chunk = []
+    size = 0
+    for row in rows:
+        line = json.dumps({name: _value(value) for name, value in zip(FIELDNAMES, row)}) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    yield "".join(chunk)
+
+
+def stream_cdr_export(apply_filters: Callable[[Query], Query], fmt: str, compress: bool = False) -> Iterator[bytes]:
+    """Encoded export of all CDRs matching apply_filters, oldest first"""
+    db = SessionLocal()
+    try:
+        query = apply_filters(db.query(*EXPORT_COLUMNS)).order_by(CDR.call_date, CDR.id)
+        # Named cursor on PostgreSQL, the result is never held in full
+        rows = query.yield_per(EXPORT_FETCH_SIZE)
+        lines = _csv_lines(rows) if fmt == "csv" else _ndjson_lines(rows)
+        gzip = zlib.compressobj(wbits=31) if compress else None
+        for text in lines:
+            data = text.encode()
+            if gzip:
+                data = gzip.compress(data)
+            if data:
+                yield data
+        if gzip:
+            yield gzip.flush()
+    finally:
+        db.close()
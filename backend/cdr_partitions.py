@@ -0,0 +1,280 @@
+"""
+CDR partitions and retention
+On PostgreSQL the cdr table is range-partitioned by month on call_date
+(cdr_y2025m01, ...; cdr_default takes anything without a partition), so
+queries with a date range only touch the months they need. An existing
+plain table is converted with migrate_cdr_partitions.py. Partitions are
+created a few months ahead. Months older than CDR_RETENTION_MONTHS are
+written to an archive file (cdr_archive), then their partition is detached
+and dropped instead of DELETEd row by row. Other databases archive and
+delete the expired rows.
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+
+from database import engine, CDR
+from cdr_archive import write_archive, ARCHIVE_BATCH_SIZE
+from cdr_export import EXPORT_COLUMNS, FIELDNAMES
+
+logger = logging.getLogger(__name__)
+
+# Months of CDRs kept in the database, 0 = keep everything
+CDR_RETENTION_MONTHS = int(os.getenv("CDR_RETENTION_MONTHS", "0"))
+CDR_PARTITION_MONTHS_AHEAD = int(os.getenv("CDR_PARTITION_MONTHS_AHEAD", "3"))
+CDR_MAINTENANCE_INTERVAL = float(os.getenv("CDR_MAINTENANCE_INTERVAL", "21600"))
+# CDRs per transaction when migrate_cdr_partitions.py moves the old table over
+CDR_MIGRATION_BATCH_SIZE = int(os.getenv("CDR_MIGRATION_BATCH_SIZE", "10000"))
+
+DEFAULT_PARTITION = "cdr_default"
+PARTITION_NAME = re.compile(r"^cdr_y(\d{4})m(\d{2})$")
+
+_maintenance_lock = threading.Lock()
+last_maintenance: Optional[Dict[str, Any]] = None
+
+
+def month_start(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"cdr_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(conn, table: str = "cdr") -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}).scalar()
+    return relkind == "p"
+
+
+def list_partitions(conn) -> List[Tuple[str, datetime]]:
+    """(name, month) of the monthly partitions, oldest first"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'cdr'::regclass"
+    )).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def _create_partition(conn, month: datetime):
+    name = partition_name(month)
+    upper = add_months(month, 1)
+    conn.execute(text(f"CREATE TABLE {name} (LIKE cdr INCLUDING DEFAULTS)"))
+    # CDRs of the month that went to the default partition move over,
+    # otherwise the ATTACH would fail
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE call_date >= :lower AND call_date < :upper RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"lower": month, "upper": upper})
+    conn.execute(text(
+        f"ALTER TABLE cdr ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+    ))
+    logger.info(f"CDR partition {name} created")
+
+
+def ensure_partitions(conn, first: Optional[datetime] = None) -> List[str]:
+    """Create the default partition and the monthly partitions from first
+    (default: this month) up to CDR_PARTITION_MONTHS_AHEAD months ahead"""
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF cdr DEFAULT"))
+    existing = {name for name, _ in list_partitions(conn)}
+    this_month = month_start(datetime.utcnow())
+    month = month_start(first) if first and first < this_month else this_month
+    last = add_months(this_month, CDR_PARTITION_MONTHS_AHEAD)
+    created = []
+    while month <= last:
+        if partition_name(month) not in existing:
+            _create_partition(conn, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(batch_size: int = CDR_MIGRATION_BATCH_SIZE) -> Dict[str, Any]:
+    """One-time migration of a plain cdr table to a partitioned one (PostgreSQL),
+    run by migrate_cdr_partitions.py - never at startup.
+    Only the swap holds the ACCESS EXCLUSIVE lock: the old table is renamed to
+    cdr_unpartitioned and an empty partitioned cdr takes its place, so new CDRs
+    are written again right away. The old rows are then moved over in batches of
+    batch_size, one transaction each; until that finishes, older CDRs are missing
+    from lists and statistics. Interrupted, a rerun continues with the move.
+    The partitioned table has no primary key, it would have to include
+    call_date; ids still come from the same sequence and ix_cdr_id indexes them."""
+    if engine.dialect.name != "postgresql":
+        return {"status": "unsupported"}
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            conn.execute(text("LOCK TABLE cdr IN ACCESS EXCLUSIVE MODE"))
+            first = conn.execute(select(func.min(CDR.call_date))).scalar()
+            sequence = conn.execute(text("SELECT pg_get_serial_sequence('cdr', 'id')")).scalar()
+            conn.execute(text("ALTER TABLE cdr RENAME TO cdr_unpartitioned"))
+            # The old table keeps its primary key for the batched move; its
+            # other indexes go, their names are needed for the new table
+            for index in CDR.__table__.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+            conn.execute(text("CREATE TABLE cdr (LIKE cdr_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (call_date)"))
+            # The sequence would be dropped with the old table
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY cdr.id"))
+            ensure_partitions(conn, first)
+            for index in CDR.__table__.indexes:
+                index.create(bind=conn)
+            logger.info("cdr swapped for a partitioned table, moving the old CDRs")
+        elif conn.execute(text("SELECT to_regclass('cdr_unpartitioned')")).scalar() is None:
+            return {"status": "partitioned", "moved": 0}
+
+    moved = 0
+    while True:
+        with engine.begin() as conn:
+            count = conn.execute(text(
+                "WITH moved AS (DELETE FROM cdr_unpartitioned WHERE id IN "
+                "(SELECT id FROM cdr_unpartitioned ORDER BY id LIMIT :limit) RETURNING *) "
+                "INSERT INTO cdr SELECT * FROM moved"
+            ), {"limit": batch_size}).rowcount
+        if not count:
+            break
+        moved += count
+        logger.info(f"CDR partition migration: {moved} CDR(s) moved")
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE cdr_unpartitioned"))
+    return {"status": "converted", "moved": moved}
+
+
+def _select_rows(table: str, where: str):
+    return text(
+        f"SELECT {', '.join(FIELDNAMES)} FROM {table} {where} ORDER BY call_date, id"
+    ).columns(*EXPORT_COLUMNS)
+
+
+def _archive_partition(name: str, month: datetime) -> Dict[str, Any]:
+    """Archive a whole partition, then detach and drop it. Rerun after a failed
+    drop, the partition's archive file is rewritten, not duplicated."""
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=ARCHIVE_BATCH_SIZE).execute(_select_rows(name, ""))
+        archive = write_archive(f"{month:%Y-%m}", result)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE cdr DETACH PARTITION {name}"))
+        # Detached, nothing can be added any more
+        rows = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        if rows != archive["rows"]:
+            raise RuntimeError(f"{name} has {rows} CDRs, archived {archive['rows']} - not dropped")
+        conn.execute(text(f"DROP TABLE {name}"))
+    logger.info(f"CDR partition {name} archived and dropped")
+    return {"month": f"{month:%Y-%m}", "partition": name, **archive}
+
+
+def _archive_rows(table: str, cutoff: datetime) -> List[Dict[str, Any]]:
+    """Archive and delete the CDRs of table before cutoff, one month per transaction.
+    The archive file is named after the first CDR id, so a month whose DELETE
+    failed is archived to the same file again."""
+    with engine.connect() as conn:
+        first = conn.execute(text(f"SELECT min(call_date) FROM {table}").columns(CDR.call_date)).scalar()
+    archived = []
+    month = month_start(first) if first else cutoff
+    while month < cutoff:
+        upper = add_months(month, 1)
+        params = {"lower": month, "upper": upper}
+        where = "WHERE call_date >= :lower AND call_date < :upper"
+        with engine.begin() as conn:
+            first_id = conn.execute(text(f"SELECT min(id) FROM {table} {where}"), params).scalar()
+            if first_id is not None:
+                result = conn.execution_options(yield_per=ARCHIVE_BATCH_SIZE).execute(_select_rows(table, where), params)
+                archive = write_archive(f"{month:%Y-%m}", result, part=first_id)
+                conn.execute(text(f"DELETE FROM {table} {where}"), params)
+                archived.append({"month": f"{month:%Y-%m}", "table": table, **archive})
+        month = upper
+    return archived
+
+
+def apply_retention(now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Archive and remove all months older than CDR_RETENTION_MONTHS"""
+    if CDR_RETENTION_MONTHS <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.utcnow()), -CDR_RETENTION_MONTHS)
+    with engine.connect() as conn:
+        partitioned = is_partitioned(conn)
+        expired = [p for p in list_partitions(conn) if add_months(p[1], 1) <= cutoff] if partitioned else []
+
+    archived = [_archive_partition(name, month) for name, month in expired]
+    # Stray old CDRs in the default partition, or all of them without partitions
+    archived += _archive_rows(DEFAULT_PARTITION if partitioned else "cdr", cutoff)
+    return archived
+
+
+def run_maintenance() -> Dict[str, Any]:
+    """Create upcoming partitions and apply the retention policy (blocking)"""
+    global last_maintenance
+    if not _maintenance_lock.acquire(blocking=False):
+        return {"status": "running"}
+    try:
+        started = datetime.utcnow()
+        created = []
+        with engine.begin() as conn:
+            if is_partitioned(conn):
+                created = ensure_partitions(conn)
+        archived = apply_retention()
+        last_maintenance = {
+            "started": started.isoformat(),
+            "finished": datetime.utcnow().isoformat(),
+            "created": created,
+            "archived": archived,
+        }
+        return {"status": "done", **last_maintenance}
+    except Exception as e:
+        last_maintenance = {"started": started.isoformat(), "error": str(e)}
+        raise
+    finally:
+        _maintenance_lock.release()
+
+
+async def start_maintenance() -> Dict[str, str]:
+    """Run the maintenance in the background, unless it is already running"""
+    if _maintenance_lock.locked():
+        return {"status": "running"}
+    asyncio.create_task(asyncio.to_thread(run_maintenance))
+    return {"status": "started"}
+
+
+async def maintenance_loop():
+    """Leader task: partition and retention maintenance every CDR_MAINTENANCE_INTERVAL"""
+    while True:
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except Exception as e:
+            logger.error(f"CDR maintenance failed: {e}")
+        await asyncio.sleep(CDR_MAINTENANCE_INTERVAL)
+
+
+def _maintenance_status() -> Dict[str, Any]:
+    with engine.connect() as conn:
+        partitioned = is_partitioned(conn)
+        partitions = [name for name, _ in list_partitions(conn)] if partitioned else []
+    return {
+        "partitioned": partitioned,
+        "partitions": partitions,
+        "retention_months": CDR_RETENTION_MONTHS,
+        "running": _maintenance_lock.locked(),
+        "last_maintenance": last_maintenance,
+    }
+
+
+async def maintenance_status() -> Dict[str, Any]:
+    """Partitions, retention setting and the last maintenance run"""
+    return await asyncio.to_thread(_maintenance_status)
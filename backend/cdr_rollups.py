@@ -0,0 +1,312 @@
+"""
+CDR rollups
+Hourly and daily aggregates of the cdr table per extension, trunk, direction
+and disposition. The CDR writer updates them in the same transaction as the
+raw rows; rebuild_rollups() recomputes them from raw data (backfill).
+Statistics read from here, so their cost does not grow with the CDR volume.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, select, text
+from sqlalchemy.orm import Session
+
+from database import engine, CDR, CDRRollupHourly, CDRRollupDaily
+from call_state import channel_endpoint
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds, inclusive) of the duration histogram; dur_inf takes the rest
+DURATION_BUCKETS = (10, 30, 60, 120, 300, 600, 1800)
+HISTOGRAM_COLUMNS = [f"dur_{bound}" for bound in DURATION_BUCKETS] + ["dur_inf"]
+SUM_COLUMNS = ["calls", "total_duration", "total_billsec", "billed_calls"] + HISTOGRAM_COLUMNS
+KEY_COLUMNS = ["bucket", "extension", "trunk_id", "direction", "disposition"]
+
+DISPOSITIONS = {
+    "answered_calls": "ANSWERED",
+    "missed_calls": "NO ANSWER",
+    "busy_calls": "BUSY",
+    "failed_calls": "FAILED",
+}
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Rollup table -> bucket of a call_date
+ROLLUPS = ((CDRRollupHourly, floor_hour), (CDRRollupDaily, floor_day))
+
+
+def cdr_dimensions(row: Dict[str, Any]) -> Tuple[List[str], int, str]:
+    """Local extensions, trunk id (0 = none) and direction of a CDR row"""
+    extensions: List[str] = []
+    trunks: Dict[str, int] = {}
+    for side in ("channel", "dstchannel"):
+        channel = row.get(side) or ""
+        if not channel.startswith("PJSIP/"):
+            continue
+        endpoint = channel_endpoint(channel)
+        if endpoint.startswith("trunk-ep-"):
+            trunk_id = endpoint[len("trunk-ep-"):]
+            if trunk_id.isdigit():
+                trunks[side] = int(trunk_id)
+        elif endpoint and endpoint not in extensions:
+            extensions.append(endpoint)
+
+    if "channel" in trunks:
+        return extensions, trunks["channel"], "inbound"
+    if "dstchannel" in trunks:
+        return extensions, trunks["dstchannel"], "outbound"
+    return extensions, 0, "internal"
+
+
+def _histogram_column(duration: int) -> str:
+    for bound in DURATION_BUCKETS:
+        if duration <= bound:
+            return f"dur_{bound}"
+    return "dur_inf"
+
+
+def aggregate(rows: Iterable[Dict[str, Any]]) -> Dict[Any, Dict[tuple, Dict[str, int]]]:
+    """Rollup increments per table and key for a batch of CDR rows"""
+    result: Dict[Any, Dict[tuple, Dict[str, int]]] = {model: {} for model, _ in ROLLUPS}
+    for row in rows:
+        call_date = row.get("call_date")
+        if call_date is None:
+            continue
+        duration = int(row.get("duration") or 0)
+        billsec = int(row.get("billsec") or 0)
+        disposition = row.get("disposition") or ""
+        extensions, trunk_id, direction = cdr_dimensions(row)
+        histogram = _histogram_column(duration)
+
+        for model, bucket_of in ROLLUPS:
+            bucket = bucket_of(call_date)
+            entries = result[model]
+            # '' = all calls, counted once; then once per local extension
+            for extension in [""] + extensions:
+                key = (bucket, extension, trunk_id, direction, disposition)
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = dict.fromkeys(SUM_COLUMNS, 0)
+                    entry["max_duration"] = 0
+                entry["calls"] += 1
+                entry["total_duration"] += duration
+                entry["total_billsec"] += billsec
+                entry["billed_calls"] += 1 if billsec > 0 else 0
+                entry[histogram] += 1
+                entry["max_duration"] = max(entry["max_duration"], duration)
+    return result
+
+
+def _insert(conn):
+    """INSERT ... ON CONFLICT for the connection's dialect"""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif conn.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"CDR rollups need PostgreSQL or SQLite, not {conn.dialect.name}")
+    return insert
+
+
+def _upsert(conn, model, entries: Dict[tuple, Dict[str, int]]):
+    if not entries:
+        return
+    table = model.__table__
+    stmt = _insert(conn)(table)
+    excluded = stmt.excluded
+    update = {column: table.c[column] + excluded[column] for column in SUM_COLUMNS}
+    update["max_duration"] = case(
+        (excluded.max_duration > table.c.max_duration, excluded.max_duration),
+        else_=table.c.max_duration,
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=KEY_COLUMNS, set_=update)
+    # Sorted, so concurrent writers lock rows in the same order
+    params = [dict(zip(KEY_COLUMNS, key), **values) for key, values in sorted(entries.items())]
+    conn.execute(stmt, params)
+
+
+def apply_rollups(conn, rows: List[Dict[str, Any]]):
+    """Add a batch of new CDR rows to the rollups (inside the writer's transaction)"""
+    for model, entries in aggregate(rows).items():
+        _upsert(conn, model, entries)
+
+
+def rebuild_rollups(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> Dict[str, int]:
+    """Recompute the rollups from the cdr table, one day per transaction.
+    Always rebuilds whole days; defaults to the full CDR range and never
+    starts before the oldest CDR still in the table."""
+    with engine.connect() as conn:
+        first, last = conn.execute(select(func.min(CDR.call_date), func.max(CDR.call_date))).one()
+    # Days before the oldest CDR may be archived, their rollups are all that is left
+    date_from = max(date_from, first) if date_from and first else date_from or first
+    date_to = date_to or last
+    if date_from is None or date_to is None:
+        return {"days": 0, "cdrs": 0}
+
+    day = floor_day(date_from)
+    days = cdrs = 0
+    while day <= date_to:
+        next_day = day + timedelta(days=1)
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                # Block the CDR writer's rollup updates for this day's rebuild
+                conn.execute(text("LOCK TABLE cdr_rollup_hourly, cdr_rollup_daily IN SHARE ROW EXCLUSIVE MODE"))
+            conn.execute(delete(CDRRollupHourly).where(CDRRollupHourly.bucket >= day, CDRRollupHourly.bucket < next_day))
+            conn.execute(delete(CDRRollupDaily).where(CDRRollupDaily.bucket == day))
+            result = conn.execute(
+                select(CDR.call_date, CDR.channel, CDR.dstchannel, CDR.duration, CDR.billsec, CDR.disposition)
+                .where(CDR.call_date >= day, CDR.call_date < next_day)
+            )
+            rows = [dict(r._mapping) for r in result]
+            apply_rollups(conn, rows)
+        days += 1
+        cdrs += len(rows)
+        day = next_day
+
+    logger.info(f"CDR rollups rebuilt: {days} day(s), {cdrs} CDR(s)")
+    return {"days": days, "cdrs": cdrs}
+
+
+def _rollup_ranges(date_from: Optional[datetime], date_to: Optional[datetime]):
+    """Split an inclusive date range into whole days (daily table) and the
+    hours before/after them (hourly table). Rollups have hour precision."""
+    lower = floor_hour(date_from) if date_from else None
+    upper = floor_hour(date_to) + timedelta(hours=1) if date_to else None
+    day_lower = floor_day(lower + timedelta(hours=23)) if lower else None
+    day_upper = floor_day(upper) if upper else None
+
+    if day_lower and day_upper and day_lower >= day_upper:
+        # Less than a whole day - only hours
+        return [], [(lower, upper)]
+    hours = []
+    if lower and lower < day_lower:
+        hours.append((lower, day_lower))
+    if upper and day_upper < upper:
+        hours.append((day_upper, upper))
+    return [(day_lower, day_upper)], hours
+
+
+def _bucket_range(model, lower: Optional[datetime], upper: Optional[datetime]) -> list:
+    conditions = []
+    if lower:
+        conditions.append(model.bucket >= lower)
+    if upper:
+        conditions.append(model.bucket < upper)
+    return conditions
+
+
+def _sum_rollup(db: Session, model, ranges, extension: str, trunk: Optional[int], since: Dict[str, datetime]) -> Dict[str, Any]:
+    calls = func.coalesce(func.sum(model.calls), 0)
+    columns = [calls.label("total_calls")]
+    columns += [func.coalesce(func.sum(model.calls).filter(model.disposition == value), 0).label(name)
+                for name, value in DISPOSITIONS.items()]
+    columns += [func.coalesce(func.sum(getattr(model, name)), 0).label(name) for name in SUM_COLUMNS[1:]]
+    columns.append(func.coalesce(func.max(model.max_duration), 0).label("max_duration"))
+    columns += [func.coalesce(func.sum(model.calls).filter(model.bucket >= start), 0).label(name)
+                for name, start in since.items()]
+
+    query = db.query(*columns).filter(model.extension == extension)
+    if trunk is not None:
+        query = query.filter(model.trunk_id == trunk)
+    totals: Dict[str, Any] = {}
+    for lower, upper in ranges:
+        row = query.filter(*_bucket_range(model, lower, upper)).one()
+        for name, value in row._mapping.items():
+            value = int(value or 0)
+            totals[name] = max(totals.get(name, 0), value) if name == "max_duration" else totals.get(name, 0) + value
+    return totals
+
+
+def histogram_percentile(counts: List[int], max_duration: int, q: float) -> float:
+    """Approximate duration percentile, interpolated inside the histogram bucket"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    lower = 0
+    cumulative = 0
+    for index, count in enumerate(counts):
+        bound = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else max_duration
+        upper = max(lower, min(bound, max_duration))
+        if count and cumulative + count >= rank:
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = upper
+    return float(max_duration)
+
+
+def rollup_stats(
+    db: Session,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    extension: Optional[str] = None,
+    trunk: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Same result as cdr_stats.cdr_stats(), from the rollups: an extension
+    matches by its endpoint on channel or dstchannel in both.
+    Date scoping has hour precision, percentiles are approximate."""
+    now = now or datetime.utcnow()
+    today_start = floor_day(now)
+    since = {
+        "calls_today": today_start,
+        "calls_this_week": today_start - timedelta(days=now.weekday()),
+        "calls_this_month": today_start.replace(day=1),
+    }
+
+    day_ranges, hour_ranges = _rollup_ranges(date_from, date_to)
+    totals: Dict[str, int] = {}
+    for model, ranges in ((CDRRollupDaily, day_ranges), (CDRRollupHourly, hour_ranges)):
+        if not ranges:
+            continue
+        part = _sum_rollup(db, model, ranges, extension or "", trunk, since)
+        for name, value in part.items():
+            totals[name] = max(totals.get(name, 0), value) if name == "max_duration" else totals.get(name, 0) + value
+
+    total_calls = totals.get("total_calls", 0)
+    billed_calls = totals.get("billed_calls", 0)
+    histogram = [totals.get(name, 0) for name in HISTOGRAM_COLUMNS]
+    max_duration = totals.get("max_duration", 0)
+    return {
+        "total_calls": total_calls,
+        "answered_calls": totals.get("answered_calls", 0),
+        "missed_calls": totals.get("missed_calls", 0),
+        "busy_calls": totals.get("busy_calls", 0),
+        "failed_calls": totals.get("failed_calls", 0),
+        "total_duration": totals.get("total_duration", 0),
+        "total_billsec": totals.get("total_billsec", 0),
+        "avg_duration": round(totals.get("total_duration", 0) / total_calls, 1) if total_calls else 0.0,
+        "avg_billsec": round(totals.get("total_billsec", 0) / billed_calls, 1) if billed_calls else 0.0,
+        "p50_duration": round(histogram_percentile(histogram, max_duration, 0.5), 1),
+        "p95_duration": round(histogram_percentile(histogram, max_duration, 0.95), 1),
+        "calls_today": totals.get("calls_today", 0),
+        "calls_this_week": totals.get("calls_this_week", 0),
+        "calls_this_month": totals.get("calls_this_month", 0),
+    }
+
+
+def trunk_call_counts(db: Session, trunk_id: int, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Today's and this week's calls of a trunk from the daily rollup"""
+    now = now or datetime.utcnow()
+    today_start = floor_day(now)
+    week_start = today_start - timedelta(days=today_start.weekday())
+    model = CDRRollupDaily
+    row = db.query(
+        func.coalesce(func.sum(model.calls).filter(model.bucket >= today_start), 0).label("calls_today"),
+        func.coalesce(func.sum(model.calls), 0).label("calls_week"),
+        func.coalesce(func.sum(model.calls).filter(model.bucket >= today_start, model.direction == "inbound"), 0).label("inbound_today"),
+        func.coalesce(func.sum(model.calls).filter(model.bucket >= today_start, model.direction == "outbound"), 0).label("outbound_today"),
+    ).filter(
+        model.extension == "",
+        model.trunk_id == trunk_id,
+        model.bucket >= week_start,
+    ).one()
+    return {name: int(value) for name, value in row._mapping.items()}
@@ -0,0 +1,107 @@
+"""
+CDR statistics
+All call statistics in one aggregate pass over the cdr table, using
+conditional aggregates (COUNT(*) FILTER (WHERE ...)) instead of one query per
+number. Scoped by date range, extension and trunk; used by /api/cdr/stats and
+meant to back wallboards.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from database import CDR
+
+
+def trunk_channel_pattern(trunk_id: int) -> str:
+    """LIKE pattern for the channels of a trunk endpoint ('PJSIP/trunk-ep-3-0000002b')"""
+    return f"PJSIP/trunk-ep-{int(trunk_id)}-%"
+
+
+def extension_channel_pattern(extension: str) -> str:
+    """LIKE pattern for the channels of an extension's endpoint ('PJSIP/1001-0000002a')"""
+    return f"PJSIP/{extension}-%"
+
+
+def cdr_scope(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    extension: Optional[str] = None,
+    trunk: Optional[int] = None,
+) -> List[Any]:
+    """WHERE conditions restricting the cdr table to a date range, extension and trunk"""
+    conditions = []
+    if date_from:
+        conditions.append(CDR.call_date >= date_from)
+    if date_to:
+        conditions.append(CDR.call_date <= date_to)
+    if extension:
+        # The extension's endpoint on either leg, like the rollups count it -
+        # src/dst hold the dialed DID of inbound calls, not the extension
+        pattern = extension_channel_pattern(extension)
+        conditions.append(or_(CDR.channel.like(pattern), CDR.dstchannel.like(pattern)))
+    if trunk is not None:
+        pattern = trunk_channel_pattern(trunk)
+        conditions.append(or_(CDR.channel.like(pattern), CDR.dstchannel.like(pattern)))
+    return conditions
+
+
+def cdr_stats(
+    db: Session,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    extension: Optional[str] = None,
+    trunk: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Totals, per-disposition counts, durations, duration percentiles and
+    today/week/month counts of the scoped CDRs in a single query"""
+    now = now or datetime.utcnow()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_start = today_start - timedelta(days=now.weekday())
+    month_start = today_start.replace(day=1)
+
+    columns = [
+        func.count().label("total_calls"),
+        func.count().filter(CDR.disposition == 'ANSWERED').label("answered_calls"),
+        func.count().filter(CDR.disposition == 'NO ANSWER').label("missed_calls"),
+        func.count().filter(CDR.disposition == 'BUSY').label("busy_calls"),
+        func.count().filter(CDR.disposition == 'FAILED').label("failed_calls"),
+        func.coalesce(func.sum(CDR.duration), 0).label("total_duration"),
+        func.coalesce(func.sum(CDR.billsec), 0).label("total_billsec"),
+        func.avg(CDR.duration).label("avg_duration"),
+        func.avg(CDR.billsec).filter(CDR.billsec > 0).label("avg_billsec"),
+        func.count().filter(CDR.call_date >= today_start).label("calls_today"),
+        func.count().filter(CDR.call_date >= week_start).label("calls_this_week"),
+        func.count().filter(CDR.call_date >= month_start).label("calls_this_month"),
+    ]
+    # Ordered-set aggregates are PostgreSQL only
+    percentiles = db.get_bind().dialect.name == "postgresql"
+    if percentiles:
+        columns += [
+            func.percentile_cont(0.5).within_group(CDR.duration).label("p50_duration"),
+            func.percentile_cont(0.95).within_group(CDR.duration).label("p95_duration"),
+        ]
+
+    row = db.query(*columns).filter(*cdr_scope(date_from, date_to, extension, trunk)).one()
+
+    def rounded(value) -> float:
+        return round(float(value or 0), 1)
+
+    return {
+        "total_calls": row.total_calls,
+        "answered_calls": row.answered_calls,
+        "missed_calls": row.missed_calls,
+        "busy_calls": row.busy_calls,
+        "failed_calls": row.failed_calls,
+        "total_duration": int(row.total_duration),
+        "total_billsec": int(row.total_billsec),
+        "avg_duration": rounded(row.avg_duration),
+        "avg_billsec": rounded(row.avg_billsec),
+        "p50_duration": rounded(row.p50_duration) if percentiles else None,
+        "p95_duration": rounded(row.p95_duration) if percentiles else None,
+        "calls_today": row.calls_today,
+        "calls_this_week": row.calls_this_week,
+        "calls_this_month": row.calls_this_month,
+    }
@@ -0,0 +1,181 @@
+"""
+Batched CDR Writer
+Buffers completed calls and persists them with multi-row inserts off the
+event loop. Flushes on a size or time threshold, retries with backoff while
+the database is unavailable and flushes what is left on shutdown. A batch
+rejected for its data is written row by row, so only the offending CDR is
+dropped (and logged) instead of blocking every later one.
+The hourly/daily CDR rollups are updated in the same transaction.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError
+
+from database import engine, CDR
+from cdr_rollups import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+CDR_BATCH_SIZE = int(os.getenv("CDR_BATCH_SIZE", "200"))
+CDR_FLUSH_INTERVAL = float(os.getenv("CDR_FLUSH_INTERVAL", "2"))
+# Upper bound for rows held in memory while the database is down
+CDR_MAX_BUFFER = int(os.getenv("CDR_MAX_BUFFER", "50000"))
+RETRY_MAX_DELAY = 60
+
+
+def is_transient(error: Exception) -> bool:
+    """Database unreachable or connection lost - worth retrying the same rows"""
+    if isinstance(error, (OperationalError, InterfaceError, DisconnectionError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class CDRWriter:
+    def __init__(self):
+        self._buffer: deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        # Set by stop(), ends a retry backoff early
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+
+        # Counters
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        self.last_flush: Optional[datetime] = None
+
+    def submit(self, row: Dict[str, Any]):
+        """Queue one CDR row (column name -> value). Never blocks."""
+        self._buffer.append(row)
+        self.submitted += 1
+        self._enforce_cap()
+        if len(self._buffer) >= CDR_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._running = True
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run(), name="cdr-writer")
+            logger.info(f"CDR writer started (batch {CDR_BATCH_SIZE}, interval {CDR_FLUSH_INTERVAL}s)")
+
+    async def stop(self):
+        """Stop the flush loop and write everything that is still buffered."""
+        self._running = False
+        self._wakeup.set()
+        self._stopping.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._buffer and not await self.flush():
+            logger.error(f"CDR writer stopped with {len(self._buffer)} unsaved CDRs: {self.last_error}")
+        logger.info("CDR writer stopped")
+
+    async def _run(self):
+        delay = 0
+        while self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=CDR_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if await self.flush():
+                delay = 0
+                continue
+
+            # Database unavailable - keep the rows and back off
+            delay = min(RETRY_MAX_DELAY, max(1, delay * 2))
+            logger.warning(f"CDR flush failed, retrying in {delay}s ({len(self._buffer)} buffered): {self.last_error}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                break
+
+    async def flush(self) -> bool:
+        """Write all buffered rows in batches. Returns False if a batch failed."""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(CDR_BATCH_SIZE, len(self._buffer)))]
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                if is_transient(e):
+                    # Put the batch back in front, in original order
+                    self._buffer.extendleft(reversed(batch))
+                    self._enforce_cap()
+                    return False
+                if not await self._write_rows(batch):
+                    return False
+                continue
+            self.written += len(batch)
+            self.batches += 1
+            self.last_flush = datetime.utcnow()
+            logger.info(f"💾 {len(batch)} CDR(s) saved")
+        return True
+
+    async def _write_rows(self, rows: List[Dict[str, Any]]) -> bool:
+        """Fallback for a batch with a bad row: one transaction per row, rows the
+        database rejects are logged and dropped. Returns False if the database
+        became unavailable (the unwritten rows are back in the buffer)."""
+        for i, row in enumerate(rows):
+            try:
+                await asyncio.to_thread(self._write_batch, [row])
+            except Exception as e:
+                self.last_error = str(e)
+                if is_transient(e):
+                    self._buffer.extendleft(reversed(rows[i:]))
+                    self._enforce_cap()
+                    return False
+                self.rejected += 1
+                logger.error(f"CDR rejected by the database, dropped: {e.__class__.__name__}: {e} - {row}")
+                continue
+            self.written += 1
+        self.last_flush = datetime.utcnow()
+        return True
+
+    def _write_batch(self, rows: List[Dict[str, Any]]):
+        """One transaction per batch; executemany of a Core insert is sent as
+        multi-row INSERT ... VALUES statements by SQLAlchemy."""
+        with engine.begin() as conn:
+            conn.execute(insert(CDR.__table__), rows)
+            apply_rollups(conn, rows)
+
+    def _enforce_cap(self):
+        while len(self._buffer) > CDR_MAX_BUFFER:
+            self._buffer.popleft()
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.error(f"CDR buffer full ({CDR_MAX_BUFFER}), {self.dropped} CDRs dropped so far")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "buffered": len(self._buffer),
+            "submitted": self.submitted,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+            "last_flush": self.last_flush.isoformat() if self.last_flush else None,
+        }
+
+
+# Singleton instance
+cdr_writer = CDRWriter()
@@ -0,0 +1,110 @@
+"""
+Config output
+Shared write path of the generated Asterisk config files. The rendered text
+is hashed and only written when it differs from the file on disk, and a
+reload is only needed while the written hash differs from the one Asterisk
+last loaded. So an edit that renders the same config costs neither a write
+nor a reload (a pjsip reload re-qualifies every contact).
+
+Per file the state keeps the generator and hash of the last write (pending)
+and the hash of the last successful reload (applied), in CONFIG_STATE_PATH
+next to the config files.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CONFIG_STATE_PATH = os.getenv("CONFIG_STATE_PATH", "/etc/asterisk/custom/.config_state.json")
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _load_state() -> Dict[str, Any]:
+    try:
+        with open(CONFIG_STATE_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+@contextmanager
+def _locked_state():
+    """Read-modify-write of the state file, serialized across worker processes"""
+    os.makedirs(os.path.dirname(CONFIG_STATE_PATH), exist_ok=True)
+    with open(CONFIG_STATE_PATH + ".lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = _load_state()
+        yield state
+        tmp_path = CONFIG_STATE_PATH + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, CONFIG_STATE_PATH)
+
+
+def write_config(path: str, content: str, generator: str) -> bool:
+    """Write a generated config file unless it already has this content.
+    Returns True if the file was written."""
+    digest = content_hash(content)
+    with _locked_state() as state:
+        entry = state.setdefault(path, {})
+        if file_hash(path) == digest:
+            # Unchanged - but a file that was never reloaded stays pending
+            entry.setdefault('pending', digest)
+            entry.setdefault('generator', generator)
+            logger.info(f"{os.path.basename(path)} unchanged, not written")
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        entry.update({
+            'pending': digest,
+            'generator': generator,
+            'written_at': datetime.utcnow().isoformat(),
+        })
+    return True
+
+
+def needs_reload(path: str) -> bool:
+    """Whether the file on disk differs from what Asterisk last loaded"""
+    entry = _load_state().get(path)
+    if not entry or 'applied' not in entry:
+        return True
+    return file_hash(path) != entry['applied']
+
+
+def mark_applied(path: str, digest: Optional[str]):
+    """Record that Asterisk loaded the file with this hash after a successful
+    reload. The caller reads the hash before issuing the reload, so a write
+    landing during the reload stays pending instead of counting as loaded."""
+    with _locked_state() as state:
+        entry = state.setdefault(path, {})
+        entry['applied'] = digest
+        entry['applied_at'] = datetime.utcnow().isoformat()
+
+
+def config_state() -> Dict[str, Any]:
+    """Per config file: generator, pending/applied hash and timestamps"""
+    state = _load_state()
+    for path, entry in state.items():
+        entry['needs_reload'] = file_hash(path) != entry.get('applied')
+    return state
@@ -0,0 +1,88 @@
+"""
+Config snapshot
+Everything the Asterisk config generators read, loaded in one session:
+one query per table, ring group members and IVR options with selectinload
+instead of one lazy load per group/menu while rendering. The rows are
+detached from the session, so a generator that touches anything not loaded
+here fails loudly instead of querying behind the snapshot's back.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
+
+from sqlalchemy.orm import Session, selectinload
+
+from database import (
+    SessionLocal, SIPPeer, SIPTrunk, SystemSettings, VoicemailMailbox,
+    InboundRoute, CallForward, RingGroup, IVRMenu,
+)
+from pjsip_config import DEFAULT_CODECS
+
+logger = logging.getLogger(__name__)
+
+SMTP_KEYS = ["smtp_host", "smtp_port", "smtp_tls", "smtp_user", "smtp_password", "smtp_from"]
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    peers: Tuple[SIPPeer, ...]
+    trunks: Tuple[SIPTrunk, ...]
+    # Only enabled routes and forwards end up in the dialplan. Before the
+    # reload scheduler, a ring group or IVR save rendered all of them, which
+    # put disabled DIDs back into from-trunk until the next route save.
+    routes: Tuple[InboundRoute, ...]
+    forwards: Tuple[CallForward, ...]
+    mailboxes: Tuple[VoicemailMailbox, ...]
+    ring_groups: Tuple[RingGroup, ...]
+    ivr_menus: Tuple[IVRMenu, ...]
+    settings: Mapping[str, str]
+    loaded_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def global_codecs(self) -> str:
+        return self.settings.get("global_codecs") or DEFAULT_CODECS
+
+    @property
+    def whitelist_ips(self) -> Tuple[str, ...]:
+        value = self.settings.get("ip_whitelist")
+        return tuple(json.loads(value)) if value else ()
+
+    @property
+    def acl_enabled(self) -> bool:
+        """Whitelist switched on and not empty. This is the rule the whitelist
+        endpoint always used for pjsip.conf and acl.conf. Peer, trunk and codec
+        saves used to check only the switch, which made pjsip.conf reference
+        the registration-whitelist ACL while acl.conf did not define it."""
+        return self.settings.get("ip_whitelist_enabled") == "true" and len(self.whitelist_ips) > 0
+
+    @property
+    def smtp_settings(self) -> Dict[str, str]:
+        return {key: self.settings.get(key) or "" for key in SMTP_KEYS}
+
+
+def load_snapshot(db: Session) -> ConfigSnapshot:
+    """Load all config generator input from db and detach it"""
+    snapshot = ConfigSnapshot(
+        peers=tuple(db.query(SIPPeer).order_by(SIPPeer.id).all()),
+        trunks=tuple(db.query(SIPTrunk).order_by(SIPTrunk.id).all()),
+        routes=tuple(db.query(InboundRoute).filter(InboundRoute.enabled == True).order_by(InboundRoute.id).all()),
+        forwards=tuple(db.query(CallForward).filter(CallForward.enabled == True).order_by(CallForward.id).all()),
+        mailboxes=tuple(db.query(VoicemailMailbox).order_by(VoicemailMailbox.id).all()),
+        ring_groups=tuple(db.query(RingGroup).options(selectinload(RingGroup.members)).order_by(RingGroup.id).all()),
+        ivr_menus=tuple(db.query(IVRMenu).options(selectinload(IVRMenu.options)).order_by(IVRMenu.id).all()),
+        settings=MappingProxyType({s.key: s.value for s in db.query(SystemSettings).all()}),
+    )
+    db.expunge_all()
+    return snapshot
+
+
+def take_snapshot() -> ConfigSnapshot:
+    """load_snapshot in its own session (blocking)"""
+    db = SessionLocal()
+    try:
+        return load_snapshot(db)
+    finally:
+        db.close()
@@ -4,7 +4,7 @@ SQLAlchemy ORM setup
 """
 
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -212,6 +212,11 @@ class CallForward(Base):
 
 class CDR(Base):
     __tablename__ = "cdr"
+    # Keyset pagination: newest first, optionally by disposition
+    __table_args__ = (
+        Index("ix_cdr_call_date_id", "call_date", "id"),
+        Index("ix_cdr_disposition_call_date_id", "disposition", "call_date", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     call_date = Column(DateTime, default=datetime.utcnow, index=True)
@@ -229,6 +234,43 @@ class CDR(Base):
     amaflags = Column(Integer)
     uniqueid = Column(String(150))
     userfield = Column(String(255))
+    accountcode = Column(String(80))
+    linkedid = Column(String(150), index=True)
+
+
+class CDRRollupMixin:
+    """Pre-aggregated CDRs per time bucket. Every CDR is counted once in the
+    extension '' rows and once more for each local extension (PJSIP endpoint
+    on channel or dstchannel) taking part in the call. trunk_id 0 = no trunk.
+    Durations are also kept as a histogram (upper bounds in seconds) for percentiles."""
+    bucket = Column(DateTime, primary_key=True)
+    extension = Column(String(80), primary_key=True, default="")
+    trunk_id = Column(Integer, primary_key=True, default=0)
+    direction = Column(String(10), primary_key=True)  # internal | inbound | outbound
+    disposition = Column(String(45), primary_key=True)
+    calls = Column(Integer, nullable=False, default=0)
+    total_duration = Column(Integer, nullable=False, default=0)
+    total_billsec = Column(Integer, nullable=False, default=0)
+    billed_calls = Column(Integer, nullable=False, default=0)  # calls with billsec > 0
+    max_duration = Column(Integer, nullable=False, default=0)
+    dur_10 = Column(Integer, nullable=False, default=0)
+    dur_30 = Column(Integer, nullable=False, default=0)
+    dur_60 = Column(Integer, nullable=False, default=0)
+    dur_120 = Column(Integer, nullable=False, default=0)
+    dur_300 = Column(Integer, nullable=False, default=0)
+    dur_600 = Column(Integer, nullable=False, default=0)
+    dur_1800 = Column(Integer, nullable=False, default=0)
+    dur_inf = Column(Integer, nullable=False, default=0)
+
+
+class CDRRollupHourly(CDRRollupMixin, Base):
+    __tablename__ = "cdr_rollup_hourly"
+    __table_args__ = (Index("ix_cdr_rollup_hourly_extension_bucket", "extension", "bucket"),)
+
+
+class CDRRollupDaily(CDRRollupMixin, Base):
+    __tablename__ = "cdr_rollup_daily"
+    __table_args__ = (Index("ix_cdr_rollup_daily_extension_bucket", "extension", "bucket"),)
 
 
 class VoicemailMailbox(Base):
@@ -256,6 +298,12 @@ class SystemSettings(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Keyset pagination: newest first, optionally by action or user
+    __table_args__ = (
+        Index("ix_audit_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_audit_logs_action_timestamp_id", "action", "timestamp", "id"),
+        Index("ix_audit_logs_username_timestamp_id", "username", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
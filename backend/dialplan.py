@@ -7,6 +7,7 @@ import logging
 import subprocess
 from typing import List, Optional
 from database import InboundRoute, CallForward, VoicemailMailbox, SIPPeer, SIPTrunk, RingGroup, IVRMenu
+from config_output import write_config, file_hash, needs_reload, mark_applied
 
 logger = logging.getLogger(__name__)
 
@@ -143,38 +144,57 @@ def _generate_ring_group_logic(group: RingGroup) -> str:
     return "\n".join(lines)
 
 
+def _generate_outbound_dial(ext: str, route: InboundRoute, pai: Optional[str], trunk: Optional[SIPTrunk]) -> str:
+    """Outbound dial block (label out-<ext>) via the trunk of the extension's route"""
+    tid = route.trunk_id
+    lines = [f"\n same => n(out-{ext}),NoOp(Outbound via trunk-ep-{tid} with CID {route.did})"]
+    if trunk and trunk.provider == "telekom_allip":
+        # Telekom All-IP: CallerID must be the Anschlussnummer (from_user), not the DID
+        allip_num = getattr(trunk, "from_user", None) or route.did
+        lines.append(f" same => n,Set(CALLERID(num)={allip_num})")
+        lines.append(f" same => n,Set(PJSIP_HEADER(add,P-Preferred-Identity)=<sip:{allip_num}@tel.t-online.de>)")
+    else:
+        lines.append(f" same => n,Set(CALLERID(num)={route.did})")
+        if pai:
+            pai_domain = trunk.sip_server if trunk else "localhost"
+            lines.append(f" same => n,Set(PJSIP_HEADER(add,P-Asserted-Identity)=<sip:{pai}@{pai_domain}>)")
+    lines.append(f" same => n,Dial(PJSIP/${{EXTEN}}@trunk-ep-{tid},120,tT)")
+    lines.append(" same => n,Hangup()")
+    return "\n".join(lines) + "\n"
+
+
 def _generate_ivr_context(menu: IVRMenu) -> str:
-    ctx = f"[ivr-{menu.id}]\n"
-    ctx += "exten => s,1,NoOp(IVR Menu)\n"
-    ctx += " same => n,Set(IVR_TRIES=${IF($[\"${IVR_TRIES}\"=\"\"]?0:${IVR_TRIES})})\n"
-    ctx += f" same => n,Set(IVR_MAX={menu.retries or 0})\n"
-    ctx += " same => n,Answer()\n"
-    ctx += " same => n,Wait(0.5)\n"
+    parts = [f"[ivr-{menu.id}]\n"]
+    parts.append("exten => s,1,NoOp(IVR Menu)\n")
+    parts.append(" same => n,Set(IVR_TRIES=${IF($[\"${IVR_TRIES}\"=\"\"]?0:${IVR_TRIES})})\n")
+    parts.append(f" same => n,Set(IVR_MAX={menu.retries or 0})\n")
+    parts.append(" same => n,Answer()\n")
+    parts.append(" same => n,Wait(0.5)\n")
     if menu.prompt:
-        ctx += f" same => n,Background({menu.prompt})\n"
-    ctx += f" same => n,WaitExten({menu.timeout_seconds or 5})\n"
+        parts.append(f" same => n,Background({menu.prompt})\n")
+    parts.append(f" same => n,WaitExten({menu.timeout_seconds or 5})\n")
     for opt in sorted(menu.options, key=lambda o: o.position):
-        ctx += f"exten => {opt.digit},1,NoOp(IVR Option {opt.digit} -> {opt.destination})\n"
-        ctx += f" same => n,Goto(internal,{opt.destination},1)\n"
+        parts.append(f"exten => {opt.digit},1,NoOp(IVR Option {opt.digit} -> {opt.destination})\n")
+        parts.append(f" same => n,Goto(internal,{opt.destination},1)\n")
     if menu.timeout_destination:
-        ctx += "exten => i,1,NoOp(IVR Invalid)\n"
-        ctx += " same => n,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n"
-        ctx += " same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n"
-        ctx += f" same => n,Goto(internal,{menu.timeout_destination},1)\n"
-        ctx += "exten => t,1,NoOp(IVR Timeout)\n"
-        ctx += " same => n,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n"
-        ctx += " same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n"
-        ctx += f" same => n,Goto(internal,{menu.timeout_destination},1)\n"
+        parts.append("exten => i,1,NoOp(IVR Invalid)\n")
+        parts.append(" same => n,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n")
+        parts.append(" same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n")
+        parts.append(f" same => n,Goto(internal,{menu.timeout_destination},1)\n")
+        parts.append("exten => t,1,NoOp(IVR Timeout)\n")
+        parts.append(" same => n,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n")
+        parts.append(" same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n")
+        parts.append(f" same => n,Goto(internal,{menu.timeout_destination},1)\n")
     else:
-        ctx += "exten => i,1,Playback(pbx-invalid)\n"
-        ctx += " same => n,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n"
-        ctx += " same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n"
-        ctx += " same => n,Hangup()\n"
-        ctx += "exten => t,1,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n"
-        ctx += " same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n"
-        ctx += " same => n,Hangup()\n"
-    ctx += "\n"
-    return ctx
+        parts.append("exten => i,1,Playback(pbx-invalid)\n")
+        parts.append(" same => n,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n")
+        parts.append(" same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n")
+        parts.append(" same => n,Hangup()\n")
+        parts.append("exten => t,1,Set(IVR_TRIES=$[${IVR_TRIES}+1])\n")
+        parts.append(" same => n,GotoIf($[${IVR_TRIES} <= ${IVR_MAX}]?s,1)\n")
+        parts.append(" same => n,Hangup()\n")
+    parts.append("\n")
+    return "".join(parts)
 
 
 def generate_extensions_config(routes: List[InboundRoute], forwards: Optional[List[CallForward]] = None, mailboxes: Optional[List[VoicemailMailbox]] = None, peers: Optional[List[SIPPeer]] = None, trunks: Optional[List[SIPTrunk]] = None, ring_groups: Optional[List[RingGroup]] = None, ivr_menus: Optional[List[IVRMenu]] = None) -> str:
@@ -190,7 +210,7 @@ def generate_extensions_config(routes: List[InboundRoute], forwards: Optional[Li
             trunk_map[t.id] = t
     ring_timeout_map = _build_ring_timeout_map(mailboxes or [])
 
-    config = """; Auto-generated dialplan configuration
+    parts = ["""; Auto-generated dialplan configuration
 ; Generated by Asterisk PBX GUI
 
 [general]
@@ -202,7 +222,7 @@ clearglobalvars=no
 
 [internal]
 ; Internal Extension Dialing (PJSIP)
-"""
+"""]
     # Build ring group map
     ring_group_map = {}
     if ring_groups:
@@ -218,28 +238,28 @@ clearglobalvars=no
         for g in ring_groups:
             if not g.enabled:
                 continue
-            config += f"exten => {g.extension},1,NoOp(Ring Group {g.name})\n"
-            config += f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n"
-            config += _generate_ring_group_logic(g)
-            config += "\n\n"
+            parts.append(f"exten => {g.extension},1,NoOp(Ring Group {g.name})\n")
+            parts.append(f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n")
+            parts.append(_generate_ring_group_logic(g))
+            parts.append("\n\n")
 
     # IVR menus (exact extensions)
     if ivr_menus:
         for m in ivr_menus:
             if not m.enabled:
                 continue
-            config += f"exten => {m.extension},1,NoOp(IVR {m.name})\n"
-            config += f" same => n,Goto(ivr-{m.id},s,1)\n\n"
+            parts.append(f"exten => {m.extension},1,NoOp(IVR {m.name})\n")
+            parts.append(f" same => n,Goto(ivr-{m.id},s,1)\n\n")
 
     # Internal extension dialing pattern
-    config += "exten => _1XXX,1,NoOp(Internal Call from ${CALLERID(all)} to ${EXTEN})\n"
-    config += " same => n,Set(CALLERID(name)=${CALLERID(name)})\n"
+    parts.append("exten => _1XXX,1,NoOp(Internal Call from ${CALLERID(all)} to ${EXTEN})\n")
+    parts.append(" same => n,Set(CALLERID(name)=${CALLERID(name)})\n")
     # BLF hints for peers
     if peers:
         for p in peers:
             try:
                 if p.enabled and getattr(p, "blf_enabled", True):
-                    config += f"exten => {p.extension},hint,PJSIP/{p.extension}\n"
+                    parts.append(f"exten => {p.extension},hint,PJSIP/{p.extension}\n")
             except Exception:
                 continue
     # Collect extensions that need per-extension overrides (forwarding or custom ring_timeout)
@@ -249,75 +269,49 @@ clearglobalvars=no
             override_extensions.add(ext)
 
     # Add forwarding logic for internal calls (default ring_timeout 20s)
-    config += _generate_dial_logic("${EXTEN}", {}, 20)
-    config += "\n\n"
+    parts.append(_generate_dial_logic("${EXTEN}", {}, 20))
+    parts.append("\n\n")
 
     # Generate per-extension overrides
     for ext in sorted(override_extensions):
         ext_ring = ring_timeout_map.get(ext, 20)
-        config += f"; Extension {ext} - custom rules\n"
-        config += f"exten => {ext},1,NoOp(Call to {ext} with forwarding)\n"
-        config += f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n"
-        config += _generate_dial_logic(ext, fwd_map, ext_ring)
-        config += "\n\n"
+        parts.append(f"; Extension {ext} - custom rules\n")
+        parts.append(f"exten => {ext},1,NoOp(Call to {ext} with forwarding)\n")
+        parts.append(f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n")
+        parts.append(_generate_dial_logic(ext, fwd_map, ext_ring))
+        parts.append("\n\n")
 
     # === Outbound calling ===
     if outbound_map:
-        config += "; === Outbound calling via assigned trunks ===\n"
+        # Jump table and per-extension dial blocks are the same for both patterns, render them once
+        outbound_jumps = "".join(
+            f' same => n,GotoIf($["${{CHANNEL(endpoint)}}x" = "{ext}x"]?out-{ext})\n' for ext in outbound_map
+        )
+        outbound_dials = "".join(
+            _generate_outbound_dial(ext, info["route"], info["pai"], trunk_map.get(info["route"].trunk_id))
+            for ext, info in outbound_map.items()
+        )
+
+        parts.append("; === Outbound calling via assigned trunks ===\n")
         # Match external numbers: 0X. (national/international German dialing)
-        config += "exten => _0X.,1,NoOp(Outbound call from ${CHANNEL(endpoint)} to ${EXTEN})\n"
-        for ext in outbound_map:
-            config += f' same => n,GotoIf($["${{CHANNEL(endpoint)}}x" = "{ext}x"]?out-{ext})\n'
-        config += " same => n,NoOp(No outbound route for this extension)\n"
-        config += " same => n,Playback(ss-noservice)\n"
-        config += " same => n,Hangup()\n"
-        for ext, info in outbound_map.items():
-            route = info["route"]
-            pai = info["pai"]
-            tid = route.trunk_id
-            trunk = trunk_map.get(tid)
-            config += f"\n same => n(out-{ext}),NoOp(Outbound via trunk-ep-{tid} with CID {route.did})\n"
-            if trunk and trunk.provider == "telekom_allip":
-                # Telekom All-IP: CallerID must be the Anschlussnummer (from_user), not the DID
-                allip_num = getattr(trunk, "from_user", None) or route.did
-                config += f" same => n,Set(CALLERID(num)={allip_num})\n"
-                config += f" same => n,Set(PJSIP_HEADER(add,P-Preferred-Identity)=<sip:{allip_num}@tel.t-online.de>)\n"
-            else:
-                config += f" same => n,Set(CALLERID(num)={route.did})\n"
-                if pai:
-                    pai_domain = trunk.sip_server if trunk else "localhost"
-                    config += f" same => n,Set(PJSIP_HEADER(add,P-Asserted-Identity)=<sip:{pai}@{pai_domain}>)\n"
-            config += f" same => n,Dial(PJSIP/${{EXTEN}}@trunk-ep-{tid},120,tT)\n"
-            config += f" same => n,Hangup()\n"
-        config += "\n"
+        parts.append("exten => _0X.,1,NoOp(Outbound call from ${CHANNEL(endpoint)} to ${EXTEN})\n")
+        parts.append(outbound_jumps)
+        parts.append(" same => n,NoOp(No outbound route for this extension)\n")
+        parts.append(" same => n,Playback(ss-noservice)\n")
+        parts.append(" same => n,Hangup()\n")
+        parts.append(outbound_dials)
+        parts.append("\n")
 
         # Also match + prefixed numbers (international with +)
-        config += "; International with + prefix\n"
-        config += "exten => _+X.,1,NoOp(Outbound intl call from ${CHANNEL(endpoint)} to ${EXTEN})\n"
-        for ext in outbound_map:
-            config += f' same => n,GotoIf($["${{CHANNEL(endpoint)}}x" = "{ext}x"]?out-{ext})\n'
-        config += " same => n,Playback(ss-noservice)\n"
-        config += " same => n,Hangup()\n"
-        for ext, info in outbound_map.items():
-            route = info["route"]
-            pai = info["pai"]
-            tid = route.trunk_id
-            trunk = trunk_map.get(tid)
-            config += f"\n same => n(out-{ext}),NoOp(Outbound via trunk-ep-{tid} with CID {route.did})\n"
-            if trunk and trunk.provider == "telekom_allip":
-                allip_num = getattr(trunk, "from_user", None) or route.did
-                config += f" same => n,Set(CALLERID(num)={allip_num})\n"
-                config += f" same => n,Set(PJSIP_HEADER(add,P-Preferred-Identity)=<sip:{allip_num}@tel.t-online.de>)\n"
-            else:
-                config += f" same => n,Set(CALLERID(num)={route.did})\n"
-                if pai:
-                    pai_domain = trunk.sip_server if trunk else "localhost"
-                    config += f" same => n,Set(PJSIP_HEADER(add,P-Asserted-Identity)=<sip:{pai}@{pai_domain}>)\n"
-            config += f" same => n,Dial(PJSIP/${{EXTEN}}@trunk-ep-{tid},120,tT)\n"
-            config += f" same => n,Hangup()\n"
-        config += "\n"
-
-    config += """; Voicemail access - dial *98 to check voicemail
+        parts.append("; International with + prefix\n")
+        parts.append("exten => _+X.,1,NoOp(Outbound intl call from ${CHANNEL(endpoint)} to ${EXTEN})\n")
+        parts.append(outbound_jumps)
+        parts.append(" same => n,Playback(ss-noservice)\n")
+        parts.append(" same => n,Hangup()\n")
+        parts.append(outbound_dials)
+        parts.append("\n")
+
+    parts.append("""; Voicemail access - dial *98 to check voicemail
 exten => *98,1,NoOp(Voicemail Access for ${CALLERID(num)})
  same => n,Answer()
  same => n,Wait(0.5)
@@ -343,10 +337,10 @@ exten => *43,1,Answer()
 
 [from-trunk]
 ; Inbound DID routing - auto-generated
-"""
+""")
 
     # Handler for providers that send DID only in To header (no user in Request-URI)
-    config += """
+    parts.append("""
 ; Extract DID from To header when Request-URI has no user part
 exten => s,1,NoOp(Inbound call with no DID in Request-URI)
  same => n,Set(TO_HDR=${PJSIP_HEADER(read,To)})
@@ -356,51 +350,51 @@ exten => s,1,NoOp(Inbound call with no DID in Request-URI)
  same => n,NoOp(Could not extract DID from To header)
  same => n,Hangup()
 
-"""
+""")
 
     if routes:
         for route in routes:
             desc = route.description or route.did
             ext = route.destination_extension
-            config += f"\n; {desc}\n"
-            config += f"exten => {route.did},1,NoOp(Inbound call to DID {route.did})\n"
-            config += f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n"
+            parts.append(f"\n; {desc}\n")
+            parts.append(f"exten => {route.did},1,NoOp(Inbound call to DID {route.did})\n")
+            parts.append(f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n")
             # If destination is a ring group, route to queue
             rg = ring_group_map.get(ext)
             ivr = ivr_map.get(ext)
             if ivr and ivr.enabled:
-                config += " same => n,Answer()\n"
-                config += " same => n,Wait(0.5)\n"
-                config += f" same => n,Goto(ivr-{ivr.id},s,1)\n"
+                parts.append(" same => n,Answer()\n")
+                parts.append(" same => n,Wait(0.5)\n")
+                parts.append(f" same => n,Goto(ivr-{ivr.id},s,1)\n")
             elif rg and rg.enabled:
-                config += " same => n,Answer()\n"
-                config += " same => n,Wait(0.5)\n"
-                config += _generate_ring_group_logic(rg)
+                parts.append(" same => n,Answer()\n")
+                parts.append(" same => n,Wait(0.5)\n")
+                parts.append(_generate_ring_group_logic(rg))
             else:
                 ext_ring = ring_timeout_map.get(ext, 20)
-                config += _generate_dial_logic(ext, fwd_map, ext_ring, early_answer=True)
-            config += "\n"
+                parts.append(_generate_dial_logic(ext, fwd_map, ext_ring, early_answer=True))
+            parts.append("\n")
     else:
-        config += """
+        parts.append("""
 ; No inbound routes configured
 exten => _X.,1,NoOp(Unrouted inbound call to ${EXTEN})
  same => n,Hangup()
-"""
+""")
 
     # Catch-all for unmatched DIDs
-    config += """
+    parts.append("""
 ; Catch-all for unmatched inbound calls
 exten => _[+0-9].,1,NoOp(Unmatched inbound DID ${EXTEN})
  same => n,Hangup()
-"""
+""")
 
     # Append IVR contexts
     if ivr_menus:
         for m in ivr_menus:
             if m.enabled:
-                config += _generate_ivr_context(m)
+                parts.append(_generate_ivr_context(m))
 
-    return config
+    return "".join(parts)
 
 
 def write_extensions_config(routes: List[InboundRoute], forwards: Optional[List[CallForward]] = None, mailboxes: Optional[List[VoicemailMailbox]] = None, peers: Optional[List[SIPPeer]] = None, trunks: Optional[List[SIPTrunk]] = None, ring_groups: Optional[List[RingGroup]] = None, ivr_menus: Optional[List[IVRMenu]] = None) -> bool:
@@ -408,12 +402,8 @@ def write_extensions_config(routes: List[InboundRoute], forwards: Optional[List[
     try:
         config_content = generate_extensions_config(routes, forwards, mailboxes, peers, trunks, ring_groups, ivr_menus)
 
-        os.makedirs(os.path.dirname(EXTENSIONS_CONFIG_PATH), exist_ok=True)
-
-        with open(EXTENSIONS_CONFIG_PATH, 'w') as f:
-            f.write(config_content)
-
-        logger.info(f"extensions.conf written with {len(routes)} inbound routes")
+        if write_config(EXTENSIONS_CONFIG_PATH, config_content, "dialplan.write_extensions_config"):
+            logger.info(f"extensions.conf written with {len(routes)} inbound routes")
         return True
 
     except Exception as e:
@@ -423,16 +413,21 @@ def write_extensions_config(routes: List[InboundRoute], forwards: Optional[List[
 
 def reload_dialplan() -> bool:
     """Reload Asterisk dialplan"""
+    digest = file_hash(EXTENSIONS_CONFIG_PATH)
+    if not needs_reload(EXTENSIONS_CONFIG_PATH):
+        logger.info("extensions.conf already loaded, reload skipped")
+        return True
     try:
         result = subprocess.run(
             ['docker', 'exec', 'pbx_asterisk', 'sh', '-c',
-             'cp /etc/asterisk/custom/extensions.conf /etc/asterisk/extensions.conf && asterisk -rx "dialplan reload"'],
+             '{ [ -L /etc/asterisk/extensions.conf ] || cp /etc/asterisk/custom/extensions.conf /etc/asterisk/extensions.conf; } && asterisk -rx "dialplan reload"'],
             capture_output=True,
             text=True,
             timeout=10
         )
 
         if result.returncode == 0:
+            mark_applied(EXTENSIONS_CONFIG_PATH, digest)
             logger.info("Asterisk dialplan reloaded successfully")
             return True
         else:
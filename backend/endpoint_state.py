@@ -0,0 +1,169 @@
+"""
+Endpoint state store
+In-memory PJSIP endpoint/contact state, seeded at AMI login and kept current
+from DeviceStateChange, ContactStatus and PeerStatus events, so the dashboard
+does not have to poll Asterisk on every request.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# DeviceStateChange reports the enum name, PJSIPShowEndpoints the display text
+DEVICE_STATE_TEXT = {
+    'UNKNOWN': 'Unknown',
+    'NOT_INUSE': 'Not in use',
+    'INUSE': 'In use',
+    'BUSY': 'Busy',
+    'INVALID': 'Invalid',
+    'UNAVAILABLE': 'Unavailable',
+    'RINGING': 'Ringing',
+    'RINGINUSE': 'Ring+Inuse',
+    'ONHOLD': 'On Hold',
+}
+
+
+def endpoint_from_device(device: str) -> str:
+    """'PJSIP/1001' -> '1001'"""
+    return device.split('/', 1)[1] if '/' in device else device
+
+
+def endpoint_from_aor(aor: str) -> str:
+    """Peers use the extension as AOR, trunks trunk-aor-<id> for endpoint trunk-ep-<id>"""
+    if aor.startswith('trunk-aor-'):
+        return 'trunk-ep-' + aor[len('trunk-aor-'):]
+    return aor
+
+
+def _rtt_ms(value: Any) -> float:
+    try:
+        return float(value) / 1000
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class EndpointState:
+    __slots__ = ('endpoint', 'device_state', 'contact_status', 'rtt', 'updated')
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.device_state = 'Unknown'
+        self.contact_status = ''
+        self.rtt = 0.0
+        self.updated = datetime.utcnow()
+
+    @property
+    def status(self) -> str:
+        # Same rule the dashboard always used for PJSIPShowEndpoints
+        return 'online' if self.device_state == 'Not in use' else 'offline'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'rtt': round(self.rtt, 1),
+        }
+
+
+class EndpointStateStore:
+    def __init__(self):
+        self._endpoints: Dict[str, EndpointState] = {}
+        self.seeded = False
+        self.last_updated: Optional[datetime] = None
+        self.last_seeded: Optional[datetime] = None
+
+    def _get(self, endpoint: str) -> EndpointState:
+        state = self._endpoints.get(endpoint)
+        if state is None:
+            state = self._endpoints[endpoint] = EndpointState(endpoint)
+        return state
+
+    def _touch(self, state: EndpointState):
+        state.updated = self.last_updated = datetime.utcnow()
+
+    def seed(self, endpoint_items: Iterable[Any], contact_items: Iterable[Any]):
+        """Replace the store with PJSIPShowEndpoints / PJSIPShowContacts results"""
+        endpoints: Dict[str, EndpointState] = {}
+        for item in endpoint_items:
+            name = item.get('ObjectName', '')
+            if name:
+                state = endpoints[name] = EndpointState(name)
+                state.device_state = item.get('DeviceState', '') or 'Unknown'
+
+        for item in contact_items:
+            name = item.get('Endpoint', '') or endpoint_from_aor(item.get('AOR', ''))
+            state = endpoints.get(name)
+            # First contact wins, like the per-endpoint lookup did before
+            if state is not None and not state.contact_status:
+                state.contact_status = item.get('Status', '')
+                state.rtt = _rtt_ms(item.get('RoundtripUsec'))
+
+        self._endpoints = endpoints
+        self.seeded = True
+        self.last_seeded = self.last_updated = datetime.utcnow()
+
+    def apply_device_state(self, device: str, state_name: str):
+        """DeviceStateChange: Device 'PJSIP/1001', State 'NOT_INUSE'"""
+        if not device.startswith('PJSIP/'):
+            return
+        state = self._get(endpoint_from_device(device))
+        state.device_state = DEVICE_STATE_TEXT.get(state_name, state_name.title())
+        self._touch(state)
+
+    def apply_contact_status(self, endpoint: str, contact_status: str, rtt_usec: Any):
+        """ContactStatus: Reachable / Unreachable / Created / Removed / Updated"""
+        if not endpoint:
+            return
+        state = self._get(endpoint)
+        state.contact_status = contact_status
+        if contact_status in ('Reachable', 'Updated', 'Created'):
+            state.rtt = _rtt_ms(rtt_usec) or state.rtt
+        else:
+            state.rtt = 0.0
+        self._touch(state)
+
+    def apply_peer_status(self, peer: str, peer_status: str):
+        """PeerStatus: Peer 'PJSIP/1001', PeerStatus 'Reachable' / 'Unreachable'"""
+        if not peer.startswith('PJSIP/'):
+            return
+        state = self._get(endpoint_from_device(peer))
+        state.contact_status = peer_status
+        if peer_status != 'Reachable':
+            state.rtt = 0.0
+        self._touch(state)
+
+    def get(self, endpoint: str) -> Optional[EndpointState]:
+        return self._endpoints.get(endpoint)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [state.to_dict() for state in self._endpoints.values()]
+
+    def dump(self) -> List[Dict[str, Any]]:
+        """Full state, for follower workers"""
+        return [
+            {
+                'endpoint': state.endpoint,
+                'device_state': state.device_state,
+                'contact_status': state.contact_status,
+                'rtt': state.rtt,
+            }
+            for state in self._endpoints.values()
+        ]
+
+    def restore(self, items: Iterable[Dict[str, Any]], last_updated: Optional[str] = None):
+        """Replace the store with a dump() from the leader worker"""
+        endpoints: Dict[str, EndpointState] = {}
+        for item in items:
+            state = endpoints[item['endpoint']] = EndpointState(item['endpoint'])
+            state.device_state = item.get('device_state', 'Unknown')
+            state.contact_status = item.get('contact_status', '')
+            state.rtt = item.get('rtt', 0.0)
+        self._endpoints = endpoints
+        self.seeded = True
+        self.last_updated = datetime.fromisoformat(last_updated) if last_updated else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'endpoints': len(self._endpoints),
+            'seeded': self.seeded,
+            'last_seeded': self.last_seeded.isoformat() if self.last_seeded else None,
+            'last_updated': self.last_updated.isoformat() if self.last_updated else None,
+        }
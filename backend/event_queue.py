@@ -0,0 +1,95 @@
+"""
+Bounded async event queue
+Decouples producers (e.g. the AMI reader) from slower consumers.
+Never blocks the producer: when full, an item is dropped according to the
+overflow policy and counted, so queues can be sized from real numbers.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# drop_oldest: discard the oldest queued item to make room (keeps the newest state)
+# drop_newest: discard the incoming item (keeps what is already queued)
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class BoundedEventQueue:
+    def __init__(self, name: str, maxsize: int, overflow: str = "drop_oldest",
+                 on_drop: Optional[Callable[[Any], None]] = None):
+        if overflow not in OVERFLOW_POLICIES:
+            logger.warning(f"Unknown overflow policy '{overflow}' for queue {name}, using drop_oldest")
+            overflow = "drop_oldest"
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.overflow = overflow
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.maxsize)
+        # Called with every dropped item, for consumers that must notice the loss
+        self.on_drop = on_drop
+
+        # Counters
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.high_watermark = 0
+
+    def put_nowait(self, item: Any) -> bool:
+        """Enqueue without waiting. Returns False if an item had to be dropped."""
+        dropped = False
+        if self._queue.full():
+            dropped = True
+            self._count_drop()
+            if self.overflow == "drop_newest":
+                if self.on_drop:
+                    self.on_drop(item)
+                return False
+            try:
+                oldest = self._queue.get_nowait()
+                if self.on_drop:
+                    self.on_drop(oldest)
+            except asyncio.QueueEmpty:
+                pass
+
+        self._queue.put_nowait(item)
+        self.enqueued += 1
+        depth = self._queue.qsize()
+        if depth > self.high_watermark:
+            self.high_watermark = depth
+        return not dropped
+
+    async def get(self) -> Any:
+        item = await self._queue.get()
+        self.dequeued += 1
+        return item
+
+    def get_nowait(self) -> Any:
+        item = self._queue.get_nowait()
+        self.dequeued += 1
+        return item
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def empty(self) -> bool:
+        return self._queue.empty()
+
+    def _count_drop(self):
+        self.dropped += 1
+        # Log the first drop and then every 1000th to avoid flooding the log
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning(
+                f"Queue '{self.name}' full ({self.maxsize}), {self.overflow}: {self.dropped} items dropped so far"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "depth": self._queue.qsize(),
+            "maxsize": self.maxsize,
+            "overflow": self.overflow,
+            "high_watermark": self.high_watermark,
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "dropped": self.dropped,
+        }
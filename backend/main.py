@@ -3,12 +3,14 @@ Asterisk PBX GUI - Backend API
 FastAPI application with Asterisk AMI integration
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncio
+import json
 import logging
 from datetime import datetime
+from typing import Optional
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +22,7 @@ logger = logging.getLogger(__name__)
 # Import our modules
 import os
 from ami_client import AsteriskAMIClient
+from ami_mirror import AMIMirror, leader_hello, publish_leader_state
 from database import engine, Base
 from routers import peers, trunks, routes, dashboard, cdr, voicemail, callforward, groups, ivr, contacts
 from routers import auth as auth_router, users as users_router
@@ -27,56 +30,158 @@ from routers import settings as settings_router
 from routers import audit as audit_router
 from routers import sip_debug as sip_debug_router
 from auth import get_password_hash, get_current_user
-from database import SessionLocal, User, SIPPeer, VoicemailMailbox, SystemSettings
-from voicemail_config import write_voicemail_config, reload_voicemail
+from database import SessionLocal, User, SIPPeer, VoicemailMailbox, SystemSettings, RingGroup
+from reload_scheduler import reload_scheduler
+from asterisk_reload import asterisk_reloader
 from email_config import write_msmtp_config
 from mqtt_client import mqtt_publisher
+from cdr_writer import cdr_writer
+from cdr_partitions import maintenance_loop as cdr_maintenance_loop
+from ws_manager import ws_manager
+from cache import response_cache
+from sip_debug import sip_debug_buffer
+from worker_bus import worker_bus, LEADER, FOLLOWER
 from version import VERSION
 
-# Global AMI client instance
+# Global AMI client instance (an AMIMirror in follower workers)
 ami_client = None
 
 
-# WebSocket connections manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+def use_ami_client(client):
+    """Set the AMI client in main and in the routers that use it"""
+    global ami_client
+    ami_client = client
+    dashboard.set_ami_client(client)
+    trunks.set_ami_client(client)
+    sip_debug_router.set_ami_client(client)
+    asterisk_reloader.set_ami_client(client)
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+async def broadcast_to_workers(message: dict, topics: Optional[dict] = None):
+    """WebSocket broadcast to this worker's clients and to those of all followers"""
+    await ws_manager.broadcast(message, topics)
+    worker_bus.publish({"type": "broadcast", "message": message, "topics": topics})
 
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to client: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected clients
-        for conn in disconnected:
-            self.disconnect(conn)
 
-manager = ConnectionManager()
+def configure_mqtt_from_db():
+    """Configure the MQTT publisher from the Home Assistant settings in the DB"""
+    db = SessionLocal()
+    try:
+        ha_settings = {}
+        for key in ["ha_enabled", "mqtt_broker", "mqtt_port", "mqtt_user", "mqtt_password"]:
+            s = db.query(SystemSettings).filter(SystemSettings.key == key).first()
+            ha_settings[key] = s.value if s else ""
+    finally:
+        db.close()
+
+    if ha_settings.get("ha_enabled") == "true" and ha_settings.get("mqtt_broker"):
+        mqtt_publisher.reconfigure(
+            broker=ha_settings["mqtt_broker"],
+            port=int(ha_settings.get("mqtt_port") or 1883),
+            user=ha_settings.get("mqtt_user", ""),
+            password=ha_settings.get("mqtt_password", ""),
+        )
+        logger.info(f"MQTT configured from DB: {ha_settings['mqtt_broker']}")
+
+
+# Background loops of the leader, cancelled on shutdown
+leader_tasks: list = []
+
+
+async def stop_leader_tasks():
+    for task in leader_tasks:
+        task.cancel()
+    await asyncio.gather(*leader_tasks, return_exceptions=True)
+    leader_tasks.clear()
+
+
+async def start_leader_services():
+    """AMI connection, CDR writer, MQTT and SIP debug polling - only in the leader worker.
+    Also called when a follower takes over from a leader that died."""
+    try:
+        configure_mqtt_from_db()
+    except Exception as e:
+        logger.warning(f"Failed to load MQTT settings from DB: {e}")
+
+    # Connect MQTT publisher if not already configured from DB settings
+    if not mqtt_publisher.connected and mqtt_publisher.enabled:
+        mqtt_publisher.connect()
+
+    client = AsteriskAMIClient()
+    use_ami_client(client)
+    client.set_broadcast_callback(broadcast_to_workers)
+    client.resync_callback = lambda: resync_call_state(client)
+    sip_debug_buffer.set_broadcast_callback(broadcast_to_workers)
+    # Clients of a promoted follower still have the old leader's epoch
+    ws_manager.resync_all()
+
+    # Config changes marked by the endpoints are applied here
+    reload_scheduler.start()
+
+    # Start batched CDR writer before AMI events can produce CDRs
+    await cdr_writer.start()
+    leader_tasks.append(asyncio.create_task(cdr_maintenance_loop()))
+
+    # Followers get the current state on connect, then every broadcast
+    await worker_bus.serve(hello=lambda: leader_hello(client))
+    leader_tasks.append(asyncio.create_task(publish_leader_state(client, worker_bus)))
+
+    # Start AMI connection in background
+    asyncio.create_task(client.connect())
+
+
+def start_follower_services():
+    """Mirror the leader's state and pass its broadcasts on to this worker's WebSocket clients"""
+    mirror = AMIMirror(worker_bus)
+    mirror.set_broadcast_callback(ws_manager.broadcast)
+    mirror.resync_callback = ws_manager.resync_all
+    use_ami_client(mirror)
+    # Config changes are forwarded to the leader's reload scheduler
+    reload_scheduler.bind_loop()
+    worker_bus.follow(on_promote=start_leader_services)
+
+
+def resync_call_state(client):
+    """Call deltas were lost: fresh snapshots for the WebSocket clients,
+    a fresh hello for the follower workers (which resync theirs)"""
+    ws_manager.resync_all()
+    worker_bus.publish(leader_hello(client))
+
+
+async def leader_resync():
+    """A follower saw a gap in the call deltas"""
+    if not ami_client:
+        raise RuntimeError("Not connected to Asterisk")
+    worker_bus.publish(leader_hello(ami_client))
+
+
+async def leader_send_action(action: str, **kwargs):
+    """AMI action on behalf of a follower worker"""
+    if not ami_client:
+        raise RuntimeError("Not connected to Asterisk")
+    return await ami_client.send_action(action, **kwargs)
+
+
+worker_bus.register_rpc("ami.send_action", leader_send_action)
+worker_bus.register_rpc("ami.resync", leader_resync)
 
 
 # Lifecycle management
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
-    global ami_client
-    
     # Startup
     logger.info("Starting Asterisk PBX GUI Backend...")
+
+    # With several uvicorn workers only the elected leader talks to Asterisk
+    role = worker_bus.elect()
+    ws_manager.set_snapshot_provider(active_calls_snapshot)
+    response_cache.bind_loop()
+    if role == FOLLOWER:
+        start_follower_services()
+        # Let the leader run the migrations below first
+        if not await worker_bus.wait_for_leader():
+            logger.warning("Leader worker not reachable, continuing startup")
     
     # Create database tables
     Base.metadata.create_all(bind=engine)
@@ -251,6 +356,79 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Migration check for audit_logs table: {e}")
 
+    # Migrate: add accountcode/linkedid columns to cdr if missing
+    try:
+        from sqlalchemy import text, inspect as sa_inspect_cdr
+        cdr_columns = [c['name'] for c in sa_inspect_cdr(engine).get_columns('cdr')]
+        with engine.connect() as conn:
+            if 'accountcode' not in cdr_columns:
+                conn.execute(text("ALTER TABLE cdr ADD COLUMN accountcode VARCHAR(80)"))
+                logger.info("Migration: added accountcode column to cdr")
+            if 'linkedid' not in cdr_columns:
+                conn.execute(text("ALTER TABLE cdr ADD COLUMN linkedid VARCHAR(150)"))
+                logger.info("Migration: added linkedid column to cdr")
+            conn.commit()
+    except Exception as e:
+        logger.warning(f"Migration check for cdr accountcode/linkedid columns: {e}")
+
+    # Monthly partitions for the cdr table (PostgreSQL) are an explicit migration:
+    # converting a large table must not hold up the startup
+    if worker_bus.is_leader and engine.dialect.name == "postgresql":
+        try:
+            from cdr_partitions import is_partitioned
+            with engine.connect() as conn:
+                if not is_partitioned(conn):
+                    logger.info("cdr is not partitioned - run python migrate_cdr_partitions.py to convert it")
+        except Exception as e:
+            logger.warning(f"Migration check for cdr partitions: {e}")
+
+    # Migrate: create missing indexes on existing cdr/audit_logs tables
+    # (CONCURRENTLY on PostgreSQL, so CDR inserts are not blocked meanwhile)
+    try:
+        from sqlalchemy import text, inspect as sa_inspect_idx
+        from database import CDR, AuditLog
+        from cdr_partitions import is_partitioned
+        idx_inspector = sa_inspect_idx(engine)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in (CDR.__table__, AuditLog.__table__):
+                existing = {i['name'] for i in idx_inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing:
+                        continue
+                    if engine.dialect.name == "postgresql" and not is_partitioned(conn, table.name):
+                        columns = ", ".join(c.name for c in index.columns)
+                        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table.name} ({columns})"))
+                    else:
+                        index.create(bind=conn, checkfirst=True)
+                    logger.info(f"Migration: created index {index.name}")
+    except Exception as e:
+        logger.warning(f"Migration check for cdr/audit_logs indexes: {e}")
+
+    # Migrate: trigram and reverse indexes for the CDR number search
+    # (in the background, building them over a large cdr table takes a while)
+    if worker_bus.is_leader:
+        try:
+            from number_search import ensure_indexes
+            asyncio.create_task(asyncio.to_thread(ensure_indexes, engine))
+        except Exception as e:
+            logger.warning(f"Migration check for CDR number search indexes: {e}")
+
+    # Migrate: backfill the CDR rollups once if they are empty but CDRs exist
+    if worker_bus.is_leader:
+        try:
+            from database import CDR, CDRRollupDaily
+            from cdr_rollups import rebuild_rollups
+            db = SessionLocal()
+            try:
+                needs_backfill = db.query(CDRRollupDaily.bucket).first() is None and db.query(CDR.id).first() is not None
+            finally:
+                db.close()
+            if needs_backfill:
+                logger.info("Migration: backfilling CDR rollups in the background")
+                asyncio.create_task(asyncio.to_thread(rebuild_rollups))
+        except Exception as e:
+            logger.warning(f"Migration check for CDR rollups: {e}")
+
     # Seed admin user if not exists
     db = SessionLocal()
     try:
@@ -291,62 +469,34 @@ async def lifespan(app: FastAPI):
             s = db.query(SystemSettings).filter(SystemSettings.key == key).first()
             smtp_settings[key] = s.value if s else ""
 
-        # Write msmtp config if SMTP is configured
-        if smtp_settings.get("smtp_host"):
-            write_msmtp_config(smtp_settings)
-            logger.info("msmtp config written to Asterisk container")
+        # Config files are shared by all workers, the leader writes them
+        if worker_bus.is_leader:
+            # Write msmtp config if SMTP is configured
+            if smtp_settings.get("smtp_host"):
+                write_msmtp_config(smtp_settings)
+                logger.info("msmtp config written to Asterisk container")
 
-        # Regenerate voicemail.conf with SMTP settings
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        write_voicemail_config(all_mailboxes, smtp_settings)
-        reload_voicemail()
-        logger.info(f"Voicemail config generated with {len(all_mailboxes)} mailboxes")
+            # Regenerate voicemail.conf with SMTP settings
+            reload_scheduler.mark_dirty("voicemail")
     finally:
         db.close()
 
-    # Load Home Assistant settings from DB
+    # Load Home Assistant API key from DB (every worker authenticates requests)
     try:
         from auth import update_ha_api_key
-        ha_settings = {}
-        for key in ["ha_enabled", "ha_api_key", "mqtt_broker", "mqtt_port", "mqtt_user", "mqtt_password"]:
-            s = db.query(SystemSettings).filter(SystemSettings.key == key).first()
-            ha_settings[key] = s.value if s else ""
-
-        if ha_settings.get("ha_api_key"):
-            update_ha_api_key(ha_settings["ha_api_key"])
+        s = db.query(SystemSettings).filter(SystemSettings.key == "ha_api_key").first()
+        if s and s.value:
+            update_ha_api_key(s.value)
             logger.info("HA API key loaded from DB")
-
-        if ha_settings.get("ha_enabled") == "true" and ha_settings.get("mqtt_broker"):
-            mqtt_publisher.reconfigure(
-                broker=ha_settings["mqtt_broker"],
-                port=int(ha_settings.get("mqtt_port") or 1883),
-                user=ha_settings.get("mqtt_user", ""),
-                password=ha_settings.get("mqtt_password", ""),
-            )
-            logger.info(f"MQTT configured from DB: {ha_settings['mqtt_broker']}")
     except Exception as e:
         logger.warning(f"Failed to load HA settings from DB: {e}")
 
-    # Initialize AMI client
-    ami_client = AsteriskAMIClient()
-    
-    # Set AMI client in dashboard and trunks router
-    dashboard.set_ami_client(ami_client)
-    trunks.set_ami_client(ami_client)
-    sip_debug_router.set_ami_client(ami_client)
-    
-    # Set broadcast callback
-    ami_client.set_broadcast_callback(manager.broadcast)
-    
-    # Connect MQTT publisher if not already configured from DB settings
-    if not mqtt_publisher.connected and mqtt_publisher.enabled:
-        mqtt_publisher.connect()
+    # AMI, CDR writer and MQTT; followers mirror the leader instead
+    if role == LEADER:
+        await start_leader_services()
 
-    # Start AMI connection in background
-    asyncio.create_task(ami_client.connect())
-
-    # Wait a bit for AMI to connect
-    await asyncio.sleep(2)
+        # Wait a bit for AMI to connect
+        await asyncio.sleep(2)
 
     logger.info("Backend startup complete")
     
@@ -354,9 +504,14 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down backend...")
+    await stop_leader_tasks()
     mqtt_publisher.disconnect()
     if ami_client:
         await ami_client.disconnect()
+    # Flush remaining CDRs after AMI stopped producing them
+    await cdr_writer.stop()
+    # Releases the leader lock, a follower takes over
+    await worker_bus.close()
     logger.info("Shutdown complete")
 
 
@@ -466,12 +621,15 @@ async def originate_call(
 
 # Active calls endpoint
 @app.get("/api/calls/active")
-async def get_active_calls(current_user: User = Depends(get_current_user)):
+async def get_active_calls(
+    extension: Optional[str] = Query(None, description="Only calls where this extension is caller or destination"),
+    current_user: User = Depends(get_current_user),
+):
     """Get currently active calls"""
     global ami_client
     
     if ami_client and ami_client.connected:
-        calls = await ami_client.get_active_channels()
+        calls = await ami_client.get_active_channels(extension)
         return {
             "calls": calls,
             "count": len(calls),
@@ -485,49 +643,139 @@ async def get_active_calls(current_user: User = Depends(get_current_user)):
     }
 
 
+def active_calls_snapshot() -> Optional[dict]:
+    """Full active call list with its sequence number, sent on connect and to resynced clients"""
+    if not ami_client:
+        return None
+    return ami_client.call_snapshot()
+
+
+def ws_allowed_extensions(username: str) -> Optional[set]:
+    """None for admins (everything), otherwise the extensions assigned to the user.
+    Raises LookupError for unknown users."""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if not user:
+            raise LookupError(username)
+        if user.role == "admin":
+            return None
+        peers = db.query(SIPPeer.extension).filter(SIPPeer.user_id == user.id).all()
+        return {p.extension for p in peers}
+    finally:
+        db.close()
+
+
+def ring_group_extensions(group_ids: list) -> list:
+    """Group number and member extensions of the given ring groups"""
+    db = SessionLocal()
+    try:
+        ids = [int(g) for g in group_ids if str(g).isdigit()]
+        extensions = []
+        for group in db.query(RingGroup).filter(RingGroup.id.in_(ids)).all():
+            extensions.append(group.extension)
+            extensions.extend(m.extension for m in group.members)
+        return extensions
+    finally:
+        db.close()
+
+
+async def handle_ws_message(client, data: str):
+    """Client -> server protocol:
+    {"type": "subscribe", "extensions": [...], "trunks": [ids], "groups": [ids],
+     "sip_call_ids": [...], "events": ["calls", "peers", "trunks", "channels", "sip_debug"]}
+                                                      - replace the subscription (filters are ANDed
+                                                        with the user's own extensions for non-admins)
+    {"type": "resume", "epoch": "...", "last_seq": N} - missed deltas, or a snapshot if too old
+    {"type": "snapshot"}                              - full state
+    Deltas with seq <= the client's last seen seq may arrive twice and must be ignored."""
+    try:
+        message = json.loads(data)
+    except ValueError:
+        logger.info(f"Received WebSocket message: {data}")
+        return
+    if not isinstance(message, dict):
+        return
+
+    msg_type = message.get("type")
+    if msg_type == "subscribe":
+        extensions = [str(e) for e in message.get("extensions") or []]
+        groups = message.get("groups") or []
+        if groups:
+            extensions += await asyncio.to_thread(ring_group_extensions, groups)
+        client.subscription.update(
+            extensions=extensions,
+            trunks=message.get("trunks") or [],
+            sip_call_ids=message.get("sip_call_ids") or [],
+            events=message.get("events"),
+        )
+        client.enqueue({"type": "subscribed", "subscription": client.subscription.to_dict()})
+        # The client's view changed - send the matching state
+        if ami_client:
+            client.enqueue_calls(ami_client.call_snapshot())
+    elif not ami_client:
+        return
+    elif msg_type == "resume":
+        try:
+            last_seq = int(message.get("last_seq"))
+        except (TypeError, ValueError):
+            client.enqueue_calls(ami_client.call_snapshot())
+            return
+        client.enqueue_calls(ami_client.resume(message.get("epoch"), last_seq))
+    elif msg_type == "snapshot":
+        client.enqueue_calls(ami_client.call_snapshot())
+    else:
+        logger.info(f"Received WebSocket message: {data}")
+
+
 # WebSocket endpoint for live updates
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, token: str = Query(None)):
-    """WebSocket connection for real-time updates"""
+async def websocket_endpoint(
+    websocket: WebSocket,
+    token: str = Query(None),
+    epoch: Optional[str] = Query(None),
+    last_seq: Optional[int] = Query(None),
+):
+    """WebSocket connection for real-time updates.
+    A reconnecting client passes epoch/last_seq to get only the deltas it missed."""
     # Validate token for WebSocket connections
     if token:
         from jose import JWTError, jwt as jose_jwt
         from auth import JWT_SECRET, JWT_ALGORITHM
         try:
-            jose_jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        except JWTError:
+            payload = jose_jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            allowed_extensions = await asyncio.to_thread(ws_allowed_extensions, payload.get("sub"))
+        except (JWTError, LookupError):
             await websocket.close(code=4001)
             return
     else:
         await websocket.close(code=4001)
         return
 
-    await manager.connect(websocket)
+    client = await ws_manager.connect(websocket, allowed_extensions)
     
     try:
-        await websocket.send_json({
+        # Everything goes through the client's send queue, never directly
+        client.enqueue({
             "type": "connection",
             "status": "connected",
             "timestamp": datetime.utcnow().isoformat()
         })
         
-        if ami_client:
-            calls = await ami_client.get_active_channels()
-            await websocket.send_json({
-                "type": "active_calls",
-                "active_calls": calls,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+        if ami_client and last_seq is not None:
+            client.enqueue_calls(ami_client.resume(epoch, last_seq))
+        else:
+            client.enqueue_calls(active_calls_snapshot())
         
         while True:
             data = await websocket.receive_text()
-            logger.info(f"Received WebSocket message: {data}")
+            await handle_ws_message(client, data)
             
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        ws_manager.disconnect(websocket)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        manager.disconnect(websocket)
+        ws_manager.disconnect(websocket)
 
 
 if __name__ == "__main__":
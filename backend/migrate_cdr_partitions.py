@@ -0,0 +1,20 @@
+"""
+Convert the cdr table to monthly partitions (PostgreSQL, one-time).
+Usage: python migrate_cdr_partitions.py [batch_size]   (default: CDR_MIGRATION_BATCH_SIZE)
+Safe to rerun: an interrupted migration continues moving the old CDRs.
+"""
+import sys
+
+from database import engine, Base
+from cdr_partitions import convert_to_partitioned, CDR_MIGRATION_BATCH_SIZE
+
+Base.metadata.create_all(bind=engine)
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else CDR_MIGRATION_BATCH_SIZE
+result = convert_to_partitioned(batch_size)
+if result["status"] == "unsupported":
+    print(f"❌ CDR partitions need PostgreSQL, not {engine.dialect.name}")
+    sys.exit(1)
+if result["status"] == "partitioned":
+    print("✅ cdr is already partitioned")
+else:
+    print(f"✅ cdr converted to a partitioned table: {result['moved']} CDR(s) moved")
@@ -0,0 +1,113 @@
+"""
+CDR number search
+Substring search on cdr.src/dst that an index can serve. With pg_trgm the
+GIN trigram indexes answer infix matches ('%4711%'); without it the
+expression indexes on reverse(src|dst) answer suffix matches, i.e. the last
+digits of a number, as a prefix range scan. Other databases scan.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from pagination import explain_plan
+from cdr_partitions import is_partitioned
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM = "trigram"
+SUFFIX = "suffix"
+SCAN = "scan"
+# Query parameter pattern for the match modes
+MATCH_MODES = "^(contains|suffix)$"
+NUMBER_COLUMNS = ("src", "dst")
+
+# Detected once per process, see search_mode()
+_mode: Optional[str] = None
+
+
+def ensure_indexes(engine):
+    """Create the pg_trgm extension and the number search indexes if missing
+    (CONCURRENTLY, so CDR inserts are not blocked). PostgreSQL only."""
+    global _mode
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Not possible on a partitioned table, the index is built per partition there
+        concurrently = "" if is_partitioned(conn) else "CONCURRENTLY "
+        # Works without pg_trgm, needs no extension
+        for column in NUMBER_COLUMNS:
+            conn.execute(text(
+                f"CREATE INDEX {concurrently}IF NOT EXISTS ix_cdr_{column}_reverse "
+                f"ON cdr (reverse({column}) text_pattern_ops)"
+            ))
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            logger.warning(f"pg_trgm not available, number search limited to suffix matches: {e}")
+        else:
+            for column in NUMBER_COLUMNS:
+                conn.execute(text(
+                    f"CREATE INDEX {concurrently}IF NOT EXISTS ix_cdr_{column}_trgm "
+                    f"ON cdr USING gin ({column} gin_trgm_ops)"
+                ))
+    _mode = None
+
+
+def search_mode(db: Session) -> str:
+    """trigram, suffix or scan - depending on the database and its extensions"""
+    global _mode
+    if _mode is None:
+        if db.get_bind().dialect.name != "postgresql":
+            _mode = SCAN
+        else:
+            has_trgm = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+            _mode = TRIGRAM if has_trgm else SUFFIX
+    return _mode
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def number_condition(db: Session, column, term: str, match: str = "contains"):
+    """WHERE condition for a number search on column; match is contains or suffix"""
+    term = term.strip()
+    if match == "suffix":
+        if search_mode(db) == SCAN:
+            return column.like(f"%{_escape_like(term)}", escape="\\")
+        # reverse(col) LIKE '1174%' is a range scan on the reverse index
+        return func.reverse(column).like(f"{_escape_like(term[::-1])}%", escape="\\")
+    # Served by the trigram index for terms of three or more characters
+    return column.ilike(f"%{_escape_like(term)}%", escape="\\")
+
+
+def plan_indexes(plan: Any) -> List[str]:
+    """Names of all indexes in an EXPLAIN (FORMAT JSON) plan"""
+    found = []
+    if isinstance(plan, dict):
+        if "Index Name" in plan:
+            found.append(plan["Index Name"])
+        for value in plan.values():
+            found += plan_indexes(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            found += plan_indexes(item)
+    return found
+
+
+def search_plan(db: Session, query, match: str) -> Dict[str, Any]:
+    """Query plan of a number search and whether one of the number indexes serves it"""
+    mode = search_mode(db)
+    if mode == SCAN:
+        return {"mode": mode, "match": match, "uses_index": False, "indexes": [], "plan": None}
+    plan = explain_plan(query)
+    indexes = plan_indexes(plan)
+    return {
+        "mode": mode,
+        "match": match,
+        "uses_index": any(name.endswith(("_trgm", "_reverse")) for name in indexes),
+        "indexes": indexes,
+        "plan": plan,
+    }
@@ -8,6 +8,7 @@ import urllib.request
 import socket
 from typing import List
 from database import SIPPeer, SIPTrunk
+from config_output import write_config, file_hash, needs_reload, mark_applied
 from version import VERSION
 
 logger = logging.getLogger(__name__)
@@ -62,7 +63,7 @@ def generate_pjsip_config(peers: List[SIPPeer], global_codecs: str = DEFAULT_COD
     allow_lines = "\n".join(f"allow={c}" for c in codec_list)
     acl_line = "\nacl=registration-whitelist" if acl_enabled else ""
 
-    config = f"""; Auto-generated PJSIP configuration
+    parts = [f"""; Auto-generated PJSIP configuration
 ; Generated by Asterisk PBX GUI
 
 [global]
@@ -109,7 +110,7 @@ remove_existing=yes
 qualify_frequency=60
 
 ; === Peers ===
-"""
+"""]
 
     for peer in peers:
         if peer.enabled:
@@ -125,7 +126,7 @@ qualify_frequency=60
                 if pg:
                     pickup_lines = f"\ncallgroup={pg}\npickupgroup={pg}"
 
-            config += f"""
+            parts.append(f"""
 [{peer.extension}](endpoint-basic)
 auth=auth{peer.extension}
 aors={peer.extension}
@@ -136,9 +137,9 @@ username={peer.extension}
 password={peer.secret}
 
 [{peer.extension}](aor-basic)
-"""
+""")
 
-    return config
+    return "".join(parts)
 
 
 def generate_trunk_config(trunk: SIPTrunk, skip_identify: bool = False) -> str:
@@ -243,27 +244,29 @@ match={trunk.sip_server}
     return config
 
 
-def write_pjsip_config(peers: List[SIPPeer], trunks: List[SIPTrunk] = None, global_codecs: str = DEFAULT_CODECS, acl_enabled: bool = False) -> bool:
-    """Write PJSIP config to file"""
-    try:
-        config_content = generate_pjsip_config(peers, global_codecs, acl_enabled=acl_enabled)
+def render_pjsip_config(peers: List[SIPPeer], trunks: List[SIPTrunk] = None, global_codecs: str = DEFAULT_CODECS, acl_enabled: bool = False) -> str:
+    """Complete pjsip.conf: peers, then the trunks"""
+    parts = [generate_pjsip_config(peers, global_codecs, acl_enabled=acl_enabled)]
 
-        if trunks:
-            config_content += "\n; === SIP Trunks ===\n"
-            # Track which SIP servers already have an identify section
-            # to avoid duplicate matches (multiple trunks from same provider)
-            seen_servers: set = set()
-            for trunk in trunks:
-                if trunk.enabled:
-                    config_content += generate_trunk_config(trunk, skip_identify=trunk.sip_server in seen_servers)
-                    seen_servers.add(trunk.sip_server)
+    if trunks:
+        parts.append("\n; === SIP Trunks ===\n")
+        # Track which SIP servers already have an identify section
+        # to avoid duplicate matches (multiple trunks from same provider)
+        seen_servers: set = set()
+        for trunk in trunks:
+            if trunk.enabled:
+                parts.append(generate_trunk_config(trunk, skip_identify=trunk.sip_server in seen_servers))
+                seen_servers.add(trunk.sip_server)
+    return "".join(parts)
 
-        os.makedirs(os.path.dirname(PJSIP_CONFIG_PATH), exist_ok=True)
 
-        with open(PJSIP_CONFIG_PATH, 'w') as f:
-            f.write(config_content)
+def write_pjsip_config(peers: List[SIPPeer], trunks: List[SIPTrunk] = None, global_codecs: str = DEFAULT_CODECS, acl_enabled: bool = False) -> bool:
+    """Write PJSIP config to file"""
+    try:
+        config_content = render_pjsip_config(peers, trunks, global_codecs, acl_enabled)
 
-        logger.info(f"PJSIP config written with {len(peers)} peers, {len(trunks or [])} trunks")
+        if write_config(PJSIP_CONFIG_PATH, config_content, "pjsip_config.write_pjsip_config"):
+            logger.info(f"PJSIP config written with {len(peers)} peers, {len(trunks or [])} trunks")
         return True
 
     except Exception as e:
@@ -272,17 +275,22 @@ def write_pjsip_config(peers: List[SIPPeer], trunks: List[SIPTrunk] = None, glob
 
 def reload_asterisk() -> bool:
     """Reload Asterisk PJSIP - copy config inside Asterisk container"""
+    digest = file_hash(PJSIP_CONFIG_PATH)
+    if not needs_reload(PJSIP_CONFIG_PATH):
+        logger.info("pjsip.conf already loaded, reload skipped")
+        return True
     try:
-        # Kopiere die Config IM Asterisk-Container (nicht vom Backend aus)
+        # Kopiere die Config IM Asterisk-Container (nicht vom Backend aus), außer sie ist dort verlinkt
         result = subprocess.run(
             ['docker', 'exec', 'pbx_asterisk', 'sh', '-c',
-             'cp /etc/asterisk/custom/pjsip.conf /etc/asterisk/pjsip.conf && asterisk -rx "pjsip reload"'],
+             '{ [ -L /etc/asterisk/pjsip.conf ] || cp /etc/asterisk/custom/pjsip.conf /etc/asterisk/pjsip.conf; } && asterisk -rx "pjsip reload"'],
             capture_output=True,
             text=True,
             timeout=10
         )
 
         if result.returncode == 0:
+            mark_applied(PJSIP_CONFIG_PATH, digest)
             logger.info(f"Asterisk reloaded successfully")
             return True
         else:
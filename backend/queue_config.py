@@ -6,6 +6,7 @@ import logging
 import subprocess
 from typing import List
 from database import RingGroup
+from config_output import write_config, file_hash, needs_reload, mark_applied
 
 logger = logging.getLogger(__name__)
 
@@ -20,13 +21,13 @@ STRATEGY_MAP = {
 
 def generate_queues_config(groups: List[RingGroup]) -> str:
     """Generate queues.conf for ring groups"""
-    config = """; Auto-generated Queue configuration
+    parts = ["""; Auto-generated Queue configuration
 ; Generated by Asterisk PBX GUI
 
 [general]
 ; keep empty - defaults apply
 
-"""
+"""]
 
     for group in sorted(groups, key=lambda g: g.extension):
         if not group.enabled:
@@ -34,31 +35,29 @@ def generate_queues_config(groups: List[RingGroup]) -> str:
         queue_name = f"rg_{group.id}"
         strategy = STRATEGY_MAP.get(group.strategy or "ringall", "ringall")
         ring_time = group.ring_time or 20
-        config += f"[{queue_name}]\n"
-        config += f"strategy={strategy}\n"
-        config += f"timeout={ring_time}\n"
-        config += "retry=1\n"
-        config += "wrapuptime=0\n"
-        config += "maxlen=0\n"
-        config += "joinempty=yes\n"
-        config += "leavewhenempty=no\n"
-        config += "ringinuse=yes\n"
+        parts.append(f"[{queue_name}]\n")
+        parts.append(f"strategy={strategy}\n")
+        parts.append(f"timeout={ring_time}\n")
+        parts.append("retry=1\n")
+        parts.append("wrapuptime=0\n")
+        parts.append("maxlen=0\n")
+        parts.append("joinempty=yes\n")
+        parts.append("leavewhenempty=no\n")
+        parts.append("ringinuse=yes\n")
         # Members
         for member in sorted(group.members, key=lambda m: m.position):
-            config += f"member => PJSIP/{member.extension}\n"
-        config += "\n"
+            parts.append(f"member => PJSIP/{member.extension}\n")
+        parts.append("\n")
 
-    return config
+    return "".join(parts)
 
 
 def write_queues_config(groups: List[RingGroup]) -> bool:
     """Write queues.conf to shared volume"""
     try:
         content = generate_queues_config(groups)
-        os.makedirs(os.path.dirname(QUEUE_CONFIG_PATH), exist_ok=True)
-        with open(QUEUE_CONFIG_PATH, "w") as f:
-            f.write(content)
-        logger.info(f"queues.conf written with {len(groups)} ring groups")
+        if write_config(QUEUE_CONFIG_PATH, content, "queue_config.write_queues_config"):
+            logger.info(f"queues.conf written with {len(groups)} ring groups")
         return True
     except Exception as e:
         logger.error(f"Failed to write queues.conf: {e}")
@@ -67,6 +66,10 @@ def write_queues_config(groups: List[RingGroup]) -> bool:
 
 def reload_queues() -> bool:
     """Reload Asterisk queues"""
+    digest = file_hash(QUEUE_CONFIG_PATH)
+    if not needs_reload(QUEUE_CONFIG_PATH):
+        logger.info("queues.conf already loaded, reload skipped")
+        return True
     try:
         result = subprocess.run(
             [
@@ -75,13 +78,14 @@ def reload_queues() -> bool:
                 "pbx_asterisk",
                 "sh",
                 "-c",
-                "cp /etc/asterisk/custom/queues.conf /etc/asterisk/queues.conf && asterisk -rx \"queue reload all\"",
+                "{ [ -L /etc/asterisk/queues.conf ] || cp /etc/asterisk/custom/queues.conf /etc/asterisk/queues.conf; } && asterisk -rx \"queue reload all\"",
             ],
             capture_output=True,
             text=True,
             timeout=10,
         )
         if result.returncode == 0:
+            mark_applied(QUEUE_CONFIG_PATH, digest)
             logger.info("Asterisk queues reloaded successfully")
             return True
         logger.error(f"Queue reload failed: {result.stderr}")
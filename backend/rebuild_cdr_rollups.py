@@ -0,0 +1,14 @@
+"""
+Rebuild the hourly/daily CDR rollups from the cdr table.
+Usage: python rebuild_cdr_rollups.py [date_from] [date_to]   (ISO dates, default: all CDRs)
+"""
+import sys
+from datetime import datetime
+
+from database import engine, Base
+from cdr_rollups import rebuild_rollups
+
+Base.metadata.create_all(bind=engine)
+args = [datetime.fromisoformat(a) for a in sys.argv[1:3]]
+result = rebuild_rollups(*args)
+print(f"✅ CDR rollups rebuilt: {result['days']} day(s), {result['cdrs']} CDR(s)")
@@ -0,0 +1,251 @@
+"""
+Reload scheduler
+Mutating endpoints mark config domains (pjsip, dialplan, queues, voicemail,
+acl) dirty instead of regenerating and reloading inside the request. One
+background task in the leader worker waits until no mark came in for
+RELOAD_DEBOUNCE seconds (at most RELOAD_MAX_DELAY after the first one), then
+renders every dirty domain once from one ConfigSnapshot and reloads it once
+(asterisk_reload) - a bulk edit of 50 extensions is one pjsip reload, not 50.
+
+Every mark gets a generation number; per domain the status reports the
+newest marked and the last applied generation, so the UI can tell when a
+change is live. Marks from follower workers are forwarded to the leader.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from config_snapshot import ConfigSnapshot, take_snapshot
+from pjsip_config import write_pjsip_config
+from dialplan import write_extensions_config
+from queue_config import write_queues_config
+from voicemail_config import write_voicemail_config
+from acl_config import write_acl_config, remove_acl_config
+from asterisk_reload import asterisk_reloader
+from worker_bus import worker_bus, FOLLOWER
+
+logger = logging.getLogger(__name__)
+
+RELOAD_DEBOUNCE = float(os.getenv("RELOAD_DEBOUNCE", "1.0"))
+RELOAD_MAX_DELAY = float(os.getenv("RELOAD_MAX_DELAY", "10"))
+RELOAD_RETRY_DELAY = float(os.getenv("RELOAD_RETRY_DELAY", "30"))
+
+
+def regenerate_acl(snapshot: ConfigSnapshot) -> bool:
+    """acl.conf from the IP whitelist settings"""
+    if snapshot.acl_enabled:
+        return write_acl_config(list(snapshot.whitelist_ips))
+    return remove_acl_config()
+
+
+def regenerate_pjsip(snapshot: ConfigSnapshot) -> bool:
+    """pjsip.conf from peers, trunks, global codecs and the whitelist switch"""
+    return write_pjsip_config(snapshot.peers, snapshot.trunks, global_codecs=snapshot.global_codecs, acl_enabled=snapshot.acl_enabled)
+
+
+def regenerate_voicemail(snapshot: ConfigSnapshot) -> bool:
+    """voicemail.conf from the mailboxes and SMTP settings"""
+    return write_voicemail_config(snapshot.mailboxes, snapshot.smtp_settings)
+
+
+def regenerate_queues(snapshot: ConfigSnapshot) -> bool:
+    """queues.conf from the ring groups"""
+    return write_queues_config(snapshot.ring_groups)
+
+
+def regenerate_dialplan(snapshot: ConfigSnapshot) -> bool:
+    """extensions.conf from enabled routes and forwards and everything they point to"""
+    return write_extensions_config(
+        snapshot.routes, snapshot.forwards, snapshot.mailboxes, snapshot.peers,
+        snapshot.trunks, snapshot.ring_groups, snapshot.ivr_menus,
+    )
+
+
+# Renderers, applied in this order: pjsip.conf references the ACL, the dialplan the queues
+DOMAINS: Dict[str, Callable[[ConfigSnapshot], bool]] = {
+    "acl": regenerate_acl,
+    "pjsip": regenerate_pjsip,
+    "voicemail": regenerate_voicemail,
+    "queues": regenerate_queues,
+    "dialplan": regenerate_dialplan,
+}
+
+
+class ReloadScheduler:
+    def __init__(self):
+        self.generation = 0
+        # domain -> newest generation marked
+        self.pending: Dict[str, int] = {}
+        # domain -> generation, time and result of the last apply
+        self.applied: Dict[str, Dict[str, Any]] = {}
+        self.runs = 0
+        # loaded_at of the snapshot the last run rendered from
+        self.snapshot_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def bind_loop(self):
+        """Remember the event loop, so sync endpoints in the threadpool can mark domains"""
+        self._loop = asyncio.get_running_loop()
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+    def start(self):
+        """Leader: start the background task that applies dirty domains"""
+        self.bind_loop()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="reload-scheduler")
+            logger.info(f"Reload scheduler started (debounce {RELOAD_DEBOUNCE}s, max delay {RELOAD_MAX_DELAY}s)")
+
+    def mark_dirty(self, *domains: str):
+        """Schedule a regenerate + reload of the domains. Never blocks, callable
+        from async endpoints and from sync endpoints in the threadpool."""
+        unknown = set(domains) - set(DOMAINS)
+        if unknown:
+            raise ValueError(f"Unknown config domain(s): {', '.join(sorted(unknown))}")
+        if self._loop is None:
+            try:
+                # Marked during startup, applied once the scheduler runs
+                self.bind_loop()
+            except RuntimeError:
+                # No event loop (scripts): apply right away
+                snapshot = take_snapshot()
+                for domain in domains:
+                    asyncio.run(self._apply(domain, snapshot))
+                return
+        self._loop.call_soon_threadsafe(self._mark, domains)
+
+    def _mark(self, domains):
+        if worker_bus.role == FOLLOWER:
+            asyncio.create_task(self._forward(domains))
+            return
+        self._mark_local(domains)
+
+    def _mark_local(self, domains) -> int:
+        with self._lock:
+            self.generation += 1
+            for domain in domains:
+                self.pending[domain] = self.generation
+        self._wakeup.set()
+        return self.generation
+
+    async def _forward(self, domains):
+        try:
+            await worker_bus.call("reload.mark", domains=list(domains))
+        except Exception as e:
+            logger.error(f"Could not pass config change ({', '.join(domains)}) to the leader: {e}")
+
+    def _dirty(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                domain: generation for domain, generation in self.pending.items()
+                if generation > self.applied.get(domain, {}).get("generation", 0)
+            }
+
+    async def _debounce(self):
+        """Wait until the marks stop coming, but not longer than RELOAD_MAX_DELAY"""
+        deadline = time.monotonic() + RELOAD_MAX_DELAY
+        while True:
+            self._wakeup.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(RELOAD_DEBOUNCE, remaining))
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await self._debounce()
+            dirty = self._dirty()
+            if not dirty:
+                continue
+            self.runs += 1
+            failed = False
+            try:
+                # One load for all dirty domains of this run
+                snapshot = await asyncio.to_thread(take_snapshot)
+                self.snapshot_at = snapshot.loaded_at
+            except Exception as e:
+                logger.error(f"✗ Could not load config snapshot: {e}")
+                snapshot, snapshot_error = None, str(e)
+            for domain in DOMAINS:
+                if domain not in dirty:
+                    continue
+                if snapshot is None:
+                    ok, error = False, snapshot_error
+                else:
+                    ok, error = await self._apply(domain, snapshot)
+                with self._lock:
+                    previous = self.applied.get(domain, {})
+                    self.applied[domain] = {
+                        # A failed apply keeps the last good generation, so it is retried
+                        "generation": dirty[domain] if ok else previous.get("generation", 0),
+                        "applied_at": datetime.utcnow().isoformat() if ok else previous.get("applied_at"),
+                        "ok": ok,
+                        "error": error,
+                    }
+                failed = failed or not ok
+            if failed:
+                self._loop.call_later(RELOAD_RETRY_DELAY, self._wakeup.set)
+
+    async def _apply(self, domain: str, snapshot: ConfigSnapshot):
+        """Render and reload one domain. Returns (ok, error)."""
+        try:
+            if not await asyncio.to_thread(DOMAINS[domain], snapshot):
+                return False, f"{domain} config could not be written"
+            if not await asterisk_reloader.reload(domain):
+                return False, f"{domain} reload failed"
+            logger.info(f"✓ Config domain {domain} applied")
+            return True, None
+        except Exception as e:
+            logger.error(f"✗ Failed to apply config domain {domain}: {e}")
+            return False, str(e)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            domains = {}
+            for domain in DOMAINS:
+                pending = self.pending.get(domain)
+                applied = self.applied.get(domain, {})
+                domains[domain] = {
+                    "pending_generation": pending,
+                    "applied_generation": applied.get("generation"),
+                    "applied_at": applied.get("applied_at"),
+                    "ok": applied.get("ok"),
+                    "error": applied.get("error"),
+                    "live": pending is None or applied.get("generation", 0) >= pending,
+                }
+            return {
+                "generation": self.generation,
+                "debounce": RELOAD_DEBOUNCE,
+                "max_delay": RELOAD_MAX_DELAY,
+                "runs": self.runs,
+                "snapshot_at": self.snapshot_at.isoformat() if self.snapshot_at else None,
+                "reload": asterisk_reloader.get_stats(),
+                "domains": domains,
+            }
+
+
+# Singleton instance
+reload_scheduler = ReloadScheduler()
+
+
+async def _rpc_mark(domains):
+    return reload_scheduler._mark_local(domains)
+
+
+async def _rpc_status():
+    return reload_scheduler.status()
+
+
+worker_bus.register_rpc("reload.mark", _rpc_mark)
+worker_bus.register_rpc("reload.status", _rpc_status)
@@ -9,6 +9,7 @@ from typing import Optional
 
 from database import get_db, AuditLog, User
 from auth import require_admin
+from pagination import keyset_page, count_total, TOTAL_MODES
 
 router = APIRouter()
 
@@ -17,23 +18,27 @@ router = APIRouter()
 def get_audit_logs(
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page; replaces offset"),
+    total: str = Query("exact", pattern=TOTAL_MODES),
     action: Optional[str] = None,
     username: Optional[str] = None,
     current_user: User = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
-    """Get audit logs with optional filters."""
+    """Get audit logs with optional filters, newest first (keyset pagination on timestamp, id)."""
     query = db.query(AuditLog)
     if action:
         query = query.filter(AuditLog.action == action)
     if username:
         query = query.filter(AuditLog.username == username)
 
-    total = query.count()
-    logs = query.order_by(AuditLog.timestamp.desc()).offset(offset).limit(limit).all()
+    count, estimated = count_total(query, total)
+    logs, next_cursor = keyset_page(query, AuditLog.timestamp, AuditLog.id, limit, cursor, offset)
 
     return {
-        "total": total,
+        "total": count,
+        "total_estimated": estimated,
+        "next_cursor": next_cursor,
         "logs": [
             {
                 "id": log.id,
@@ -9,9 +9,8 @@ from pydantic import BaseModel
 from datetime import datetime
 import logging
 
-from database import get_db, CallForward, SIPPeer, SIPTrunk, RingGroup, IVRMenu, User, VoicemailMailbox
-from dialplan import write_extensions_config, reload_dialplan
-from database import InboundRoute
+from database import get_db, CallForward, SIPPeer, User
+from reload_scheduler import reload_scheduler
 from auth import get_current_user
 from audit import log_action
 
@@ -50,24 +49,6 @@ class CallForwardResponse(CallForwardBase):
 VALID_FORWARD_TYPES = {"unconditional", "busy", "no_answer"}
 
 
-def regenerate_dialplan(db: Session):
-    """Regenerate dialplan after forwarding changes"""
-    try:
-        all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-        all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        all_groups = db.query(RingGroup).all()
-        all_ivr = db.query(IVRMenu).all()
-        write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-        reload_dialplan()
-        logger.info("Dialplan regenerated after call forward change")
-    except Exception as e:
-        logger.error(f"Failed to regenerate dialplan: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 @router.get("/by-extension/{extension}", response_model=List[CallForwardResponse])
 def get_forwards_by_extension(
     extension: str,
@@ -112,7 +93,7 @@ def create_forward(
     log_action(db, current_user.username, "callforward_created", "callforward", forward.extension,
                {"type": forward.forward_type, "destination": forward.destination},
                request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return db_forward
 
@@ -140,7 +121,7 @@ def update_forward(
     logger.info(f"Updated call forward #{forward_id}")
     log_action(db, current_user.username, "callforward_updated", "callforward", str(forward_id),
                None, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return db_forward
 
@@ -164,6 +145,6 @@ def delete_forward(
     logger.info(f"Deleted call forward: {ext} ({ftype})")
     log_action(db, current_user.username, "callforward_deleted", "callforward", ext,
                {"type": ftype}, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return {"status": "deleted"}
@@ -3,7 +3,9 @@ Call Detail Records (CDR) API Router
 Call history and statistics
 """
 
-from fastapi import APIRouter, Depends, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
 from typing import List, Optional
@@ -11,10 +13,30 @@ from datetime import datetime, timedelta
 from pydantic import BaseModel
 
 from database import get_db, CDR, User
-from auth import get_current_user
+from auth import get_current_user, require_admin
+from audit import log_action
+from cdr_stats import cdr_stats
+from cdr_rollups import rollup_stats, rebuild_rollups
+from pagination import keyset_page, count_total, TOTAL_MODES
+from number_search import number_condition, search_plan, MATCH_MODES
+from cdr_export import stream_cdr_export, MEDIA_TYPES
+from cdr_archive import list_archives, read_archive
+from cdr_partitions import start_maintenance, maintenance_status
+from worker_bus import worker_bus, WorkerBusError
 
 router = APIRouter()
 
+# Partition maintenance runs in the leader worker
+worker_bus.register_rpc("cdr.maintenance", start_maintenance)
+worker_bus.register_rpc("cdr.maintenance_status", maintenance_status)
+
+
+async def _leader_call(method: str, **params):
+    try:
+        return await worker_bus.call(method, **params)
+    except WorkerBusError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 
 # Pydantic schemas
 class CDRResponse(BaseModel):
@@ -29,6 +51,8 @@ class CDRResponse(BaseModel):
     billsec: int | None
     disposition: str | None
     uniqueid: str | None
+    accountcode: str | None = None
+    linkedid: str | None = None
     
     class Config:
         from_attributes = True
@@ -44,41 +68,58 @@ class CDRStatsResponse(BaseModel):
     total_billsec: int
     avg_duration: float
     avg_billsec: float
+    p50_duration: Optional[float] = None
+    p95_duration: Optional[float] = None
     calls_today: int
     calls_this_week: int
     calls_this_month: int
+    # raw or rollup - see get_cdr_stats
+    source: str
+
+
+def _apply_filters(query, src, dst, disposition, date_from, date_to, match="contains"):
+    if src:
+        query = query.filter(number_condition(query.session, CDR.src, src, match))
+    if dst:
+        query = query.filter(number_condition(query.session, CDR.dst, dst, match))
+    if disposition:
+        query = query.filter(CDR.disposition == disposition.upper())
+    if date_from:
+        query = query.filter(CDR.call_date >= date_from)
+    if date_to:
+        query = query.filter(CDR.call_date <= date_to)
+    return query
 
 
 @router.get("/", response_model=List[CDRResponse])
 async def list_cdr(
+    response: Response,
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page; replaces offset"),
+    total: str = Query("none", pattern=TOTAL_MODES, description="X-Total-Count header: exact, estimate or none"),
     src: Optional[str] = None,
     dst: Optional[str] = None,
+    match: str = Query("contains", pattern=MATCH_MODES, description="src/dst match: contains or suffix (last digits)"),
     disposition: Optional[str] = None,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get call detail records with optional filters"""
+    """Get call detail records with optional filters, newest first.
+    The next page's cursor is returned in the X-Next-Cursor header."""
     
-    query = db.query(CDR)
+    query = _apply_filters(db.query(CDR), src, dst, disposition, date_from, date_to, match)
     
-    # Apply filters
-    if src:
-        query = query.filter(CDR.src.ilike(f"%{src}%"))
-    if dst:
-        query = query.filter(CDR.dst.ilike(f"%{dst}%"))
-    if disposition:
-        query = query.filter(CDR.disposition == disposition.upper())
-    if date_from:
-        query = query.filter(CDR.call_date >= date_from)
-    if date_to:
-        query = query.filter(CDR.call_date <= date_to)
-    
-    # Order and paginate
-    records = query.order_by(CDR.call_date.desc()).offset(offset).limit(limit).all()
+    # Keyset pagination on (call_date, id)
+    records, next_cursor = keyset_page(query, CDR.call_date, CDR.id, limit, cursor, offset)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    count, estimated = count_total(query, total)
+    if count is not None:
+        response.headers["X-Total-Count"] = str(count)
+        response.headers["X-Total-Estimated"] = "true" if estimated else "false"
     return records
 
 
@@ -86,73 +127,142 @@ async def list_cdr(
 async def count_cdr(
     src: Optional[str] = None,
     dst: Optional[str] = None,
+    match: str = Query("contains", pattern=MATCH_MODES),
     disposition: Optional[str] = None,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
+    total: str = Query("exact", pattern="^(exact|estimate)$"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get total count of CDR records (for pagination)"""
-    
-    query = db.query(func.count(CDR.id))
-    
-    if src:
-        query = query.filter(CDR.src.ilike(f"%{src}%"))
-    if dst:
-        query = query.filter(CDR.dst.ilike(f"%{dst}%"))
-    if disposition:
-        query = query.filter(CDR.disposition == disposition.upper())
-    if date_from:
-        query = query.filter(CDR.call_date >= date_from)
-    if date_to:
-        query = query.filter(CDR.call_date <= date_to)
+    """Get total count of CDR records (for pagination); estimate uses planner statistics"""
     
-    return {"count": query.scalar()}
+    query = _apply_filters(db.query(CDR), src, dst, disposition, date_from, date_to, match)
+    count, estimated = count_total(query, total)
+    return {"count": count, "estimated": estimated}
 
 
-@router.get("/stats", response_model=CDRStatsResponse)
-async def get_cdr_stats(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Get comprehensive call statistics"""
-    
-    now = datetime.utcnow()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=now.weekday())
-    month_start = today_start.replace(day=1)
-    
-    # Total counts by disposition
-    total_calls = db.query(func.count(CDR.id)).scalar() or 0
-    answered_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'ANSWERED').scalar() or 0
-    missed_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'NO ANSWER').scalar() or 0
-    busy_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'BUSY').scalar() or 0
-    failed_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'FAILED').scalar() or 0
-    
-    # Duration stats
-    total_duration = db.query(func.sum(CDR.duration)).scalar() or 0
-    total_billsec = db.query(func.sum(CDR.billsec)).scalar() or 0
-    avg_duration = db.query(func.avg(CDR.duration)).scalar() or 0
-    avg_billsec = db.query(func.avg(CDR.billsec)).filter(CDR.billsec > 0).scalar() or 0
-    
-    # Time-based counts
-    calls_today = db.query(func.count(CDR.id)).filter(CDR.call_date >= today_start).scalar() or 0
-    calls_this_week = db.query(func.count(CDR.id)).filter(CDR.call_date >= week_start).scalar() or 0
-    calls_this_month = db.query(func.count(CDR.id)).filter(CDR.call_date >= month_start).scalar() or 0
-    
-    return CDRStatsResponse(
-        total_calls=total_calls,
-        answered_calls=answered_calls,
-        missed_calls=missed_calls,
-        busy_calls=busy_calls,
-        failed_calls=failed_calls,
-        total_duration=total_duration,
-        total_billsec=total_billsec,
-        avg_duration=round(avg_duration, 1),
-        avg_billsec=round(avg_billsec, 1),
-        calls_today=calls_today,
-        calls_this_week=calls_this_week,
-        calls_this_month=calls_this_month
+@router.get("/export")
+async def export_cdr(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    src: Optional[str] = None,
+    dst: Optional[str] = None,
+    match: str = Query("contains", pattern=MATCH_MODES),
+    disposition: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream all matching call detail records as CSV or NDJSON, oldest first"""
+    log_action(db, current_user.username, "cdr_exported", "cdr", None,
+               {"format": format, "src": src, "dst": dst, "disposition": disposition,
+                "date_from": date_from.isoformat() if date_from else None,
+                "date_to": date_to.isoformat() if date_to else None},
+               request.client.host if request.client else None)
+
+    def apply_filters(query):
+        return _apply_filters(query, src, dst, disposition, date_from, date_to, match)
+
+    filename = f"cdr-export-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    media_type = MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        stream_cdr_export(apply_filters, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
 
 
+@router.get("/search/plan")
+async def number_search_plan(
+    number: str = Query(..., min_length=1),
+    field: str = Query("src", pattern="^(src|dst)$"),
+    match: str = Query("suffix", pattern=MATCH_MODES),
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Query plan of a number search - confirms the trigram/reverse indexes are used (PostgreSQL)"""
+    column = CDR.src if field == "src" else CDR.dst
+    query = db.query(CDR.id).filter(number_condition(db, column, number, match))
+    return search_plan(db, query, match)
+
+
+@router.get("/stats", response_model=CDRStatsResponse)
+async def get_cdr_stats(
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    extension: Optional[str] = Query(None, description="Calls in which the extension's endpoint took part"),
+    trunk: Optional[int] = Query(None, description="Trunk id"),
+    source: str = Query(
+        "raw", pattern="^(raw|rollup)$",
+        description="raw cdr table (exact), or rollup: cheap on large tables, hour-precision "
+                    "date_from/date_to and approximate p50/p95 durations",
+    ),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get comprehensive call statistics, optionally scoped by date range, extension and trunk"""
+    stats = rollup_stats if source == "rollup" else cdr_stats
+    return CDRStatsResponse(source=source, **stats(db, date_from, date_to, extension, trunk))
+
+
+@router.post("/rollups/rebuild")
+async def rebuild_cdr_rollups(
+    request: Request,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Recompute the hourly/daily CDR rollups from the raw records (whole days)"""
+    result = await asyncio.to_thread(rebuild_rollups, date_from, date_to)
+    log_action(db, current_user.username, "cdr_rollups_rebuilt", "cdr", None,
+               result, request.client.host if request.client else None)
+    return result
+
+
+@router.get("/archive")
+async def get_cdr_archive(current_user: User = Depends(require_admin)):
+    """Archive files of CDRs past the retention period, plus partition/retention status"""
+    status = await _leader_call("cdr.maintenance_status")
+    return {**status, "archives": await asyncio.to_thread(list_archives)}
+
+
+@router.get("/archive/{month}", response_model=List[CDRResponse])
+async def get_archived_cdr(
+    month: str,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    src: Optional[str] = None,
+    dst: Optional[str] = None,
+    disposition: Optional[str] = None,
+    current_user: User = Depends(require_admin),
+):
+    """Read archived call detail records of a month (YYYY-MM), oldest first"""
+    records = await asyncio.to_thread(read_archive, month, src, dst, disposition, limit, offset)
+    if records is None:
+        raise HTTPException(status_code=404, detail=f"No CDR archive for {month}")
+    return records
+
+
+@router.post("/retention/run")
+async def run_cdr_retention(
+    request: Request,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Create upcoming partitions and archive expired months now (in the background)"""
+    result = await _leader_call("cdr.maintenance")
+    log_action(db, current_user.username, "cdr_retention_run", "cdr", None,
+               result, request.client.host if request.client else None)
+    return result
+
+
 @router.get("/recent")
 async def get_recent_calls(limit: int = 10, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Get most recent calls for dashboard widget"""
@@ -8,8 +8,12 @@ from datetime import datetime
 from sqlalchemy import text
 import logging
 from database import SessionLocal, User, SIPPeer, SIPTrunk
-from auth import get_current_user
+from auth import get_current_user, require_admin
 from version import VERSION
+from cdr_writer import cdr_writer
+from cache import response_cache, DASHBOARD
+from ws_manager import ws_manager
+from worker_bus import worker_bus
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -24,59 +28,22 @@ def set_ami_client(client):
 @router.get("/status")
 async def get_dashboard_status(current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
     """Get current system status for dashboard"""
-    
+    # Same for every user - all open dashboards share one computation per TTL
+    return await response_cache.get_or_compute(DASHBOARD + "status", _build_dashboard_status)
+
+
+async def _build_dashboard_status() -> Dict[str, Any]:
     asterisk_status = "disconnected"
     endpoints = []
+    endpoints_updated = None
     
     # Check Asterisk connection and get endpoints
     if ami_client and ami_client.connected:
         asterisk_status = "connected"
         
-        try:
-            response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowEndpoints'
-            })
-            
-            if response:
-                for item in response:
-                    # Item ist bereits ein dict-ähnliches Objekt
-                    event = item.get('Event', '')
-                    
-                    if event == 'EndpointList':
-                        endpoint = item.get('ObjectName', '')
-                        device_state = item.get('DeviceState', '')
-                        
-                        # Hole Contact-Infos für RTT
-                        rtt_ms = 0
-                        try:
-                            contact_response = await ami_client.manager.send_action({
-                                'Action': 'PJSIPShowContacts',
-                                'Endpoint': endpoint
-                            })
-                            
-                            if contact_response:
-                                for contact_item in contact_response:
-                                    if contact_item.get('Event') == 'ContactList':
-                                        rtt = contact_item.get('RoundtripUsec', '0')
-                                        try:
-                                            rtt_ms = float(rtt) / 1000
-                                        except:
-                                            rtt_ms = 0
-                                        break
-                        except:
-                            pass
-                        
-                        # Status basiert auf DeviceState
-                        status = 'online' if device_state == 'Not in use' else 'offline'
-                        
-                        endpoints.append({
-                            'endpoint': endpoint,
-                            'status': status,
-                            'rtt': round(rtt_ms, 1)
-                        })
-                        
-        except Exception as e:
-            logger.error(f"Error fetching endpoints: {e}")
+        # Served from the event-driven endpoint state store, no AMI round-trips
+        endpoints = ami_client.endpoint_states.snapshot()
+        endpoints_updated = ami_client.endpoint_states.last_updated
     
     # Build lookup maps from DB for friendly names
     db_status = "disconnected"
@@ -155,6 +122,7 @@ async def get_dashboard_status(current_user: User = Depends(get_current_user)) -
         "version": VERSION,
         "asterisk": asterisk_status,
         "endpoints": endpoints,
+        "endpoints_updated": endpoints_updated.isoformat() if endpoints_updated else None,
         "system": {
             "health": system_health,
             "issues": health_issues,
@@ -162,3 +130,16 @@ async def get_dashboard_status(current_user: User = Depends(get_current_user)) -
             "api": "running"
         }
     }
+
+
+@router.get("/metrics")
+async def get_metrics(current_user: User = Depends(require_admin)) -> Dict[str, Any]:
+    """Internal pipeline metrics (queue depths, drop counters) for sizing"""
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "ami": ami_client.get_pipeline_stats() if ami_client else None,
+        "cdr_writer": cdr_writer.stats(),
+        "cache": response_cache.stats(),
+        "websocket": ws_manager.stats(),
+        "worker_bus": worker_bus.stats(),
+    }
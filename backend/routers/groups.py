@@ -9,10 +9,9 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 import logging
 
-from database import get_db, RingGroup, RingGroupMember, SIPPeer, IVRMenu, User, InboundRoute, CallForward, VoicemailMailbox, SIPTrunk
+from database import get_db, RingGroup, RingGroupMember, SIPPeer, User, InboundRoute, SIPTrunk
 from auth import get_current_user
-from dialplan import write_extensions_config, reload_dialplan
-from queue_config import write_queues_config, reload_queues
+from reload_scheduler import reload_scheduler
 from audit import log_action
 
 logger = logging.getLogger(__name__)
@@ -115,21 +114,6 @@ def _sync_inbound_route(db: Session, group: RingGroup, trunk_id: int | None, did
     db.commit()
 
 
-def _regenerate_all(db: Session):
-    all_routes = db.query(InboundRoute).all()
-    all_forwards = db.query(CallForward).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
-    write_queues_config(all_groups)
-    reload_queues()
-
-
 def _to_response(group: RingGroup) -> dict:
     members = sorted(group.members, key=lambda m: m.position)
     return {
@@ -193,7 +177,7 @@ def create_group(group: RingGroupCreate, request: Request, current_user: User =
     log_action(db, current_user.username, "group_created", "ring_group", db_group.name,
                {"extension": db_group.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    reload_scheduler.mark_dirty("queues", "dialplan")
 
     return _to_response(db_group)
 
@@ -257,7 +241,7 @@ def update_group(group_id: int, group: RingGroupUpdate, request: Request, curren
     log_action(db, current_user.username, "group_updated", "ring_group", db_group.name,
                {"extension": db_group.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    reload_scheduler.mark_dirty("queues", "dialplan")
 
     return _to_response(db_group)
 
@@ -283,6 +267,6 @@ def delete_group(group_id: int, request: Request, current_user: User = Depends(g
 
     log_action(db, current_user.username, "group_deleted", "ring_group", name, {}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    reload_scheduler.mark_dirty("queues", "dialplan")
 
     return {"status": "ok"}
@@ -12,10 +12,9 @@ import logging
 import re
 import os
 
-from database import get_db, IVRMenu, IVROption, SIPPeer, RingGroup, User, InboundRoute, CallForward, VoicemailMailbox, SIPTrunk
+from database import get_db, IVRMenu, IVROption, SIPPeer, RingGroup, User, InboundRoute, SIPTrunk
 from auth import get_current_user
-from dialplan import write_extensions_config, reload_dialplan
-from queue_config import write_queues_config, reload_queues
+from reload_scheduler import reload_scheduler
 from audit import log_action
 
 logger = logging.getLogger(__name__)
@@ -129,21 +128,6 @@ def _sync_inbound_route(db: Session, menu: IVRMenu, trunk_id: int | None, did: s
     db.commit()
 
 
-def _regenerate_all(db: Session):
-    all_routes = db.query(InboundRoute).all()
-    all_forwards = db.query(CallForward).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
-    write_queues_config(all_groups)
-    reload_queues()
-
-
 def _to_response(menu: IVRMenu) -> dict:
     options = sorted(menu.options, key=lambda o: o.position)
     return {
@@ -216,7 +200,7 @@ def create_menu(menu: IVRMenuCreate, request: Request, current_user: User = Depe
     log_action(db, current_user.username, "ivr_created", "ivr", db_menu.name,
                {"extension": db_menu.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return _to_response(db_menu)
 
@@ -292,7 +276,7 @@ def update_menu(menu_id: int, menu: IVRMenuUpdate, request: Request, current_use
     log_action(db, current_user.username, "ivr_updated", "ivr", db_menu.name,
                {"extension": db_menu.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return _to_response(db_menu)
 
@@ -318,7 +302,7 @@ def delete_menu(menu_id: int, request: Request, current_user: User = Depends(get
 
     log_action(db, current_user.username, "ivr_deleted", "ivr", name, {}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return {"status": "ok"}
 
@@ -13,12 +13,11 @@ from pydantic import BaseModel
 from datetime import datetime
 import logging
 
-from database import get_db, SIPPeer, SIPTrunk, RingGroup, IVRMenu, User, VoicemailMailbox, SystemSettings, InboundRoute, CallForward
-from pjsip_config import write_pjsip_config, reload_asterisk, DEFAULT_CODECS
-from voicemail_config import write_voicemail_config, reload_voicemail
-from dialplan import write_extensions_config, reload_dialplan
+from database import get_db, SIPPeer, User, VoicemailMailbox, InboundRoute, CallForward
+from reload_scheduler import reload_scheduler
 from auth import get_current_user
 from audit import log_action
+from cache import response_cache, DASHBOARD
 
 logger = logging.getLogger(__name__)
 
@@ -158,34 +157,6 @@ class SIPPeerResponse(SIPPeerBase):
         from_attributes = True
 
 
-def regenerate_voicemail_config(db: Session):
-    """Regenerate voicemail.conf from database and reload Asterisk"""
-    try:
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        write_voicemail_config(all_mailboxes)
-        reload_voicemail()
-        logger.info(f"✓ Voicemail config regenerated with {len(all_mailboxes)} mailboxes")
-    except Exception as e:
-        logger.error(f"✗ Failed to regenerate voicemail config: {e}")
-
-
-def regenerate_pjsip_config(db: Session):
-    """Regenerate pjsip.conf from database and reload Asterisk"""
-    try:
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
-        global_codecs = setting.value if setting else DEFAULT_CODECS
-        acl_setting = db.query(SystemSettings).filter(SystemSettings.key == "ip_whitelist_enabled").first()
-        acl_on = acl_setting is not None and acl_setting.value == "true"
-        write_pjsip_config(all_peers, all_trunks, global_codecs=global_codecs, acl_enabled=acl_on)
-        reload_asterisk()
-        logger.info(f"✓ PJSIP config regenerated with {len(all_peers)} peers")
-    except Exception as e:
-        logger.error(f"✗ Failed to regenerate PJSIP config: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 @router.get("/", response_model=List[SIPPeerResponse])
 def list_peers(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     return db.query(SIPPeer).all()
@@ -208,6 +179,7 @@ def create_peer(peer: SIPPeerCreate, request: Request, current_user: User = Depe
     db_peer = SIPPeer(**peer.model_dump())
     db.add(db_peer)
     db.commit()
+    response_cache.invalidate(DASHBOARD)
     db.refresh(db_peer)
 
     # Auto-create voicemail mailbox
@@ -220,8 +192,7 @@ def create_peer(peer: SIPPeerCreate, request: Request, current_user: User = Depe
     logger.info(f"✓ Created SIP peer: {peer.extension}")
     log_action(db, current_user.username, "peer_created", "peer", peer.extension,
                {"caller_id": peer.caller_id}, request.client.host if request.client else None)
-    regenerate_pjsip_config(db)
-    regenerate_voicemail_config(db)
+    reload_scheduler.mark_dirty("pjsip", "voicemail")
 
     # Add password strength warning
     strength = check_password_strength(peer.secret, peer.extension)
@@ -245,12 +216,13 @@ def update_peer(peer_id: int, peer: SIPPeerUpdate, request: Request, current_use
 
     db_peer.updated_at = datetime.utcnow()
     db.commit()
+    response_cache.invalidate(DASHBOARD)
     db.refresh(db_peer)
 
     logger.info(f"✓ Updated SIP peer: {peer.extension}")
     log_action(db, current_user.username, "peer_updated", "peer", peer.extension,
                {"caller_id": peer.caller_id}, request.client.host if request.client else None)
-    regenerate_pjsip_config(db)
+    reload_scheduler.mark_dirty("pjsip")
 
     return db_peer
 
@@ -280,23 +252,13 @@ def delete_peer(peer_id: int, request: Request, current_user: User = Depends(get
 
     db.delete(db_peer)
     db.commit()
+    response_cache.invalidate(DASHBOARD)
 
     logger.info(f"✓ Deleted SIP peer: {extension} (freed {len(routes)} routes, {len(forwards)} forwards)")
     log_action(db, current_user.username, "peer_deleted", "peer", extension,
                None, request.client.host if request.client else None)
-    regenerate_pjsip_config(db)
-    regenerate_voicemail_config(db)
-
-    # Regenerate dialplan to remove references to deleted extension
-    all_routes = db.query(InboundRoute).all()
-    all_forwards = db.query(CallForward).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
+    # The dialplan must drop its references to the deleted extension too
+    reload_scheduler.mark_dirty("pjsip", "voicemail", "dialplan")
 
     return {"status": "deleted", "extension": extension}
 
@@ -312,7 +274,7 @@ def update_peer_codecs(peer_id: int, data: PeerCodecUpdate, current_user: User =
     db.commit()
 
     logger.info(f"Updated codecs for peer {db_peer.extension}: {data.codecs or 'global'}")
-    regenerate_pjsip_config(db)
+    reload_scheduler.mark_dirty("pjsip")
 
     return {"status": "ok", "codecs": db_peer.codecs}
 
@@ -337,6 +299,7 @@ def assign_user_to_peer(
     db_peer.user_id = data.user_id
     db_peer.updated_at = datetime.utcnow()
     db.commit()
+    response_cache.invalidate(DASHBOARD)
 
     log_action(db, current_user.username, "peer_user_assigned", "peer", db_peer.extension,
                {"user_id": data.user_id}, request.client.host if request.client else None)
@@ -375,14 +338,6 @@ def update_peer_outbound(
                {"outbound_cid": data.outbound_cid, "pai": data.pai}, request.client.host if request.client else None)
 
     # Regenerate dialplan with new outbound CID / PAI
-    all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-    all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
+    reload_scheduler.mark_dirty("dialplan")
 
     return {"status": "ok", "outbound_cid": db_peer.outbound_cid, "pai": db_peer.pai}
@@ -9,8 +9,8 @@ from pydantic import BaseModel
 from datetime import datetime
 import logging
 
-from database import get_db, InboundRoute, SIPTrunk, SIPPeer, RingGroup, IVRMenu, User, CallForward, VoicemailMailbox
-from dialplan import write_extensions_config, reload_dialplan
+from database import get_db, InboundRoute, SIPTrunk, SIPPeer, RingGroup, IVRMenu, User
+from reload_scheduler import reload_scheduler
 from auth import get_current_user
 from audit import log_action
 
@@ -44,24 +44,6 @@ class InboundRouteResponse(InboundRouteBase):
         from_attributes = True
 
 
-def regenerate_dialplan(db: Session):
-    """Regenerate extensions.conf and reload Asterisk dialplan"""
-    try:
-        all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-        all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        all_groups = db.query(RingGroup).all()
-        all_ivr = db.query(IVRMenu).all()
-        write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-        reload_dialplan()
-        logger.info(f"Dialplan regenerated with {len(all_routes)} inbound routes")
-    except Exception as e:
-        logger.error(f"Failed to regenerate dialplan: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 @router.get("/", response_model=List[InboundRouteResponse])
 def list_routes(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     return db.query(InboundRoute).all()
@@ -100,7 +82,7 @@ def create_route(route: InboundRouteCreate, request: Request, current_user: User
     logger.info(f"Created inbound route: {route.did} -> {route.destination_extension}")
     log_action(db, current_user.username, "route_created", "route", route.did,
                {"destination": route.destination_extension}, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return db_route
 
@@ -133,7 +115,7 @@ def update_route(route_id: int, route: InboundRouteUpdate, request: Request, cur
     logger.info(f"Updated inbound route: {route.did} -> {route.destination_extension}")
     log_action(db, current_user.username, "route_updated", "route", route.did,
                {"destination": route.destination_extension}, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return db_route
 
@@ -159,6 +141,6 @@ def delete_route(route_id: int, request: Request, current_user: User = Depends(g
     logger.info(f"Deleted inbound route: {did}")
     log_action(db, current_user.username, "route_deleted", "route", did,
                None, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    reload_scheduler.mark_dirty("dialplan")
 
     return {"status": "deleted", "did": did}
@@ -2,6 +2,7 @@
 Settings Router - Admin-only system settings management
 """
 
+import asyncio
 import json
 import ipaddress
 import os
@@ -20,14 +21,16 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 
-from database import get_db, SystemSettings, VoicemailMailbox, SIPPeer, SIPTrunk
+from database import get_db, SystemSettings
 from auth import require_admin, User
 from email_config import write_msmtp_config, send_test_email
-from voicemail_config import write_voicemail_config, reload_voicemail
-from pjsip_config import write_pjsip_config, reload_asterisk, DEFAULT_CODECS
-from acl_config import write_acl_config, remove_acl_config, reload_acl
+from pjsip_config import DEFAULT_CODECS
+from reload_scheduler import reload_scheduler
+from config_output import config_state
 from version import VERSION
 from audit import log_action
+from cache import response_cache, SERVER_INFO, SERVER_INFO_TTL
+from worker_bus import worker_bus, WorkerBusError
 
 logger = logging.getLogger(__name__)
 
@@ -119,9 +122,7 @@ def update_settings(
         write_msmtp_config(full_settings)
 
     # Regenerate voicemail.conf with SMTP settings
-    mailboxes = db.query(VoicemailMailbox).all()
-    write_voicemail_config(mailboxes, full_settings)
-    reload_voicemail()
+    reload_scheduler.mark_dirty("voicemail")
 
     log_action(db, current_user.username, "settings_updated", "settings", "smtp",
                None, request.client.host if request.client else None)
@@ -191,6 +192,38 @@ def get_ha_settings(
     return result
 
 
+async def _apply_ha_settings(settings: dict):
+    """Bus method (leader): update API key, reconnect MQTT if enabled"""
+    from mqtt_client import mqtt_publisher
+    from auth import update_ha_api_key
+
+    if settings.get("ha_api_key"):
+        update_ha_api_key(settings["ha_api_key"])
+        worker_bus.publish({"type": "ha_api_key", "key": settings["ha_api_key"]})
+
+    # Broker connect blocks, keep it off the event loop
+    if settings.get("ha_enabled") == "true" and settings.get("mqtt_broker"):
+        await asyncio.to_thread(
+            mqtt_publisher.reconfigure,
+            broker=settings["mqtt_broker"],
+            port=int(settings.get("mqtt_port") or 1883),
+            user=settings.get("mqtt_user", ""),
+            password=settings.get("mqtt_password", ""),
+        )
+    else:
+        await asyncio.to_thread(mqtt_publisher.disconnect)
+
+
+async def _on_ha_api_key(message: dict):
+    """Follower: API key changed in another worker"""
+    from auth import update_ha_api_key
+    update_ha_api_key(message["key"])
+
+
+worker_bus.register_rpc("home_assistant.apply", _apply_ha_settings)
+worker_bus.on_message("ha_api_key", _on_ha_api_key)
+
+
 @router.put("/home-assistant")
 def update_ha_settings(
     data: HASettingsUpdate,
@@ -199,7 +232,6 @@ def update_ha_settings(
     current_user: User = Depends(require_admin),
 ):
     """Save Home Assistant settings, reconnect MQTT, update API key."""
-    from mqtt_client import mqtt_publisher
     from auth import update_ha_api_key
 
     settings_dict = data.model_dump()
@@ -226,20 +258,13 @@ def update_ha_settings(
         s = db.query(SystemSettings).filter(SystemSettings.key == key).first()
         full[key] = s.value if s else ""
 
-    # Update API key in auth module
-    if full.get("ha_api_key"):
-        update_ha_api_key(full["ha_api_key"])
-
-    # Reconnect MQTT if enabled
-    if full.get("ha_enabled") == "true" and full.get("mqtt_broker"):
-        mqtt_publisher.reconfigure(
-            broker=full["mqtt_broker"],
-            port=int(full.get("mqtt_port") or 1883),
-            user=full.get("mqtt_user", ""),
-            password=full.get("mqtt_password", ""),
-        )
-    else:
-        mqtt_publisher.disconnect()
+    # MQTT runs in the leader worker, which also passes the API key on to all workers
+    try:
+        worker_bus.call_threadsafe("home_assistant.apply", settings=full)
+    except WorkerBusError as e:
+        logger.warning(f"Could not apply HA settings in the leader worker: {e}")
+        if full.get("ha_api_key"):
+            update_ha_api_key(full["ha_api_key"])
 
     log_action(db, current_user.username, "ha_settings_updated", "settings", "home-assistant",
                None, request.client.host if request.client else None)
@@ -335,23 +360,13 @@ def update_codec_settings(
     db.commit()
 
     # Regenerate pjsip.conf
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    acl_on = _is_acl_enabled(db)
-    write_pjsip_config(all_peers, all_trunks, global_codecs=",".join(codecs), acl_enabled=acl_on)
-    reload_asterisk()
+    reload_scheduler.mark_dirty("pjsip")
 
     return {"status": "ok", "global_codecs": ",".join(codecs)}
 
 
 # --- IP Whitelist ---
 
-def _is_acl_enabled(db: Session) -> bool:
-    """Check if IP whitelist is enabled in DB."""
-    s = db.query(SystemSettings).filter(SystemSettings.key == "ip_whitelist_enabled").first()
-    return s is not None and s.value == "true"
-
-
 def _validate_ip_or_cidr(value: str) -> bool:
     """Validate that a string is a valid IP address or CIDR network."""
     try:
@@ -416,20 +431,8 @@ def update_ip_whitelist(
             db.add(setting)
     db.commit()
 
-    # Generate/remove ACL config
-    if data.enabled and clean_ips:
-        write_acl_config(clean_ips)
-    else:
-        remove_acl_config()
-    reload_acl()
-
-    # Regenerate pjsip.conf with or without acl line
-    codec_setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
-    global_codecs = codec_setting.value if codec_setting else DEFAULT_CODECS
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    write_pjsip_config(all_peers, all_trunks, global_codecs=global_codecs, acl_enabled=data.enabled and len(clean_ips) > 0)
-    reload_asterisk()
+    # Generate/remove ACL config, then pjsip.conf with or without acl line
+    reload_scheduler.mark_dirty("acl", "pjsip")
 
     log_action(db, current_user.username, "whitelist_updated", "settings", "ip_whitelist",
                {"enabled": data.enabled, "count": len(clean_ips)},
@@ -591,6 +594,7 @@ def unban_ip(
         logger.info(f"Fail2Ban unban: IP {data.ip} from jail {data.jail} by {current_user.username}, result: {result}")
         log_action(db, current_user.username, "ip_unbanned", "fail2ban", data.ip,
                    {"jail": data.jail}, request.client.host if request.client else None)
+        response_cache.invalidate(SERVER_INFO)
         return {"status": "ok", "ip": data.ip, "jail": data.jail}
     except Exception as e:
         logger.error(f"Fail2Ban unban failed: {e}")
@@ -688,10 +692,17 @@ def _get_container_status() -> list:
 
 
 @router.get("/server-info")
-def get_server_info(
+async def get_server_info(
     current_user: User = Depends(require_admin),
 ):
     """Get server system information."""
+    # docker compose ps and the fail2ban socket are slow - share one result between admins
+    return await response_cache.get_or_compute(
+        SERVER_INFO, lambda: asyncio.to_thread(_collect_server_info), ttl=SERVER_INFO_TTL
+    )
+
+
+def _collect_server_info() -> dict:
     f2b = _get_fail2ban_status()
     f2b_summary = None
     if f2b.get("available"):
@@ -707,6 +718,25 @@ def get_server_info(
     }
 
 
+@router.get("/config-state")
+async def get_config_state(
+    current_user: User = Depends(require_admin),
+):
+    """Generated Asterisk config files: generator, written and loaded hash, reload pending."""
+    return await asyncio.to_thread(config_state)
+
+
+@router.get("/reload-status")
+async def get_reload_status(
+    current_user: User = Depends(require_admin),
+):
+    """Pending and last applied generation per config domain - a change is live once applied."""
+    try:
+        return await worker_bus.call("reload.status")
+    except WorkerBusError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
 @router.get("/check-update")
 def check_update(
     current_user: User = Depends(require_admin),
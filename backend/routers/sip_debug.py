@@ -1,6 +1,7 @@
 """
 SIP Debug API Router
 Enable/disable PJSIP history capture, view captured SIP messages by Call-ID.
+The capture buffer lives in the leader worker; requests go through the worker bus.
 """
 from fastapi import APIRouter, Depends, HTTPException
 from typing import Dict, Any
@@ -8,6 +9,7 @@ import logging
 from auth import get_current_user
 from database import User
 from sip_debug import sip_debug_buffer
+from worker_bus import worker_bus, WorkerBusError
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -17,9 +19,9 @@ def set_ami_client(client):
     sip_debug_buffer.set_ami_client(client)
 
 
-@router.get("/status")
-async def get_status(current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
-    """Get SIP debug capture status."""
+# Bus methods, executed in the leader worker
+
+async def _status() -> Dict[str, Any]:
     sip_debug_buffer.cleanup_old()
     return {
         "enabled": sip_debug_buffer.enabled,
@@ -28,6 +30,34 @@ async def get_status(current_user: User = Depends(get_current_user)) -> Dict[str
     }
 
 
+async def _calls() -> list:
+    return sip_debug_buffer.get_calls()
+
+
+async def _call_messages(call_id: str) -> list:
+    return sip_debug_buffer.get_call_messages(call_id)
+
+
+worker_bus.register_rpc("sip_debug.status", _status)
+worker_bus.register_rpc("sip_debug.enable", sip_debug_buffer.enable)
+worker_bus.register_rpc("sip_debug.disable", sip_debug_buffer.disable)
+worker_bus.register_rpc("sip_debug.calls", _calls)
+worker_bus.register_rpc("sip_debug.call_messages", _call_messages)
+
+
+async def _leader_call(method: str, **params):
+    try:
+        return await worker_bus.call(method, **params)
+    except WorkerBusError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/status")
+async def get_status(current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
+    """Get SIP debug capture status."""
+    return await _leader_call("sip_debug.status")
+
+
 @router.post("/enable")
 async def enable_capture(current_user: User = Depends(get_current_user)):
     """Enable PJSIP history and start polling for SIP messages."""
@@ -35,7 +65,7 @@ async def enable_capture(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Admin only")
 
     try:
-        await sip_debug_buffer.enable()
+        await worker_bus.call("sip_debug.enable")
         return {"status": "enabled"}
     except RuntimeError as e:
         raise HTTPException(status_code=503, detail=str(e))
@@ -49,7 +79,7 @@ async def disable_capture(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
 
-    await sip_debug_buffer.disable()
+    await _leader_call("sip_debug.disable")
     return {"status": "disabled"}
 
 
@@ -58,7 +88,7 @@ async def get_calls(current_user: User = Depends(get_current_user)):
     """Get list of calls with SIP data."""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
-    return sip_debug_buffer.get_calls()
+    return await _leader_call("sip_debug.calls")
 
 
 @router.get("/calls/{call_id:path}")
@@ -66,7 +96,7 @@ async def get_call_messages(call_id: str, current_user: User = Depends(get_curre
     """Get SIP messages for a specific Call-ID."""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
-    messages = sip_debug_buffer.get_call_messages(call_id)
+    messages = await _leader_call("sip_debug.call_messages", call_id=call_id)
     if not messages:
         raise HTTPException(status_code=404, detail="Call-ID nicht gefunden")
     return messages
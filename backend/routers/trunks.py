@@ -10,10 +10,13 @@ from pydantic import BaseModel
 from datetime import datetime, timedelta
 import logging
 
-from database import get_db, SIPTrunk, SIPPeer, User, SystemSettings, InboundRoute, CDR
-from pjsip_config import write_pjsip_config, reload_asterisk, DEFAULT_CODECS
+from database import get_db, SessionLocal, SIPTrunk, User, InboundRoute
+from pjsip_config import DEFAULT_CODECS
+from reload_scheduler import reload_scheduler
 from auth import get_current_user
 from audit import log_action
+from cache import response_cache, DASHBOARD, TRUNK_STATUS
+from cdr_rollups import trunk_call_counts
 
 logger = logging.getLogger(__name__)
 
@@ -74,23 +77,6 @@ class SIPTrunkResponse(SIPTrunkBase):
         from_attributes = True
 
 
-def regenerate_config(db: Session):
-    """Regenerate pjsip.conf from database and reload Asterisk"""
-    try:
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
-        global_codecs = setting.value if setting else DEFAULT_CODECS
-        acl_setting = db.query(SystemSettings).filter(SystemSettings.key == "ip_whitelist_enabled").first()
-        acl_on = acl_setting is not None and acl_setting.value == "true"
-        write_pjsip_config(all_peers, all_trunks, global_codecs=global_codecs, acl_enabled=acl_on)
-        reload_asterisk()
-        logger.info(f"PJSIP config regenerated with {len(all_peers)} peers, {len(all_trunks)} trunks")
-    except Exception as e:
-        logger.error(f"Failed to regenerate PJSIP config: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 @router.get("/", response_model=List[SIPTrunkResponse])
 def list_trunks(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     return db.query(SIPTrunk).all()
@@ -128,12 +114,13 @@ def create_trunk(trunk: SIPTrunkCreate, request: Request, current_user: User = D
     db_trunk = SIPTrunk(**trunk_data)
     db.add(db_trunk)
     db.commit()
+    response_cache.invalidate(DASHBOARD, TRUNK_STATUS)
     db.refresh(db_trunk)
 
     logger.info(f"Created SIP trunk: {trunk.name}")
     log_action(db, current_user.username, "trunk_created", "trunk", trunk.name,
                {"provider": trunk.provider}, request.client.host if request.client else None)
-    regenerate_config(db)
+    reload_scheduler.mark_dirty("pjsip")
 
     return db_trunk
 
@@ -175,12 +162,13 @@ def update_trunk(trunk_id: int, trunk: SIPTrunkUpdate, request: Request, current
     db_trunk.sip_server = sip_server
     db_trunk.updated_at = datetime.utcnow()
     db.commit()
+    response_cache.invalidate(DASHBOARD, TRUNK_STATUS)
     db.refresh(db_trunk)
 
     logger.info(f"Updated SIP trunk: {trunk.name}")
     log_action(db, current_user.username, "trunk_updated", "trunk", trunk.name,
                {"provider": trunk.provider}, request.client.host if request.client else None)
-    regenerate_config(db)
+    reload_scheduler.mark_dirty("pjsip")
 
     return db_trunk
 
@@ -200,11 +188,12 @@ def delete_trunk(trunk_id: int, request: Request, current_user: User = Depends(g
 
     db.delete(db_trunk)
     db.commit()
+    response_cache.invalidate(DASHBOARD, TRUNK_STATUS)
 
     logger.info(f"Deleted SIP trunk: {name} (and {len(routes)} inbound routes)")
     log_action(db, current_user.username, "trunk_deleted", "trunk", name,
                None, request.client.host if request.client else None)
-    regenerate_config(db)
+    reload_scheduler.mark_dirty("pjsip")
 
     return {"status": "deleted", "name": name}
 
@@ -256,8 +245,21 @@ def get_available_dids(current_user: User = Depends(get_current_user), db: Sessi
 
 
 @router.get("/{trunk_id}/status")
-async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
     """Get detailed status for a specific trunk including registration, endpoint, routes, and stats"""
+    return await response_cache.get_or_compute(f"{TRUNK_STATUS}{trunk_id}", lambda: _build_trunk_status(trunk_id))
+
+
+async def _build_trunk_status(trunk_id: int) -> Dict[str, Any]:
+    # Own session: the shared computation may outlive the request that started it
+    db = SessionLocal()
+    try:
+        return await _collect_trunk_status(trunk_id, db)
+    finally:
+        db.close()
+
+
+async def _collect_trunk_status(trunk_id: int, db: Session) -> Dict[str, Any]:
     db_trunk = db.query(SIPTrunk).filter(SIPTrunk.id == trunk_id).first()
     if not db_trunk:
         raise HTTPException(status_code=404, detail="Trunk not found")
@@ -284,9 +286,7 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
     if ami_client and ami_client.connected:
         # Get outbound registration status
         try:
-            reg_response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowRegistrationsOutbound'
-            })
+            reg_response = await ami_client.send_action('PJSIPShowRegistrationsOutbound')
             if reg_response:
                 for item in reg_response:
                     if item.get('Event') == 'OutboundRegistrationDetail':
@@ -302,10 +302,7 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
 
         # Get endpoint details
         try:
-            ep_response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowEndpoint',
-                'Endpoint': ep_name
-            })
+            ep_response = await ami_client.send_action('PJSIPShowEndpoint', Endpoint=ep_name)
             if ep_response:
                 for item in ep_response:
                     if item.get('Event') == 'EndpointDetail':
@@ -316,10 +313,7 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
 
         # Get contacts (RTT/latency)
         try:
-            contact_response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowContacts',
-                'Endpoint': ep_name
-            })
+            contact_response = await ami_client.send_action('PJSIPShowContacts', Endpoint=ep_name)
             if contact_response:
                 for item in contact_response:
                     try:
@@ -349,41 +343,13 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
         for r in trunk_routes
     ]
 
-    # CDR statistics
-    now = datetime.utcnow()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start = today_start - timedelta(days=today_start.weekday())
-    trunk_channel_pattern = f"%{ep_name}%"
-
-    calls_today = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= today_start,
-        (CDR.channel.like(trunk_channel_pattern) | CDR.dstchannel.like(trunk_channel_pattern))
-    ).scalar() or 0
-
-    calls_week = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= week_start,
-        (CDR.channel.like(trunk_channel_pattern) | CDR.dstchannel.like(trunk_channel_pattern))
-    ).scalar() or 0
-
-    inbound_today = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= today_start,
-        CDR.channel.like(trunk_channel_pattern)
-    ).scalar() or 0
-
-    outbound_today = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= today_start,
-        CDR.dstchannel.like(trunk_channel_pattern)
-    ).scalar() or 0
+    # CDR statistics from the daily rollup
+    stats = trunk_call_counts(db, trunk_id)
 
     return {
         "trunk": trunk_data,
         "registration": registration,
         "endpoint": endpoint_info,
         "routes": routes_data,
-        "stats": {
-            "calls_today": calls_today,
-            "calls_week": calls_week,
-            "inbound_today": inbound_today,
-            "outbound_today": outbound_today,
-        }
+        "stats": stats
     }
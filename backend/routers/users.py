@@ -15,6 +15,7 @@ from datetime import datetime
 from database import get_db, User, SIPPeer, SystemSettings
 from auth import get_password_hash, require_admin
 from audit import log_action
+from cache import response_cache, DASHBOARD
 from email_config import send_welcome_email
 
 router = APIRouter()
@@ -93,6 +94,7 @@ def create_user(
     db.add(user)
     try:
         db.commit()
+        response_cache.invalidate(DASHBOARD)
     except Exception:
         db.rollback()
         raise HTTPException(
@@ -125,6 +127,7 @@ def update_user(
         user.role = data.role
 
     db.commit()
+    response_cache.invalidate(DASHBOARD)
     db.refresh(user)
     log_action(db, admin.username, "user_updated", "user", user.username,
                {"full_name": data.full_name, "email": data.email, "role": data.role},
@@ -158,6 +161,7 @@ def upload_avatar(
 
     user.avatar_url = f"/api/users/{user_id}/avatar"
     db.commit()
+    response_cache.invalidate(DASHBOARD)
 
     log_action(db, admin.username, "avatar_uploaded", "user", user.username,
                None, request.client.host if request.client else None)
@@ -198,6 +202,7 @@ def assign_extension_to_user(
         peer.user_id = user_id
 
     db.commit()
+    response_cache.invalidate(DASHBOARD)
     log_action(db, admin.username, "extension_assigned", "user", user.username,
                {"extension": data.extension}, request.client.host if request.client else None)
     return {"message": "Extension assigned", "extension": data.extension}
@@ -274,6 +279,7 @@ def delete_user(
     username = user.username
     db.delete(user)
     db.commit()
+    response_cache.invalidate(DASHBOARD)
     log_action(db, admin.username, "user_deleted", "user", username,
                None, request.client.host if request.client else None)
     return {"message": f"User '{username}' deleted"}
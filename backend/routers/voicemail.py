@@ -6,11 +6,9 @@ from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, func
 from pydantic import BaseModel
-from database import Base, get_db, User, VoicemailMailbox, SIPPeer, SIPTrunk, RingGroup, IVRMenu
+from database import Base, get_db, User, VoicemailMailbox
 from auth import get_current_user, JWT_SECRET, JWT_ALGORITHM
-from voicemail_config import write_voicemail_config, reload_voicemail
-from dialplan import write_extensions_config, reload_dialplan
-from database import InboundRoute, CallForward
+from reload_scheduler import reload_scheduler
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from jose import JWTError, jwt as jose_jwt
@@ -30,17 +28,6 @@ class MailboxUpdate(BaseModel):
     ring_timeout: int = 20
 
 
-def regenerate_voicemail_config(db: Session):
-    """Regenerate voicemail.conf from database and reload Asterisk"""
-    try:
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        write_voicemail_config(all_mailboxes)
-        reload_voicemail()
-        logger.info(f"Voicemail config regenerated with {len(all_mailboxes)} mailboxes")
-    except Exception as e:
-        logger.error(f"Failed to regenerate voicemail config: {e}")
-
-
 # ==================== Mailbox Config Endpoints ====================
 
 @router.get("/mailbox/{extension}")
@@ -69,20 +56,8 @@ async def update_mailbox(extension: str, data: MailboxUpdate, current_user: User
     mb.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(mb)
-    regenerate_voicemail_config(db)
-    # Regenerate dialplan so ring_timeout takes effect
-    try:
-        all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-        all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        all_groups = db.query(RingGroup).all()
-        all_ivr = db.query(IVRMenu).all()
-        write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-        reload_dialplan()
-    except Exception as e:
-        logger.error(f"Failed to regenerate dialplan after mailbox update: {e}")
+    # The dialplan too, so ring_timeout takes effect
+    reload_scheduler.mark_dirty("voicemail", "dialplan")
     return {
         "extension": mb.extension, "enabled": mb.enabled,
         "pin": mb.pin, "name": mb.name, "email": mb.email,
@@ -97,7 +72,7 @@ async def delete_mailbox(extension: str, current_user: User = Depends(get_curren
         raise HTTPException(status_code=404, detail="Mailbox not found")
     db.delete(mb)
     db.commit()
-    regenerate_voicemail_config(db)
+    reload_scheduler.mark_dirty("voicemail")
     return {"success": True, "message": f"Mailbox {extension} deleted"}
 
 
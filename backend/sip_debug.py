@@ -58,10 +58,15 @@ class SIPDebugBuffer:
         self._last_entry_num: int = -1  # last polled history entry number
         self._poll_task: asyncio.Task | None = None
         self._ami_client = None
+        self._broadcast_callback = None
 
     def set_ami_client(self, client):
         self._ami_client = client
 
+    def set_broadcast_callback(self, callback):
+        """Live SIP messages for WebSocket clients subscribed to sip_debug / a Call-ID"""
+        self._broadcast_callback = callback
+
     async def enable(self):
         """Enable history capture in Asterisk and start polling."""
         if not self._ami_client or not self._ami_client.connected:
@@ -232,6 +237,12 @@ class SIPDebugBuffer:
             self._by_call_id[call_id] = []
         self._by_call_id[call_id].append(msg)
 
+        if self._broadcast_callback:
+            await self._broadcast_callback(
+                {"type": "sip_message", "call_id": call_id, "message": self._message_dict(msg)},
+                {"event": "sip_debug", "call_id": call_id},
+            )
+
         # Hard cap
         while len(self._messages) > MAX_MESSAGES:
             old = self._messages.popleft()
@@ -314,20 +325,21 @@ class SIPDebugBuffer:
         """Return all messages for a given Call-ID."""
         self.cleanup_old()
         msgs = self._by_call_id.get(call_id, [])
-        return [
-            {
-                "timestamp": m.timestamp.isoformat(),
-                "direction": m.direction,
-                "method": m.method,
-                "status_code": m.status_code,
-                "from": m.from_header,
-                "to": m.to_header,
-                "cseq": m.cseq,
-                "raw_text": m.raw_text,
-                "addr": m.addr,
-            }
-            for m in msgs
-        ]
+        return [self._message_dict(m) for m in msgs]
+
+    @staticmethod
+    def _message_dict(m: SIPMessage) -> dict:
+        return {
+            "timestamp": m.timestamp.isoformat(),
+            "direction": m.direction,
+            "method": m.method,
+            "status_code": m.status_code,
+            "from": m.from_header,
+            "to": m.to_header,
+            "cseq": m.cseq,
+            "raw_text": m.raw_text,
+            "addr": m.addr,
+        }
 
     def clear(self):
         """Clear all stored messages."""
@@ -7,6 +7,7 @@ import subprocess
 from typing import List, Optional
 
 from database import VoicemailMailbox
+from config_output import write_config, file_hash, needs_reload, mark_applied
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +24,7 @@ def generate_voicemail_config(mailboxes: List[VoicemailMailbox], smtp_settings:
         smtp_from = smtp_settings.get("smtp_from", smtp_from)
         mailcmd = "\nmailcmd=/usr/local/bin/voicemail-sender.sh"
 
-    config = f"""; Auto-generated Voicemail configuration
+    parts = [f"""; Auto-generated Voicemail configuration
 ; Generated by GonoPBX
 
 [general]
@@ -53,15 +54,15 @@ emailbody=Hallo ${{VM_NAME}},\\n\\nSie haben eine neue Voicemail-Nachricht:\\n\\
 european=Europe/Berlin|'vm-received' Q 'digits/at' IMp
 
 [default]
-"""
+"""]
 
     for mb in mailboxes:
         if mb.enabled:
             email_part = f",{mb.email}" if mb.email else ""
             name = mb.name or mb.extension
-            config += f"{mb.extension} => {mb.pin},{name}{email_part}\n"
+            parts.append(f"{mb.extension} => {mb.pin},{name}{email_part}\n")
 
-    return config
+    return "".join(parts)
 
 
 VOICEMAIL_SPOOL = "/var/spool/asterisk/voicemail/default"
@@ -95,14 +96,12 @@ def write_voicemail_config(mailboxes: List[VoicemailMailbox], smtp_settings: Opt
     try:
         config_content = generate_voicemail_config(mailboxes, smtp_settings)
 
-        os.makedirs(os.path.dirname(VOICEMAIL_CONFIG_PATH), exist_ok=True)
-
-        with open(VOICEMAIL_CONFIG_PATH, 'w') as f:
-            f.write(config_content)
+        written = write_config(VOICEMAIL_CONFIG_PATH, config_content, "voicemail_config.write_voicemail_config")
 
         _ensure_mailbox_greetings(mailboxes)
 
-        logger.info(f"Voicemail config written with {len(mailboxes)} mailboxes")
+        if written:
+            logger.info(f"Voicemail config written with {len(mailboxes)} mailboxes")
         return True
 
     except Exception as e:
@@ -112,16 +111,21 @@ def write_voicemail_config(mailboxes: List[VoicemailMailbox], smtp_settings: Opt
 
 def reload_voicemail() -> bool:
     """Reload Asterisk voicemail - copy config inside Asterisk container"""
+    digest = file_hash(VOICEMAIL_CONFIG_PATH)
+    if not needs_reload(VOICEMAIL_CONFIG_PATH):
+        logger.info("voicemail.conf already loaded, reload skipped")
+        return True
     try:
         result = subprocess.run(
             ['docker', 'exec', 'pbx_asterisk', 'sh', '-c',
-             'cp /etc/asterisk/custom/voicemail.conf /etc/asterisk/voicemail.conf && asterisk -rx "voicemail reload"'],
+             '{ [ -L /etc/asterisk/voicemail.conf ] || cp /etc/asterisk/custom/voicemail.conf /etc/asterisk/voicemail.conf; } && asterisk -rx "voicemail reload"'],
             capture_output=True,
             text=True,
             timeout=10
         )
 
         if result.returncode == 0:
+            mark_applied(VOICEMAIL_CONFIG_PATH, digest)
             logger.info("Asterisk voicemail reloaded successfully")
             return True
         else:
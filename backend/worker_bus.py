@@ -0,0 +1,336 @@
+"""
+Worker bus
+Lets the backend run with several uvicorn workers. One worker wins a file
+lock and becomes the leader: it owns the AMI connection, CDR writer, MQTT and
+SIP debug polling. The other workers (followers) connect to the leader over a
+Unix socket, receive its state and WebSocket broadcasts as JSON lines and
+send RPC calls (AMI actions, SIP debug) to it. When the leader dies its lock
+is released and one follower takes over.
+"""
+import asyncio
+import fcntl
+import itertools
+import json
+import logging
+import os
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+BUS_LOCK_PATH = os.getenv("WORKER_BUS_LOCK", "/tmp/gonopbx-leader.lock")
+BUS_SOCKET_PATH = os.getenv("WORKER_BUS_SOCKET", "/tmp/gonopbx-bus.sock")
+RPC_TIMEOUT = float(os.getenv("WORKER_BUS_RPC_TIMEOUT", "15"))
+# Followers wait this long at startup for the leader (it runs the DB migrations)
+STARTUP_TIMEOUT = float(os.getenv("WORKER_BUS_STARTUP_TIMEOUT", "60"))
+# Output buffered for one follower before it is dropped and has to reconnect
+FOLLOWER_BUFFER_LIMIT = int(os.getenv("WORKER_BUS_BUFFER_LIMIT", str(8 * 1024 * 1024)))
+# Longest line on the bus (the hello message carries all calls and endpoints)
+MAX_LINE = 64 * 1024 * 1024
+RECONNECT_DELAY = 0.5
+
+LEADER = "leader"
+FOLLOWER = "follower"
+
+RPCHandler = Callable[..., Awaitable[Any]]
+MessageHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class WorkerBusError(RuntimeError):
+    """The leader is not reachable or the RPC failed there"""
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Mapping):
+        # panoramisk Message
+        return dict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, default=_json_default, separators=(',', ':')).encode() + b'\n'
+
+
+class WorkerBus:
+    def __init__(self, lock_path: str = BUS_LOCK_PATH, socket_path: str = BUS_SOCKET_PATH):
+        self.lock_path = lock_path
+        self.socket_path = socket_path
+        self.role: Optional[str] = None
+        self._lock_fd: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+        # Leader side
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._followers: Set[asyncio.StreamWriter] = set()
+        self._hello: Optional[Callable[[], Dict[str, Any]]] = None
+        self._rpc: Dict[str, RPCHandler] = {}
+
+        # Follower side
+        self._handlers: Dict[str, MessageHandler] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._client_task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._on_promote: Optional[Callable[[], Awaitable[None]]] = None
+
+        # Counters
+        self.published = 0
+        self.followers_dropped = 0
+        self.rpc_calls = 0
+        self.rpc_errors = 0
+        self.promotions = 0
+        self.leader_connects = 0
+
+    @property
+    def is_leader(self) -> bool:
+        return self.role == LEADER
+
+    def _try_lock(self) -> bool:
+        """Non-blocking exclusive flock; held until the process exits or close()"""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        return True
+
+    def elect(self) -> str:
+        """Decide this worker's role. Call once at startup."""
+        self._loop = asyncio.get_running_loop()
+        self.role = LEADER if self._try_lock() else FOLLOWER
+        logger.info(f"Worker {os.getpid()} is the {self.role}")
+        return self.role
+
+    def register_rpc(self, method: str, handler: RPCHandler):
+        """Method the leader executes for any worker (keyword arguments, JSON result)"""
+        self._rpc[method] = handler
+
+    def on_message(self, message_type: str, handler: MessageHandler):
+        """Handler for messages the leader pushes to followers.
+        'hello' arrives first on every connection, 'leader_lost' when it drops."""
+        self._handlers[message_type] = handler
+
+    # Leader
+
+    async def serve(self, hello: Callable[[], Dict[str, Any]]):
+        """Accept followers. hello() is the full state sent to each new follower."""
+        self._hello = hello
+        if os.path.exists(self.socket_path):
+            # Left behind by a crashed leader - we hold the lock, so it is stale
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_follower, path=self.socket_path, limit=MAX_LINE)
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Worker bus listening on {self.socket_path}")
+
+    async def _handle_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Send the state and register in the same loop step, so the follower
+        # gets every later message exactly once and in order
+        writer.write(encode(self._hello()))
+        self._followers.add(writer)
+        logger.info(f"Follower worker connected ({len(self._followers)} total)")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get('type') == 'call':
+                    asyncio.create_task(self._serve_rpc(writer, message))
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+            logger.warning(f"Follower connection error: {e}")
+        finally:
+            self._followers.discard(writer)
+            writer.close()
+            logger.info(f"Follower worker disconnected ({len(self._followers)} left)")
+
+    async def _serve_rpc(self, writer: asyncio.StreamWriter, message: Dict[str, Any]):
+        reply: Dict[str, Any] = {'type': 'result', 'id': message.get('id')}
+        try:
+            reply['result'] = await self._dispatch(message.get('method', ''), message.get('params') or {})
+        except Exception as e:
+            self.rpc_errors += 1
+            reply['error'] = str(e) or type(e).__name__
+        if not writer.is_closing():
+            writer.write(encode(reply))
+
+    async def _dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        handler = self._rpc.get(method)
+        if handler is None:
+            raise WorkerBusError(f"Unknown bus method {method}")
+        self.rpc_calls += 1
+        return await handler(**params)
+
+    def publish(self, message: Dict[str, Any]):
+        """Send a message to all followers without waiting on them.
+        A follower that stops reading is dropped; it reconnects and gets a fresh hello."""
+        if not self._followers:
+            return
+        data = encode(message)
+        self.published += 1
+        for writer in list(self._followers):
+            if writer.transport.get_write_buffer_size() > FOLLOWER_BUFFER_LIMIT:
+                logger.warning("Follower worker too slow, dropping its bus connection")
+                self.followers_dropped += 1
+                self._followers.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+
+    # Follower
+
+    def follow(self, on_promote: Callable[[], Awaitable[None]]):
+        """Connect to the leader and keep following it. If the leader goes
+        away and this worker wins the lock, on_promote() turns it into the leader."""
+        self._on_promote = on_promote
+        self._client_task = asyncio.create_task(self._client_loop())
+
+    async def wait_for_leader(self, timeout: float = STARTUP_TIMEOUT) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _client_loop(self):
+        while not self._stopping:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=MAX_LINE)
+            except OSError:
+                if await self._try_promote():
+                    return
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            self._writer = writer
+            self.leader_connects += 1
+            try:
+                await self._read_leader(reader)
+            except (ConnectionError, ValueError, asyncio.LimitOverrunError) as e:
+                logger.warning(f"Leader connection error: {e}")
+            finally:
+                self._writer = None
+                self._ready.clear()
+                writer.close()
+                for future in self._pending.values():
+                    if not future.done():
+                        future.set_exception(WorkerBusError("Leader worker connection lost"))
+                self._pending.clear()
+
+            if self._stopping:
+                return
+            logger.warning("Lost connection to the leader worker")
+            await self._handle({'type': 'leader_lost'})
+            if await self._try_promote():
+                return
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _read_leader(self, reader: asyncio.StreamReader):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            if message.get('type') == 'result':
+                future = self._pending.pop(message.get('id'), None)
+                if future is not None and not future.done():
+                    if 'error' in message:
+                        future.set_exception(WorkerBusError(message['error']))
+                    else:
+                        future.set_result(message.get('result'))
+                continue
+            # Handled in order - the mirrored state depends on it
+            await self._handle(message)
+            if message.get('type') == 'hello':
+                self._ready.set()
+
+    async def _handle(self, message: Dict[str, Any]):
+        handler = self._handlers.get(message.get('type'))
+        if handler is None:
+            return
+        try:
+            await handler(message)
+        except Exception as e:
+            logger.error(f"Error handling bus message {message.get('type')}: {e}", exc_info=True)
+
+    async def _try_promote(self) -> bool:
+        if self._stopping or not self._try_lock():
+            return False
+        self.role = LEADER
+        self.promotions += 1
+        logger.warning(f"Worker {os.getpid()} took over as leader")
+        if self._on_promote:
+            await self._on_promote()
+        return True
+
+    # Both
+
+    async def call(self, method: str, /, **params) -> Any:
+        """Run an RPC method in the leader. In the leader itself it is a plain call."""
+        if self.role != FOLLOWER:
+            return await self._dispatch(method, params)
+        if self._writer is None:
+            raise WorkerBusError("Leader worker not reachable")
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        self._writer.write(encode({'type': 'call', 'id': call_id, 'method': method, 'params': params}))
+        try:
+            return await asyncio.wait_for(future, RPC_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rpc_errors += 1
+            raise WorkerBusError(f"Leader worker did not answer {method}")
+        finally:
+            self._pending.pop(call_id, None)
+
+    def call_threadsafe(self, method: str, /, **params) -> Any:
+        """call() from a sync endpoint running in the threadpool"""
+        if self._loop is None:
+            raise WorkerBusError("Worker bus not started")
+        future = asyncio.run_coroutine_threadsafe(self.call(method, **params), self._loop)
+        return future.result(RPC_TIMEOUT + 1)
+
+    async def close(self):
+        self._stopping = True
+        if self._client_task:
+            self._client_task.cancel()
+        if self._writer:
+            self._writer.close()
+        for writer in list(self._followers):
+            writer.close()
+        self._followers.clear()
+        if self._server:
+            self._server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'role': self.role,
+            'pid': os.getpid(),
+            'followers': len(self._followers),
+            'leader_connected': self._writer is not None,
+            'published': self.published,
+            'followers_dropped': self.followers_dropped,
+            'rpc_calls': self.rpc_calls,
+            'rpc_errors': self.rpc_errors,
+            'promotions': self.promotions,
+            'leader_connects': self.leader_connects,
+        }
+
+
+# Singleton instance
+worker_bus = WorkerBus()
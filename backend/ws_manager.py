@@ -0,0 +1,347 @@
+"""
+WebSocket connection manager
+Every client gets its own bounded send queue and writer task, so broadcast
+never waits on a socket and one slow browser cannot delay the others.
+Clients that fall behind are resynced with a fresh snapshot or evicted.
+Broadcasts are JSON-encoded once and bursts are coalesced into batch frames.
+Each client has a topic subscription; messages are filtered before encoding.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+
+from event_queue import BoundedEventQueue
+from call_state import call_topics
+
+logger = logging.getLogger(__name__)
+
+# Try to import orjson; if not installed, fall back to the stdlib encoder
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.info("orjson not installed — using stdlib json for WebSocket frames")
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# What to do with a client whose queue overflows: resync | disconnect
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "resync")
+# A send that takes longer than this means the client is stalled
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# Broadcasts within this window are sent as one batch frame (0 = send immediately)
+WS_COALESCE_MS = float(os.getenv("WS_COALESCE_MS", "50"))
+
+# Queue marker: replace the dropped backlog with a current snapshot
+RESYNC = object()
+
+# Event classes a client can subscribe to. sip_debug carries raw SIP text and
+# is only sent on request (events or sip_call_ids), never to non-admins.
+EVENT_CLASSES = ('calls', 'peers', 'trunks', 'channels', 'sip_debug')
+DEFAULT_EVENTS = frozenset(('calls', 'peers', 'trunks', 'channels'))
+
+
+class Subscription:
+    """What one client receives. Topics of a message are a dict with
+    'event' (class), 'extensions', 'trunks' and for SIP debug 'call_id'."""
+
+    def __init__(self, allowed_extensions: Optional[Set[str]] = None):
+        # None = admin, otherwise the only extensions this client may see
+        self.allowed_extensions = allowed_extensions
+        self.extensions: Set[str] = set()
+        self.trunks: Set[str] = set()
+        self.sip_call_ids: Set[str] = set()
+        self.events: Set[str] = set(DEFAULT_EVENTS)
+
+    @property
+    def restricted(self) -> bool:
+        return self.allowed_extensions is not None
+
+    def update(self, extensions: Iterable[str] = (), trunks: Iterable[str] = (),
+               sip_call_ids: Iterable[str] = (), events: Optional[Iterable[str]] = None):
+        """Replace the filters; empty extensions/trunks mean no entity filter"""
+        self.extensions = {str(e) for e in extensions}
+        self.trunks = {str(t) for t in trunks}
+        self.sip_call_ids = set() if self.restricted else {str(c) for c in sip_call_ids}
+        if events is not None:
+            self.events = {e for e in events if e in EVENT_CLASSES}
+        if self.restricted:
+            self.events.discard('sip_debug')
+
+    def matches(self, topics: Optional[Dict[str, Any]]) -> bool:
+        if not topics:
+            # Untagged messages are for unrestricted clients only
+            return not self.restricted
+        event = topics.get('event')
+
+        if event == 'sip_debug':
+            if self.restricted:
+                return False
+            if self.sip_call_ids:
+                return topics.get('call_id') in self.sip_call_ids
+            return 'sip_debug' in self.events
+
+        if event not in self.events:
+            return False
+        extensions = topics.get('extensions') or ()
+        if self.restricted and not self.allowed_extensions.intersection(extensions):
+            return False
+        if self.extensions or self.trunks:
+            return bool(self.extensions.intersection(extensions) or self.trunks.intersection(topics.get('trunks') or ()))
+        return True
+
+    def filter_calls(self, message: Optional[dict]) -> Optional[dict]:
+        """Reduce a snapshot or call_delta message to the calls this client may see"""
+        if message is None:
+            return None
+        if 'active_calls' in message:
+            calls = [c for c in message['active_calls'] if self.matches(call_topics(c))]
+            return {**message, 'active_calls': calls}
+        if 'deltas' in message:
+            deltas = [d for d in message['deltas'] if self.matches(call_topics(d['call']))]
+            return {**message, 'deltas': deltas}
+        return message
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'extensions': sorted(self.extensions),
+            'trunks': sorted(self.trunks),
+            'sip_call_ids': sorted(self.sip_call_ids),
+            'events': sorted(self.events),
+            'restricted_to': sorted(self.allowed_extensions) if self.restricted else None,
+        }
+
+
+def encode(message: Any) -> str:
+    """Serialize a message to a JSON text frame"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(message, default=str).decode()
+    return json.dumps(message, default=str, separators=(",", ":"))
+
+
+def batch_frame(fragments: List[str]) -> str:
+    """Join already encoded messages into one batch frame without re-encoding them"""
+    return '{"type":"batch","messages":[' + ",".join(fragments) + "]}"
+
+
+class ClientConnection:
+    _ids = itertools.count(1)
+
+    def __init__(self, manager: "ConnectionManager", websocket: WebSocket, subscription: Subscription):
+        self.id = next(self._ids)
+        self.manager = manager
+        self.websocket = websocket
+        self.subscription = subscription
+        self.address = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "unknown"
+        self.queue = BoundedEventQueue(f"ws-{self.id}", WS_SEND_QUEUE_SIZE, "drop_newest")
+        self.task: Optional[asyncio.Task] = None
+        self.connected_at = datetime.utcnow()
+        self.closed = False
+
+        # Counters
+        self.sent = 0
+        self.resyncs = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer(), name=f"ws-writer-{self.id}")
+
+    def enqueue(self, message: Any) -> bool:
+        """Queue a message (dict) for this client only"""
+        return self.enqueue_frame(encode(message))
+
+    def enqueue_calls(self, message: Optional[dict]) -> bool:
+        """Queue a snapshot or call_delta message, filtered by the subscription"""
+        message = self.subscription.filter_calls(message)
+        return self.enqueue(message) if message is not None else False
+
+    def enqueue_frame(self, frame: Any) -> bool:
+        """Queue an encoded frame without waiting. Returns False if the client fell behind."""
+        if self.closed:
+            return False
+        if self.queue.put_nowait((time.monotonic(), frame)):
+            return True
+
+        # Queue full, the message was dropped
+        if WS_SLOW_CLIENT_POLICY == "disconnect":
+            logger.warning(f"WebSocket client {self.address} too slow, disconnecting")
+            self.manager.evict(self)
+            return False
+
+        # Drop the backlog, the client gets the current state instead
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait((time.monotonic(), RESYNC))
+        self.resyncs += 1
+        self.manager.resyncs += 1
+        logger.warning(f"WebSocket client {self.address} too slow, resyncing ({self.resyncs}x)")
+        return False
+
+    async def _writer(self):
+        try:
+            while True:
+                enqueued_at, frame = await self.queue.get()
+                if frame is RESYNC:
+                    snapshot = self.subscription.filter_calls(self.manager.snapshot())
+                    if snapshot is None:
+                        continue
+                    frame = encode(snapshot)
+                await asyncio.wait_for(self.websocket.send_text(frame), timeout=WS_SEND_TIMEOUT)
+                self.sent += 1
+                self.last_lag_ms = (time.monotonic() - enqueued_at) * 1000
+                if self.last_lag_ms > self.max_lag_ms:
+                    self.max_lag_ms = self.last_lag_ms
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket send to {self.address} timed out, disconnecting")
+            self.manager.evict(self)
+        except Exception as e:
+            logger.error(f"Error sending to WebSocket client {self.address}: {e}")
+            self.manager.evict(self)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "address": self.address,
+            "subscription": self.subscription.to_dict(),
+            "connected_at": self.connected_at.isoformat(),
+            "depth": self.queue.qsize(),
+            "high_watermark": self.queue.high_watermark,
+            "sent": self.sent,
+            "dropped": self.queue.dropped,
+            "resyncs": self.resyncs,
+            "last_lag_ms": round(self.last_lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.snapshot_provider: Optional[Callable[[], Optional[dict]]] = None
+        # Encoded broadcasts and their recipients, waiting for the end of the coalescing window
+        self._pending: List[tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        # Counters
+        self.broadcasts = 0
+        self.frames = 0
+        self.batched = 0
+        self.filtered = 0
+        self.resyncs = 0
+        self.evictions = 0
+
+    def set_snapshot_provider(self, provider: Callable[[], Optional[dict]]):
+        """Message that brings a resynced client back to the current state"""
+        self.snapshot_provider = provider
+
+    def snapshot(self) -> Optional[dict]:
+        return self.snapshot_provider() if self.snapshot_provider else None
+
+    async def connect(self, websocket: WebSocket, allowed_extensions: Optional[Set[str]] = None) -> ClientConnection:
+        """Accept a client. allowed_extensions restricts a non-admin to its own extensions."""
+        await websocket.accept()
+        client = ClientConnection(self, websocket, Subscription(allowed_extensions))
+        self.active_connections[websocket] = client
+        client.start()
+        logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.active_connections.pop(websocket, None)
+        if client:
+            client.closed = True
+            if client.task and client.task is not asyncio.current_task():
+                client.task.cancel()
+        logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+
+    def evict(self, client: ClientConnection):
+        """Drop a slow or broken client; its receive loop ends when the socket closes"""
+        if client.closed:
+            return
+        self.evictions += 1
+        self.disconnect(client.websocket)
+        asyncio.ensure_future(self._close(client.websocket))
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            # 1008 policy violation - the client may reconnect and start fresh
+            await asyncio.wait_for(websocket.close(code=1008), timeout=WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def resync_all(self):
+        """Send every client a fresh snapshot, e.g. after the call state source changed"""
+        for client in list(self.active_connections.values()):
+            client.enqueue_frame(RESYNC)
+
+    async def broadcast(self, message: dict, topics: Optional[Dict[str, Any]] = None):
+        """Queue a message for all subscribed clients without waiting on any socket.
+        Recipients are selected first; the message is encoded once and only if
+        someone wants it. Within WS_COALESCE_MS messages are batched."""
+        self.broadcasts += 1
+        recipients = [c for c in self.active_connections.values() if c.subscription.matches(topics)]
+        if not recipients:
+            self.filtered += 1
+            return
+        self._pending.append((encode(message), recipients))
+        if WS_COALESCE_MS <= 0:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(WS_COALESCE_MS / 1000, self.flush)
+
+    def flush(self):
+        """Send the coalesced broadcasts as one frame per client.
+        Clients that receive the same set of messages share the frame."""
+        self._flush_handle = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+
+        per_client: Dict[ClientConnection, List[int]] = {}
+        for index, (_, recipients) in enumerate(pending):
+            for client in recipients:
+                per_client.setdefault(client, []).append(index)
+
+        frames: Dict[tuple, str] = {}
+        for client, indexes in per_client.items():
+            key = tuple(indexes)
+            frame = frames.get(key)
+            if frame is None:
+                if len(key) == 1:
+                    frame = pending[key[0]][0]
+                else:
+                    frame = batch_frame([pending[i][0] for i in key])
+                    self.batched += len(key)
+                frames[key] = frame
+                self.frames += 1
+            client.enqueue_frame(frame)
+
+    def stats(self) -> Dict[str, Any]:
+        clients: List[Dict[str, Any]] = [c.stats() for c in self.active_connections.values()]
+        return {
+            "connections": len(clients),
+            "broadcasts": self.broadcasts,
+            "frames": self.frames,
+            "batched_messages": self.batched,
+            "filtered_broadcasts": self.filtered,
+            "coalesce_ms": WS_COALESCE_MS,
+            "encoder": "orjson" if ORJSON_AVAILABLE else "json",
+            "resyncs": self.resyncs,
+            "evictions": self.evictions,
+            "slow_client_policy": WS_SLOW_CLIENT_POLICY,
+            "clients": clients,
+        }
+
+
+# Singleton instance
+ws_manager = ConnectionManager()
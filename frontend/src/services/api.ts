@@ -342,7 +342,8 @@ class ApiService {
   }
 
   async getCdrStats() {
-    return this.request<any>('/api/cdr/stats')
+    // Totals without a date range, the rollups are exact enough and do not scan the cdr table
+    return this.request<any>('/api/cdr/stats?source=rollup')
   }
 
   // Voicemail Mailbox Config